@@ -1,111 +1,504 @@
-import google.generativeai as genai
 import numpy as np
-import librosa
-import matplotlib.pyplot as plt
-import io
-import base64
-from typing import Dict, List, Tuple, Optional
+import re
+import time
+import asyncio
+from typing import Any, Callable, Dict, List, Tuple, Optional, Sequence, Union
 from datetime import datetime
+from functools import lru_cache
 import json
 
-from config import GOOGLE_API_KEY, GEMINI_PCG_ANALYSIS_PROMPT, VALVE_SITES, VALVE_DISEASES
+from config import (GOOGLE_API_KEY, GEMINI_MODEL_NAME, GEMINI_PCG_ANALYSIS_PROMPT, VALVE_SITES, VALVE_DISEASES,
+                    SPECTROGRAM_PROFILES, SPECTROGRAM_PROFILE, ANALYSIS_CACHE_ENABLED, GEMINI_STRUCTURED_OUTPUT,
+                    GEMINI_INCLUDE_REPORT, GEMINI_MAX_OUTPUT_TOKENS, GEMINI_TEMPERATURE, ANALYSIS_MODE,
+                    TRIAGE_NORMAL_THRESHOLD, PREPROCESSING, QUALITY_GATE)
+from analysis_cache import AnalysisCache
+from audio_io import to_float32
+from gemini_client import AsyncGeminiClient, CircuitBreaker, CircuitOpenError
+from metrics import metrics
+from quality_gate import assess_quality
+from signal_processing import (SpectralContext, compute_pcg_features, compute_pcg_features_padded,
+                               decimate_to_analysis_rate, preprocess_pcg)
+from spectrogram_renderer import SpectrogramRenderer
+from triage_classifier import load_triage_classifier
+from structured_output import (StructuredResponseError, diagnosis_response_schema, parse_partial_diagnosis,
+                               parse_structured_diagnosis, structured_output_instructions)
 
 class GeminiPCGAnalyzer:
-    def __init__(self):
-        if GOOGLE_API_KEY:
+    def __init__(self,
+                 model: Optional[Any] = None,
+                 spectrogram_profile: str = SPECTROGRAM_PROFILE,
+                 structured_output: bool = GEMINI_STRUCTURED_OUTPUT,
+                 include_report: bool = GEMINI_INCLUDE_REPORT,
+                 analysis_mode: str = ANALYSIS_MODE,
+                 triage_classifier: Optional[Any] = None,
+                 worker_pool: Optional[Any] = None,
+                 cpu_only: bool = False):
+        """cpu_only builds an analyzer for the CPU stages alone (worker processes,
+        warmup): no Gemini model or client and no result cache."""
+        if spectrogram_profile not in SPECTROGRAM_PROFILES:
+            raise ValueError(f"Unknown spectrogram profile '{spectrogram_profile}', "
+                             f"expected one of {sorted(SPECTROGRAM_PROFILES)}")
+        self.spectrogram_profile = spectrogram_profile
+        self.spectrogram_renderer = SpectrogramRenderer(**SPECTROGRAM_PROFILES[spectrogram_profile])
+        self.structured_output = structured_output
+        self.include_report = include_report
+        if analysis_mode not in ('gemini', 'triage'):
+            raise ValueError(f"Unknown analysis mode '{analysis_mode}', expected 'gemini' or 'triage'")
+        self.analysis_mode = analysis_mode
+        if analysis_mode == 'triage':
+            self.triage_classifier = triage_classifier or load_triage_classifier()
+        else:
+            self.triage_classifier = None
+        self.cache = AnalysisCache() if ANALYSIS_CACHE_ENABLED and not cpu_only else None
+        # Optional worker_pool.AnalysisWorkerPool that runs the CPU stages in other processes
+        self.worker_pool = worker_pool
+        
+        if cpu_only:
+            self.model = None
+        elif model is not None:
+            # Injected model, e.g. gemini_client.FakeGenerativeModel
+            self.model = model
+        elif GOOGLE_API_KEY:
+            import google.generativeai as genai  # slow to import; not needed for injected or simulated models
             genai.configure(api_key=GOOGLE_API_KEY)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+            self.model = genai.GenerativeModel(GEMINI_MODEL_NAME)
         else:
             self.model = None
             print("Warning: Google API key not found. AI analysis will be simulated.")
+        
+        self.client = AsyncGeminiClient(self.model) if self.model else None
     
-    def extract_pcg_features(self, audio_data: np.ndarray, sample_rate: int) -> Dict:
+    def extract_pcg_features(self,
+                             audio_data: np.ndarray,
+                             sample_rate: int,
+                             context: Optional[SpectralContext] = None) -> Dict:
         """Extract relevant features from PCG signal for AI analysis"""
         
-        # Basic signal statistics
-        duration = len(audio_data) / sample_rate
-        rms_energy = np.sqrt(np.mean(audio_data**2))
-        zero_crossing_rate = np.mean(librosa.feature.zero_crossing_rate(audio_data))
-        
-        # Spectral features
-        stft = librosa.stft(audio_data)
-        spectral_centroids = librosa.feature.spectral_centroid(S=np.abs(stft))[0]
-        spectral_rolloff = librosa.feature.spectral_rolloff(S=np.abs(stft))[0]
-        
-        # Heart rate estimation (rough approximation)
-        # Find dominant frequency in the low frequency range (30-200 Hz)
-        freqs = np.fft.fftfreq(len(audio_data), 1/sample_rate)
-        fft = np.abs(np.fft.fft(audio_data))
-        
-        # Focus on heart sound frequency range
-        heart_freq_mask = (freqs >= 30) & (freqs <= 200)
-        if np.any(heart_freq_mask):
-            dominant_freq = freqs[heart_freq_mask][np.argmax(fft[heart_freq_mask])]
-            estimated_heart_rate = dominant_freq * 60  # Convert to BPM
-        else:
-            estimated_heart_rate = 70  # Default
+        if context is None:
+            audio_data = to_float32(audio_data)
+            context = SpectralContext(audio_data, sample_rate)
         
-        # Frequency domain analysis
-        low_freq_energy = np.sum(fft[(freqs >= 20) & (freqs <= 100)])
-        mid_freq_energy = np.sum(fft[(freqs >= 100) & (freqs <= 300)])
-        high_freq_energy = np.sum(fft[(freqs >= 300) & (freqs <= 1000)])
+        features = {'duration': len(audio_data) / sample_rate}
+        features.update({name: float(value) for name, value in compute_pcg_features(context).items()})
+        features['raw_rms'] = features['rms_energy']  # _prepare_analysis_inputs replaces it when preprocessing
+        features['sample_rate'] = sample_rate
+        features['signal_length'] = len(audio_data)
         
-        return {
-            'duration': duration,
-            'rms_energy': float(rms_energy),
-            'zero_crossing_rate': float(np.mean(zero_crossing_rate)),
-            'spectral_centroid_mean': float(np.mean(spectral_centroids)),
-            'spectral_rolloff_mean': float(np.mean(spectral_rolloff)),
-            'estimated_heart_rate': float(estimated_heart_rate),
-            'low_freq_energy': float(low_freq_energy),
-            'mid_freq_energy': float(mid_freq_energy),
-            'high_freq_energy': float(high_freq_energy),
-            'sample_rate': sample_rate,
-            'signal_length': len(audio_data)
+        return features
+    
+    def extract_pcg_features_batch(self,
+                                   signals: Union[np.ndarray, Sequence[np.ndarray]],
+                                   sample_rate: int,
+                                   lengths: Optional[Sequence[int]] = None,
+                                   chunk_size: int = 16) -> Dict[str, np.ndarray]:
+        """Extract features for many recordings at once.
+        
+        signals is either a zero-padded 2-D array (one recording per row, with
+        the true sizes in lengths) or a list of 1-D arrays, of any lengths.
+        Recordings are sorted by length and processed chunk_size at a time as
+        a zero-padded matrix with a length mask (compute_pcg_features_padded),
+        so the values match extract_pcg_features row for row. Like
+        extract_pcg_features, this skips decimation and preprocessing: pass
+        signals that are already at the analysis rate (and band-passed) to
+        match analyze_pcg_signal. Returns one array per feature (columnar), in
+        input order.
+        """
+        
+        if isinstance(signals, np.ndarray) and signals.ndim == 2:
+            if lengths is None:
+                lengths = np.full(signals.shape[0], signals.shape[1])
+            rows = [to_float32(signals[i, :n]) for i, n in enumerate(lengths)]
+        else:
+            rows = [to_float32(signal) for signal in signals]
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        
+        columns = {
+            'duration': lengths / sample_rate,
+            'sample_rate': np.full(len(rows), sample_rate, dtype=np.int64),
+            'signal_length': lengths
         }
+        
+        # Similar lengths share a chunk, so little of each padded matrix is zeros
+        order = np.argsort(lengths, kind='stable')
+        for start in range(0, len(rows), chunk_size):
+            indices = order[start:start + chunk_size]
+            padded = np.zeros((len(indices), lengths[indices].max()), dtype=np.float32)
+            for row, i in enumerate(indices):
+                padded[row, :lengths[i]] = rows[i]
+            for name, values in compute_pcg_features_padded(padded, lengths[indices], sample_rate).items():
+                if name not in columns:
+                    columns[name] = np.empty(len(rows), dtype=np.float64)
+                columns[name][indices] = values
+        columns['raw_rms'] = columns['rms_energy']
+        
+        return columns
     
-    def create_spectrogram_image(self, audio_data: np.ndarray, sample_rate: int) -> str:
+    def create_spectrogram_image(self,
+                                 audio_data: np.ndarray,
+                                 sample_rate: int,
+                                 context: Optional[SpectralContext] = None) -> str:
         """Create spectrogram image for AI analysis"""
         
-        plt.figure(figsize=(12, 8))
+        if context is None:
+            audio_data = to_float32(audio_data)
+            context = SpectralContext(audio_data, sample_rate)
         
-        # Create spectrogram
-        D = librosa.amplitude_to_db(np.abs(librosa.stft(audio_data)), ref=np.max)
-        librosa.display.specshow(D, sr=sample_rate, x_axis='time', y_axis='hz')
-        plt.colorbar(format='%+2.0f dB')
-        plt.title('PCG Spectrogram')
-        plt.xlabel('Time (s)')
-        plt.ylabel('Frequency (Hz)')
-        
-        # Save to bytes
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
-        
-        # Encode to base64
-        image_base64 = base64.b64encode(buf.getvalue()).decode()
-        buf.close()
-        
-        return image_base64
+        spectrogram_b64 = self.spectrogram_renderer.render_base64(
+            context.spectrogram_db(), sample_rate, context.hop_length
+        )
+        metrics.observe(f'spectrogram.payload_bytes.{self.spectrogram_profile}', len(spectrogram_b64) * 3 // 4)
+        return spectrogram_b64
     
     def analyze_pcg_signal(self, 
                           audio_data: np.ndarray, 
                           sample_rate: int,
                           valve_site: str,
-                          patient_info: Dict) -> Dict:
-        """Perform complete PCG analysis using Gemini AI"""
+                          patient_info: Dict,
+                          quality: Optional[Dict] = None) -> Dict:
+        """Perform complete PCG analysis using Gemini AI.
+        
+        quality is an assess_quality report the caller already computed for
+        this recording (e.g. to warn the user); otherwise the gate runs here.
+        Callers that decimate before analysis should gate the raw samples and
+        pass that report, since resampling smooths away clipping.
+        """
+        
+        # One float32 conversion at the boundary; every later stage reuses the array
+        audio_data = to_float32(audio_data)
+        
+        # Unusable recordings are turned away before any costly stage
+        quality, rejection = self._quality_gate(audio_data, sample_rate, valve_site, quality)
+        if rejection is not None:
+            return rejection
+        
+        # Identical recordings and patient context reuse the previous result
+        cache_key, cached = self._cache_lookup(audio_data, sample_rate, valve_site, patient_info)
+        if cached is not None:
+            return cached
+        
+        started = time.monotonic()
+        features, spectrogram_b64 = self._prepare_inputs(audio_data, sample_rate)
+        
+        diagnosis = self._local_diagnosis(features, spectrogram_b64, valve_site, patient_info)
+        if diagnosis is None:
+            diagnosis = self._analyze_with_gemini(features, spectrogram_b64, valve_site, patient_info)
+        
+        self._record_analysis(diagnosis, features, started, quality)
+        self._cache_store(cache_key, diagnosis)
+        return diagnosis
+    
+    async def analyze_pcg_signal_async(self,
+                                       audio_data: np.ndarray,
+                                       sample_rate: int,
+                                       valve_site: str,
+                                       patient_info: Dict,
+                                       quality: Optional[Dict] = None) -> Dict:
+        """Asyncio variant of analyze_pcg_signal.
+        
+        CPU stages run in a worker thread and the Gemini call goes through the
+        shared AsyncGeminiClient, so an event loop can keep many analyses in
+        flight without blocking.
+        """
+        
+        audio_data = to_float32(audio_data)
+        quality, rejection = self._quality_gate(audio_data, sample_rate, valve_site, quality)
+        if rejection is not None:
+            return rejection
+        
+        cache_key, cached = self._cache_lookup(audio_data, sample_rate, valve_site, patient_info)
+        if cached is not None:
+            return cached
+        
+        started = time.monotonic()
+        features, spectrogram_b64 = await self._prepare_inputs_async(audio_data, sample_rate)
+        
+        diagnosis = self._local_diagnosis(features, spectrogram_b64, valve_site, patient_info)
+        if diagnosis is None:
+            diagnosis = await self._analyze_with_gemini_async(features, spectrogram_b64, valve_site, patient_info)
+        
+        self._record_analysis(diagnosis, features, started, quality)
+        self._cache_store(cache_key, diagnosis)
+        return diagnosis
+    
+    def analyze_pcg_signal_streaming(self,
+                                     audio_data: np.ndarray,
+                                     sample_rate: int,
+                                     valve_site: str,
+                                     patient_info: Dict,
+                                     on_update: Callable[[Dict], None],
+                                     quality: Optional[Dict] = None) -> Dict:
+        """analyze_pcg_signal with the Gemini reply streamed as it is generated.
+        
+        on_update is called after every chunk with the fields parsed so far
+        (structured mode) plus the accumulated text under 'partial_text'.
+        Time to the first parsed field and total latency are logged and
+        recorded in metrics and on the returned diagnosis.
+        """
+        
+        audio_data = to_float32(audio_data)
+        quality, rejection = self._quality_gate(audio_data, sample_rate, valve_site, quality)
+        if rejection is not None:
+            on_update(rejection)
+            return rejection
+        
+        cache_key, cached = self._cache_lookup(audio_data, sample_rate, valve_site, patient_info)
+        if cached is not None:
+            on_update(cached)
+            return cached
+        
+        started = time.monotonic()
+        features, spectrogram_b64 = self._prepare_inputs(audio_data, sample_rate)
+        
+        diagnosis = self._local_diagnosis(features, spectrogram_b64, valve_site, patient_info)
+        if diagnosis is not None:
+            self._record_analysis(diagnosis, features, started, quality)
+            self._cache_store(cache_key, diagnosis)
+            on_update(diagnosis)
+            return diagnosis
+        
+        first_result = None
+        chunks = []
+        try:
+            self._check_circuit()
+            for chunk in self.client.stream(
+                self._build_gemini_contents(features, spectrogram_b64, valve_site, patient_info),
+                generation_config=self._generation_config()
+            ):
+                chunks.append(chunk)
+                partial_text = ''.join(chunks)
+                partial = parse_partial_diagnosis(partial_text) if self.structured_output else {}
+                if first_result is None and (partial or not self.structured_output):
+                    first_result = time.monotonic() - started
+                partial['partial_text'] = partial_text
+                on_update(partial)
+            diagnosis = self._diagnosis_from_response(''.join(chunks), valve_site)
+        except Exception as e:
+            diagnosis = self._fallback_analysis(e, features, valve_site, patient_info)
+        
+        total = time.monotonic() - started
+        self._record_analysis(diagnosis, features, started, quality)
+        if first_result is not None:
+            metrics.observe('analysis.time_to_first_result_s', first_result)
+            diagnosis['time_to_first_result_s'] = round(first_result, 3)
+        diagnosis['analysis_latency_s'] = round(total, 3)
+        
+        self._cache_store(cache_key, diagnosis)
+        return diagnosis
+    
+    def analyze_all_sites(self,
+                          recordings: Dict[str, Tuple[np.ndarray, int]],
+                          patient_info: Dict,
+                          qualities: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """Analyze a full exam, e.g. {'AV': (audio, sr), 'PV': ..., 'TV': ..., 'MV': ...}.
+        
+        Blocking wrapper around analyze_all_sites_async; returns one diagnosis
+        per valve site in the order given.
+        """
+        return asyncio.run(self.analyze_all_sites_async(recordings, patient_info, qualities))
+    
+    async def analyze_all_sites_async(self,
+                                      recordings: Dict[str, Tuple[np.ndarray, int]],
+                                      patient_info: Dict,
+                                      qualities: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """Run every valve site concurrently.
+        
+        Feature extraction and rendering for each site run in worker threads
+        and the Gemini calls are dispatched together through the shared
+        client, so a four-site exam takes about as long as its slowest site.
+        qualities holds assess_quality reports per site computed by the
+        caller, e.g. on the recordings before decimation.
+        """
+        qualities = qualities or {}
+        
+        started = time.monotonic()
+        sites = list(recordings)
+        diagnoses = await asyncio.gather(*[
+            self.analyze_pcg_signal_async(audio_data, sample_rate, valve_site, patient_info, qualities.get(valve_site))
+            for valve_site, (audio_data, sample_rate) in recordings.items()
+        ])
+        metrics.observe('analysis.exam_latency_s', time.monotonic() - started)
+        
+        return dict(zip(sites, diagnoses))
+    
+    def prepare_analysis(self, audio_data: np.ndarray, sample_rate: int, valve_site: str) -> Dict:
+        """CPU half of an analysis, for running in another process (see batch_cli).
+        
+        Returns a picklable dict with the quality report and either the
+        rejection result or the features and spectrogram that
+        diagnose_prepared_async needs; no cache or network access.
+        """
+        started = time.monotonic()
+        audio_data = to_float32(audio_data)
+        quality, rejection = self._quality_gate(audio_data, sample_rate, valve_site)
+        prepared = {'quality': quality, 'rejection': rejection, 'features': None, 'spectrogram_b64': None}
+        if rejection is None:
+            prepared['features'], prepared['spectrogram_b64'] = self._prepare_analysis_inputs(audio_data, sample_rate)
+        prepared['prepare_latency_s'] = time.monotonic() - started
+        return prepared
+    
+    async def diagnose_prepared_async(self, prepared: Dict, valve_site: str, patient_info: Dict) -> Dict:
+        """Remote half of an analysis: the diagnosis for a prepare_analysis result"""
+        if prepared['rejection'] is not None:
+            return prepared['rejection']
+        
+        # Latency covers both halves, as in analyze_pcg_signal_async
+        started = time.monotonic() - prepared['prepare_latency_s']
+        features, spectrogram_b64 = prepared['features'], prepared['spectrogram_b64']
+        diagnosis = self._local_diagnosis(features, spectrogram_b64, valve_site, patient_info)
+        if diagnosis is None:
+            diagnosis = await self._analyze_with_gemini_async(features, spectrogram_b64, valve_site, patient_info)
+        
+        self._record_analysis(diagnosis, features, started, prepared['quality'])
+        return diagnosis
+        
+    def _prepare_inputs(self, audio_data: np.ndarray, sample_rate: int) -> Tuple[Dict, Optional[str]]:
+        """_prepare_analysis_inputs, on the worker pool when one is attached"""
+        if self.worker_pool is not None:
+            return self.worker_pool.prepare_inputs(audio_data, sample_rate)
+        return self._prepare_analysis_inputs(audio_data, sample_rate)
+    
+    async def _prepare_inputs_async(self, audio_data: np.ndarray, sample_rate: int) -> Tuple[Dict, Optional[str]]:
+        """_prepare_inputs without blocking the event loop (worker process or thread)"""
+        if self.worker_pool is not None:
+            return await asyncio.wrap_future(self.worker_pool.submit_inputs(audio_data, sample_rate))
+        return await asyncio.to_thread(self._prepare_analysis_inputs, audio_data, sample_rate)
+    
+    def _prepare_analysis_inputs(self, audio_data: np.ndarray, sample_rate: int) -> Tuple[Dict, Optional[str]]:
+        """CPU stages: decimation, preprocessing, features, triage score and spectrogram from one spectral context.
+        
+        The spectrogram is None when the triage classifier answers locally.
+        """
+        
+        # No-op when the caller already decimated on load
+        decimated, sample_rate = decimate_to_analysis_rate(audio_data, sample_rate)
+        
+        # Recording amplitude, before peak normalization rescales it to 1
+        raw_rms = float(np.sqrt(np.mean(np.square(decimated, dtype=np.float64))))
+        
+        # Band-pass and clean up; the caller's array is never modified
+        if PREPROCESSING['enabled']:
+            decimated = preprocess_pcg(decimated, sample_rate, inplace=decimated is not audio_data)
+        audio_data = decimated
+        
+        # STFT and FFT are computed once and shared by both stages
+        context = SpectralContext(audio_data, sample_rate)
         
         # Extract features
-        features = self.extract_pcg_features(audio_data, sample_rate)
+        features = self.extract_pcg_features(audio_data, sample_rate, context=context)
+        features['raw_rms'] = raw_rms
+        
+        # Local screen: confidently normal recordings never need the image
+        if self.triage_classifier:
+            features['abnormality_probability'] = self.triage_classifier.predict_context(context, features)
+            if features['abnormality_probability'] < TRIAGE_NORMAL_THRESHOLD:
+                return features, None
         
         # Create spectrogram
-        spectrogram_b64 = self.create_spectrogram_image(audio_data, sample_rate)
+        spectrogram_b64 = self.create_spectrogram_image(audio_data, sample_rate, context=context)
         
+        return features, spectrogram_b64
+    
+    def _local_diagnosis(self,
+                         features: Dict,
+                         spectrogram_b64: Optional[str],
+                         valve_site: str,
+                         patient_info: Dict) -> Optional[Dict]:
+        """Result that needs no Gemini call (triage normal or no model), else None"""
+        if self.triage_classifier:
+            if spectrogram_b64 is None:
+                metrics.increment('triage.local')
+                return self._triage_diagnosis(features, valve_site)
+            metrics.increment('triage.escalated')
+        if not self.model:
+            return self._simulate_analysis(features, valve_site, patient_info)
+        return None
+    
+    def _triage_diagnosis(self, features: Dict, valve_site: str) -> Dict:
+        """Normal result from the local classifier"""
+        probability = features['abnormality_probability']
+        return {
+            'valve_site': valve_site,
+            'valve_name': VALVE_SITES.get(valve_site, valve_site),
+            'primary_diagnosis': 'Normal',
+            'confidence_level': int(round((1 - probability) * 100)),
+            'severity': 'None',
+            'findings': [
+                f"Automated screening: abnormality probability {probability:.0%}",
+                f"Heart rate: {features['estimated_heart_rate']:.1f} BPM"
+            ],
+            'recommendations': [
+                "No abnormality flagged by local screening",
+                "Clinical correlation recommended"
+            ],
+            'follow_up': 'Routine follow-up in 1 year',
+            'analysis_timestamp': datetime.now().isoformat(),
+            'analysis_mode': 'triage'
+        }
+    
+    def _quality_gate(self,
+                      audio_data: np.ndarray,
+                      sample_rate: int,
+                      valve_site: str,
+                      quality: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """(quality report, or None when the gate is off; re-record result when the recording is rejected)"""
+        if not QUALITY_GATE['enabled']:
+            return None, None
+        if quality is None:
+            quality = assess_quality(audio_data, sample_rate)
+        if quality['decision'] != 'reject':
+            return quality, None
+        return quality, {
+            'valve_site': valve_site,
+            'valve_name': VALVE_SITES.get(valve_site, valve_site),
+            'primary_diagnosis': 'Inconclusive',
+            'confidence_level': 0,
+            'severity': 'None',
+            'findings': [f"Recording rejected by signal-quality check (score {quality['score']:.2f})"]
+                        + quality['reasons'],
+            'recommendations': [
+                "Re-record this site before diagnosis",
+                "Ensure firm stethoscope contact in a quiet room"
+            ],
+            'follow_up': 'Repeat the recording',
+            'analysis_timestamp': datetime.now().isoformat(),
+            'analysis_mode': 'quality_gate',
+            'signal_quality': quality
+        }
+    
+    def _record_analysis(self, diagnosis: Dict, features: Dict, started: float, quality: Optional[Dict] = None):
+        """Tag the result with its payload profile, triage score and signal quality, and record end-to-end latency"""
+        diagnosis['spectrogram_profile'] = self.spectrogram_profile
+        if quality is not None:
+            diagnosis['signal_quality'] = quality
+            if quality['decision'] == 'flag':
+                diagnosis.setdefault('findings', []).extend(f"Signal quality: {reason}" for reason in quality['reasons'])
+        if 'abnormality_probability' in features:
+            diagnosis['abnormality_probability'] = round(features['abnormality_probability'], 4)
+        metrics.observe(f'analysis.latency_s.{self.spectrogram_profile}', time.monotonic() - started)
+    
+    def _cache_lookup(self,
+                      audio_data: np.ndarray,
+                      sample_rate: int,
+                      valve_site: str,
+                      patient_info: Dict) -> Tuple[Optional[str], Optional[Dict]]:
+        """Return (cache key, cached diagnosis or None)"""
+        if not self.cache:
+            return None, None
+        # The image shapes Gemini's answer, so each payload profile caches separately
         if self.model:
-            return self._analyze_with_gemini(features, spectrogram_b64, valve_site, patient_info)
+            output_mode = ('json+report' if self.include_report else 'json') if self.structured_output else 'text'
+            model_name = f"{GEMINI_MODEL_NAME}:{self.spectrogram_profile}:{output_mode}"
         else:
-            return self._simulate_analysis(features, valve_site, patient_info)
+            model_name = 'simulation'
+        if self.triage_classifier:
+            model_name += f":triage<{TRIAGE_NORMAL_THRESHOLD}"
+        cache_key = self.cache.make_key(audio_data, sample_rate, valve_site, patient_info, model_name)
+        return cache_key, self.cache.get(cache_key)
+    
+    def _cache_store(self, cache_key: Optional[str], diagnosis: Dict):
+        """Cache a fresh result; a simulated one while Gemini is configured means the call failed"""
+        if cache_key and not (self.model and diagnosis.get('simulation_mode')):
+            self.cache.put(cache_key, diagnosis)
     
     def _analyze_with_gemini(self, 
                            features: Dict, 
@@ -115,57 +508,128 @@ class GeminiPCGAnalyzer:
         """Analyze PCG using Gemini AI"""
         
         try:
-            # Prepare the prompt
-            prompt = GEMINI_PCG_ANALYSIS_PROMPT.format(
-                valve_site=VALVE_SITES.get(valve_site, valve_site),
-                age=patient_info.get('age', 'Unknown'),
-                gender=patient_info.get('gender', 'Unknown'),
-                bmi=patient_info.get('bmi', 'Unknown'),
-                clinical_notes=patient_info.get('clinical_notes', 'None provided')
+            self._check_circuit()
+            # Send to Gemini (bounded, rate limited, retried)
+            response = self.client.generate(
+                self._build_gemini_contents(features, spectrogram_b64, valve_site, patient_info),
+                generation_config=self._generation_config()
             )
+            return self._diagnosis_from_response(response.text, valve_site)
             
-            # Add technical data
-            technical_data = f"""
-            
-            Technical PCG Signal Analysis Data:
-            
-            Signal Duration: {features['duration']:.2f} seconds
-            Estimated Heart Rate: {features['estimated_heart_rate']:.1f} BPM
-            RMS Energy: {features['rms_energy']:.6f}
-            Spectral Centroid: {features['spectral_centroid_mean']:.2f} Hz
-            Zero Crossing Rate: {features['zero_crossing_rate']:.6f}
-            
-            Frequency Domain Analysis:
-            - Low Frequency Energy (20-100 Hz): {features['low_freq_energy']:.2e}
-            - Mid Frequency Energy (100-300 Hz): {features['mid_freq_energy']:.2e}  
-            - High Frequency Energy (300-1000 Hz): {features['high_freq_energy']:.2e}
-            
-            Valve Site: {valve_site} ({VALVE_SITES.get(valve_site, valve_site)})
-            
-            Please analyze this PCG signal and provide your expert diagnosis.
-            """
-            
-            full_prompt = prompt + technical_data
-            
-            # Send to Gemini
-            response = self.model.generate_content([
-                full_prompt,
-                {
-                    "mime_type": "image/png",
-                    "data": spectrogram_b64
-                }
-            ])
-            
-            # Parse response
-            diagnosis = self._parse_gemini_response(response.text, valve_site)
-            diagnosis['raw_response'] = response.text
-            diagnosis['analysis_timestamp'] = datetime.now().isoformat()
-            
-            return diagnosis
+        except Exception as e:
+            return self._fallback_analysis(e, features, valve_site, patient_info)
+    
+    async def _analyze_with_gemini_async(self,
+                                         features: Dict,
+                                         spectrogram_b64: str,
+                                         valve_site: str,
+                                         patient_info: Dict) -> Dict:
+        """Analyze PCG using Gemini AI without blocking the event loop"""
+        
+        try:
+            self._check_circuit()
+            response = await self.client.generate_async(
+                self._build_gemini_contents(features, spectrogram_b64, valve_site, patient_info),
+                generation_config=self._generation_config()
+            )
+            return self._diagnosis_from_response(response.text, valve_site)
             
         except Exception as e:
-            print(f"Error in Gemini analysis: {e}")
-            return self._simulate_analysis(features, valve_site, patient_info)
+            return self._fallback_analysis(e, features, valve_site, patient_info)
+    
+    def _build_gemini_contents(self,
+                               features: Dict,
+                               spectrogram_b64: str,
+                               valve_site: str,
+                               patient_info: Dict) -> List:
+        """Prompt text plus the inline spectrogram image"""
+        
+        # Prepare the prompt
+        prompt = GEMINI_PCG_ANALYSIS_PROMPT.format(
+            valve_site=VALVE_SITES.get(valve_site, valve_site),
+            age=patient_info.get('age', 'Unknown'),
+            gender=patient_info.get('gender', 'Unknown'),
+            bmi=patient_info.get('bmi', 'Unknown'),
+            clinical_notes=patient_info.get('clinical_notes', 'None provided')
+        )
+        
+        # Add technical data; HRV is NaN when too few beats were segmented
+        hrv = ', '.join(f"{label} {value:.0f} ms" if np.isfinite(value) else f"{label} n/a"
+                        for label, value in (('SDNN', features['hrv_sdnn_ms']), ('RMSSD', features['hrv_rmssd_ms'])))
+        technical_data = f"""
+        
+        Technical PCG Signal Analysis Data:
+        
+        Signal Duration: {features['duration']:.2f} seconds
+        Estimated Heart Rate: {features['estimated_heart_rate']:.1f} BPM
+        Heart Rate Variability: {hrv}
+        RMS Energy: {features['raw_rms']:.6f}
+        Spectral Centroid: {features['spectral_centroid_mean']:.2f} Hz
+        Zero Crossing Rate: {features['zero_crossing_rate']:.6f}
+        
+        Frequency Domain Analysis:
+        - Low Frequency Power (20-100 Hz): {features['low_freq_energy']:.2e}
+        - Mid Frequency Power (100-300 Hz): {features['mid_freq_energy']:.2e}
+        - High Frequency Power (300-1000 Hz): {features['high_freq_energy']:.2e}
+        
+        Valve Site: {valve_site} ({VALVE_SITES.get(valve_site, valve_site)})
+        
+        Please analyze this PCG signal and provide your expert diagnosis.
+        """
+        
+        if self.structured_output:
+            technical_data += structured_output_instructions(self.include_report)
+        
+        return [
+            prompt + technical_data,
+            {
+                "mime_type": self.spectrogram_renderer.mime_type,
+                "data": spectrogram_b64
+            }
+        ]
+    
+    def _generation_config(self) -> Dict:
+        """Output token cap, plus the JSON MIME type and schema in structured mode"""
+        config = {
+            'max_output_tokens': GEMINI_MAX_OUTPUT_TOKENS,
+            'temperature': GEMINI_TEMPERATURE
+        }
+        if self.structured_output:
+            config['response_mime_type'] = 'application/json'
+            config['response_schema'] = diagnosis_response_schema(self.include_report)
+        return config
+    
+    def _diagnosis_from_response(self, response_text: str, valve_site: str) -> Dict:
+        """Parse a Gemini reply and stamp it"""
+        diagnosis = None
+        if self.structured_output:
+            try:
+                diagnosis = parse_structured_diagnosis(response_text, valve_site)
+            except StructuredResponseError as e:
+                # Only replies that are not valid schema JSON take the prose path
+                print(f"Structured Gemini reply rejected, using text parser: {e}")
+                metrics.increment('analysis.legacy_parses')
+        if diagnosis is None:
+            diagnosis = self._parse_gemini_response(response_text, valve_site)
+        diagnosis['raw_response'] = response_text
+        diagnosis['analysis_timestamp'] = datetime.now().isoformat()
+        return diagnosis
+    
+    def _check_circuit(self):
+        """Skip building the request at all while the breaker rejects calls"""
+        if self.client.breaker.state == CircuitBreaker.OPEN:
+            raise CircuitOpenError(f"Circuit breaker '{self.client.breaker.name}' is open")
+    
+    def _fallback_analysis(self, error: Exception, features: Dict, valve_site: str, patient_info: Dict) -> Dict:
+        """Local simulated result when the Gemini call ultimately failed"""
+        if isinstance(error, CircuitOpenError):
+            metrics.increment('analysis.circuit_open_fallbacks')
+        else:
+            print(f"Error in Gemini analysis: {type(error).__name__}: {error}")
+        metrics.increment('analysis.fallbacks')
+        diagnosis = self._simulate_analysis(features, valve_site, patient_info)
+        diagnosis['fallback_reason'] = f"{type(error).__name__}: {error}"
+        return diagnosis
     
     def _parse_gemini_response(self, response_text: str, valve_site: str) -> Dict:
         """Parse Gemini response into structured diagnosis"""
@@ -186,14 +650,14 @@ class GeminiPCGAnalyzer:
         response_lower = response_text.lower()
         
         for disease_code, disease_name in VALVE_DISEASES.items():
-            if disease_name.lower() in response_lower or disease_code.lower() in response_lower:
+            # Whole-word match so e.g. 'TR' does not fire inside "mitral"
+            if disease_name.lower() in response_lower or re.search(rf'\b{disease_code.lower()}\b', response_lower):
                 diagnosis['primary_diagnosis'] = disease_name
                 diagnosis['diagnosis_code'] = disease_code
                 break
         
         # Extract confidence level
         if 'confidence' in response_lower:
-            import re
             confidence_match = re.search(r'confidence[:\s]*(\d+)%?', response_lower)
             if confidence_match:
                 diagnosis['confidence_level'] = int(confidence_match.group(1))
@@ -220,7 +684,7 @@ class GeminiPCGAnalyzer:
         
         # Simple rule-based simulation
         heart_rate = features['estimated_heart_rate']
-        energy = features['rms_energy']
+        energy = features['raw_rms']
         
         diagnosis = {
             'valve_site': valve_site,
@@ -253,5 +717,13 @@ class GeminiPCGAnalyzer:
         
         return diagnosis
 
-# Global AI analyzer instance
-ai_analyzer = GeminiPCGAnalyzer()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_ai_analyzer() -> GeminiPCGAnalyzer:
+    """Global AI analyzer instance, created on first use"""
+    return GeminiPCGAnalyzer()
+
+def __getattr__(name: str):
+    # `from ai_analyzer import ai_analyzer` keeps working; the instance is built on first use
+    if name == 'ai_analyzer':
+        return get_ai_analyzer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,216 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from config import (ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MEMORY_ENTRIES, ANALYSIS_CACHE_MAX_DISK_MB,
+                    ANALYSIS_CACHE_TTL_HOURS, ANALYSIS_CACHE_VERSION, GEMINI_PCG_ANALYSIS_PROMPT)
+from metrics import metrics
+
+# Patient fields that reach the Gemini prompt and therefore the result
+PROMPT_PATIENT_FIELDS = ('age', 'gender', 'bmi', 'clinical_notes')
+
+class AnalysisCache:
+    """Two-tier (in-process LRU + on-disk) cache of diagnosis results.
+
+    Entries are addressed by a hash of the decoded samples and everything
+    else that shapes the result, so re-running the same recording (e.g. on
+    a Streamlit rerun) skips feature extraction, rendering and the Gemini
+    call. Disk entries expire after ttl_seconds and the oldest are evicted
+    once the directory exceeds max_disk_bytes.
+    """
+
+    def __init__(self,
+                 cache_dir: Optional[str] = ANALYSIS_CACHE_DIR,
+                 memory_entries: int = ANALYSIS_CACHE_MEMORY_ENTRIES,
+                 max_disk_bytes: int = int(ANALYSIS_CACHE_MAX_DISK_MB * 1024 * 1024),
+                 ttl_seconds: float = ANALYSIS_CACHE_TTL_HOURS * 3600):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk_bytes = None
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(audio_data: np.ndarray,
+                 sample_rate: int,
+                 valve_site: str,
+                 patient_info: Dict,
+                 model_name: str) -> str:
+        """Content hash identifying one analysis request"""
+        samples = np.ascontiguousarray(audio_data)
+        digest = hashlib.sha256()
+        digest.update(f"{samples.dtype.str}:{samples.shape}:{sample_rate}:{valve_site}".encode())
+        digest.update(samples.view(np.uint8).data)
+
+        context = {field: patient_info.get(field) for field in PROMPT_PATIENT_FIELDS}
+        context['model'] = model_name
+        context['version'] = ANALYSIS_CACHE_VERSION
+        context['prompt'] = hashlib.sha256(GEMINI_PCG_ANALYSIS_PROMPT.encode()).hexdigest()
+        digest.update(json.dumps(context, sort_keys=True, default=str).encode())
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a copy of the cached diagnosis, or None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, diagnosis = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    metrics.increment('analysis_cache.memory_hits')
+                    return copy.deepcopy(diagnosis)
+                del self._memory[key]
+                metrics.increment('analysis_cache.expired')
+
+        entry = self._read_disk(key, now)
+        if entry is None:
+            metrics.increment('analysis_cache.misses')
+            return None
+
+        stored_at, diagnosis = entry
+        metrics.increment('analysis_cache.disk_hits')
+        self._remember(key, diagnosis, stored_at)
+        return copy.deepcopy(diagnosis)
+
+    def put(self, key: str, diagnosis: Dict):
+        """Store a diagnosis in both tiers"""
+        now = time.time()
+        self._remember(key, copy.deepcopy(diagnosis), now)
+        self._write_disk(key, diagnosis, now)
+        metrics.increment('analysis_cache.stores')
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self.cache_dir:
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith('.json'):
+                        os.remove(os.path.join(self.cache_dir, name))
+            self._disk_bytes = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current tier sizes"""
+        with self._lock:
+            memory_size = len(self._memory)
+            disk_bytes = self._disk_bytes
+        return {
+            'memory_hits': metrics.counter('analysis_cache.memory_hits'),
+            'disk_hits': metrics.counter('analysis_cache.disk_hits'),
+            'misses': metrics.counter('analysis_cache.misses'),
+            'stores': metrics.counter('analysis_cache.stores'),
+            'evictions': metrics.counter('analysis_cache.evictions'),
+            'expired': metrics.counter('analysis_cache.expired'),
+            'memory_entries': memory_size,
+            'disk_bytes': disk_bytes
+        }
+
+    def _remember(self, key: str, diagnosis: Dict, stored_at: float):
+        """Insert into the LRU tier, evicting the least recently used entry"""
+        with self._lock:
+            self._memory[key] = (stored_at, diagnosis)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[Tuple[float, Dict]]:
+        """(stored_at, diagnosis) of a live disk entry, or None"""
+        if not self.cache_dir:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            # The TTL runs from the stored time; mtime only orders eviction
+            if now - entry['stored_at'] > self.ttl_seconds:
+                self._remove(path)
+                metrics.increment('analysis_cache.expired')
+                return None
+            os.utime(path, None)  # refresh recency for eviction
+            return entry['stored_at'], entry['diagnosis']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_disk(self, key: str, diagnosis: Dict, stored_at: float):
+        if not self.cache_dir:
+            return
+
+        path = self._path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'stored_at': stored_at, 'diagnosis': diagnosis}, f, default=str)
+            try:
+                # An overwritten entry's bytes are already counted
+                replaced_size = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced_size = 0
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except (OSError, TypeError) as e:
+            print(f"Error writing analysis cache entry: {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += size - replaced_size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _scan_disk_bytes(self) -> int:
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                total += entry.stat().st_size
+        return total
+
+    def _evict_disk(self):
+        """Delete expired entries, then the least recently used, until under budget"""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            # mtime is never earlier than the stored time, so this only catches truly expired entries
+            expired = now - mtime > self.ttl_seconds
+            if not expired and total <= self.max_disk_bytes:
+                break
+            if self._remove(path):
+                total -= size
+                metrics.increment('analysis_cache.expired' if expired else 'analysis_cache.evictions')
+        self._disk_bytes = total
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
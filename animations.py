@@ -2,7 +2,7 @@ import streamlit as st
 import time
 import json
 from streamlit_lottie import st_lottie
-import requests
+from functools import lru_cache
 from typing import Optional, Dict, Any
 import base64
 
@@ -13,6 +13,7 @@ class HeartestAnimations:
     def load_lottie_url(self, url: str) -> Optional[Dict[Any, Any]]:
         """Load Lottie animation from URL"""
         try:
+            import requests
             r = requests.get(url)
             if r.status_code != 200:
                 return None
@@ -471,5 +472,13 @@ class HeartestAnimations:
         """
         st.markdown(visualizer_html, unsafe_allow_html=True)
 
-# Global animations instance
-animations = HeartestAnimations()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_animations() -> HeartestAnimations:
+    """Global animations instance, created on first use"""
+    return HeartestAnimations()
+
+def __getattr__(name: str):
+    # Old module-level name, resolved on access (PEP 562)
+    if name == 'animations':
+        return get_animations()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,168 @@
+import io
+import struct
+import numpy as np
+import soundfile as sf
+import scipy.io.wavfile as wav
+from typing import BinaryIO, Optional, Tuple, Union
+
+from config import AUDIO_PREVIEW_SECONDS
+
+AudioSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+# Full-scale value of each integer PCM type (signed) or its midpoint (unsigned 8-bit)
+PCM_FULL_SCALE = {
+    np.dtype(np.int8): 2.0 ** 7,
+    np.dtype(np.int16): 2.0 ** 15,
+    np.dtype(np.int32): 2.0 ** 31,
+    np.dtype(np.int64): 2.0 ** 63,
+    np.dtype(np.uint8): 2.0 ** 7
+}
+
+# WAV format tags and sample widths that map directly onto a numpy dtype
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+WAV_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype(np.uint8),
+    (WAVE_FORMAT_PCM, 16): np.dtype('<i2'),
+    (WAVE_FORMAT_PCM, 32): np.dtype('<i4'),
+    (WAVE_FORMAT_PCM, 64): np.dtype('<i8'),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype('<f4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype('<f8')
+}
+
+def select_channel(audio_data: np.ndarray, channel: int = 0) -> np.ndarray:
+    """One channel of a (samples, channels) array as a strided view; 1-D input is returned as is"""
+    audio_data = np.asarray(audio_data)
+    if audio_data.ndim == 1:
+        return audio_data
+    if audio_data.ndim != 2:
+        raise ValueError(f"Expected mono or (samples, channels) audio, got shape {audio_data.shape}")
+    return audio_data[:, channel]
+
+def to_float32(audio_data: np.ndarray, channel: int = 0, inplace: bool = False) -> np.ndarray:
+    """Convert PCM or float audio to a contiguous float32 signal in [-1, 1].
+
+    Integer PCM is scaled by its full-scale value (unsigned 8-bit is centred
+    first). Contiguous float32 input is returned without a copy. With
+    inplace=True a contiguous, writable int32 buffer is converted in place
+    (same item size), which destroys the original samples. Float input is
+    assumed to be normalized already.
+    """
+    audio_data = select_channel(audio_data, channel)
+    dtype = audio_data.dtype
+
+    if dtype == np.float32:
+        return np.ascontiguousarray(audio_data)
+    if dtype.kind == 'f':
+        return audio_data.astype(np.float32)
+    if dtype not in PCM_FULL_SCALE:
+        raise ValueError(f"Unsupported audio sample type {dtype}")
+
+    scale = np.float32(1 / PCM_FULL_SCALE[dtype])
+    if dtype == np.uint8:
+        converted = audio_data.astype(np.float32)
+        converted -= 128
+    elif inplace and dtype == np.int32 and audio_data.flags.c_contiguous and audio_data.flags.writeable:
+        converted = audio_data.view(np.float32)
+        np.multiply(audio_data, scale, out=converted, casting='unsafe')
+        return converted
+    else:
+        converted = audio_data.astype(np.float32)
+    converted *= scale
+    return converted
+
+def read_wav(source: AudioSource, channel: int = 0, mmap: bool = True) -> Tuple[np.ndarray, int]:
+    """Read a WAV recording as (float32 signal, sample rate).
+
+    source may be a file path, the raw bytes of an upload, an in-memory
+    file such as Streamlit's UploadedFile, or any other file-like object.
+    Paths are memory-mapped when mmap=True, so only the selected channel is
+    paged in and converted; in-memory bytes are decoded in place without a
+    copy of the file. Either way the only new array is the float32 signal.
+    """
+    if hasattr(source, 'getbuffer'):
+        source = source.getbuffer()  # BytesIO / Streamlit UploadedFile: decode without copying
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return decode_wav_buffer(source, channel)
+
+    if mmap and isinstance(source, str):
+        try:
+            sample_rate, audio_data = wav.read(source, mmap=True)
+            return to_float32(audio_data, channel), int(sample_rate)
+        except ValueError:
+            pass  # e.g. 24-bit PCM, which scipy cannot memory-map
+
+    sample_rate, audio_data = wav.read(source)
+    return to_float32(audio_data, channel, inplace=True), int(sample_rate)
+
+def decode_wav_buffer(buffer: Union[bytes, bytearray, memoryview], channel: int = 0) -> Tuple[np.ndarray, int]:
+    """Decode WAV bytes held in memory as (float32 signal, sample rate).
+
+    Common PCM and float layouts are viewed directly with np.frombuffer;
+    anything else (24-bit, compressed or malformed headers) is handed to
+    scipy's reader.
+    """
+    buffer = memoryview(buffer).cast('B')
+    layout = _wav_layout(buffer)
+    if layout is None:
+        sample_rate, audio_data = wav.read(io.BytesIO(buffer))
+        return to_float32(audio_data, channel, inplace=True), int(sample_rate)
+
+    sample_rate, dtype, channels, offset, frames = layout
+    audio_data = np.frombuffer(buffer, dtype=dtype, count=frames * channels, offset=offset)
+    return to_float32(audio_data.reshape(frames, channels), channel), sample_rate
+
+def wav_duration(path: str) -> float:
+    """Length of a stored recording in seconds, from its header only"""
+    return sf.info(path).duration
+
+def read_wav_slice(path: str,
+                   start_seconds: float = 0.0,
+                   seconds: Optional[float] = None,
+                   channel: int = 0) -> Tuple[np.ndarray, int]:
+    """Read only [start, start + seconds) of a stored recording as (float32 signal, sample rate)"""
+    with sf.SoundFile(path) as f:
+        start = min(int(start_seconds * f.samplerate), f.frames)
+        frames = -1 if seconds is None else int(seconds * f.samplerate)
+        f.seek(start)
+        audio_data = f.read(frames, dtype='float32', always_2d=True)
+        return to_float32(audio_data, channel), f.samplerate
+
+def wav_preview(path: str, seconds: float = AUDIO_PREVIEW_SECONDS) -> bytes:
+    """16-bit WAV bytes of the first seconds of a recording, for st.audio previews"""
+    audio_data, sample_rate = read_wav_slice(path, 0.0, seconds)
+    preview = io.BytesIO()
+    sf.write(preview, audio_data, sample_rate, format='WAV', subtype='PCM_16')
+    return preview.getvalue()
+
+def _wav_layout(buffer: memoryview) -> Optional[Tuple[int, np.dtype, int, int, int]]:
+    """(sample rate, dtype, channels, data offset, frames) of a plain RIFF/WAVE buffer, else None"""
+    if len(buffer) < 12 or buffer[:4] != b'RIFF' or buffer[8:12] != b'WAVE':
+        return None
+
+    fmt = None
+    position = 12
+    while position + 8 <= len(buffer):
+        chunk_id = bytes(buffer[position:position + 4])
+        size = struct.unpack_from('<I', buffer, position + 4)[0]
+        body = position + 8
+
+        if chunk_id == b'fmt ' and size >= 16:
+            format_tag, channels, sample_rate, _, block_align, bits = struct.unpack_from('<HHIIHH', buffer, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                format_tag = struct.unpack_from('<H', buffer, body + 24)[0]  # first field of the sub-format GUID
+            fmt = (format_tag, channels, sample_rate, block_align, bits)
+        elif chunk_id == b'data':
+            if fmt is None:
+                return None
+            format_tag, channels, sample_rate, block_align, bits = fmt
+            dtype = WAV_DTYPES.get((format_tag, bits))
+            if dtype is None or channels == 0 or block_align != channels * dtype.itemsize:
+                return None
+            frames = min(size, len(buffer) - body) // block_align
+            return sample_rate, dtype, channels, body, frames
+
+        position = body + size + (size & 1)
+
+    return None
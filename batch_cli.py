@@ -0,0 +1,300 @@
+"""Headless batch analysis of PCG recordings.
+
+Usage:
+    python batch_cli.py recordings/ --out results.jsonl
+    python batch_cli.py manifest.csv --out results --format parquet --workers 8 --concurrency 16
+    python batch_cli.py recordings/ --out results.jsonl --resume
+
+The CPU stages (loading, quality gate, features, triage, spectrogram) run
+in a process pool and the Gemini calls in a bounded asyncio pool on top of
+the shared AsyncGeminiClient. Results are written as they complete; every
+finished path is appended to <out>.checkpoint so --resume skips it. Rows
+with status 'error' or 'fallback' are not checkpointed and are retried on
+resume, so readers should keep the last row per path.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Set
+
+from config import VALVE_SITES, SPECTROGRAM_PROFILE, ANALYSIS_MODE
+from metrics import metrics
+from worker_pool import init_worker, prepare_file
+
+# Statuses that are final; anything else is retried by --resume
+FINAL_STATUSES = ('ok', 'local', 'rejected')
+
+def discover_recordings(source: str, default_valve: str) -> List[Dict]:
+    """Jobs from a directory tree of WAVs or a manifest CSV.
+
+    A manifest has a 'path' column (relative to the manifest) and optional
+    valve_site, patient_id, age and gender columns. Otherwise the valve site
+    comes from a _AV/_PV/_TV/_MV filename suffix (CirCor style) or
+    default_valve.
+    """
+    jobs = []
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith('.wav'):
+                    path = os.path.join(root, name)
+                    jobs.append({'path': path, 'valve_site': _valve_from_name(path, default_valve)})
+        jobs.sort(key=lambda job: job['path'])
+        return jobs
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='') as f:
+        for row in csv.DictReader(f):
+            path = row['path'].strip()
+            if not os.path.isabs(path):
+                path = os.path.join(base, path)
+            job = {'path': path, 'valve_site': (row.get('valve_site') or '').strip()
+                   or _valve_from_name(path, default_valve)}
+            for field in ('patient_id', 'age', 'gender'):
+                if row.get(field):
+                    job[field] = row[field].strip()
+            jobs.append(job)
+    return jobs
+
+def _valve_from_name(path: str, default_valve: str) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0].upper()
+    for valve_site in VALVE_SITES:
+        if stem.endswith(f'_{valve_site}'):
+            return valve_site
+    return default_valve
+
+class ResultWriter:
+    """Incremental JSONL or Parquet output plus the resume checkpoint.
+
+    JSONL rows are flushed one by one. Parquet output is a directory of
+    part files written every flush_every rows (pandas with pyarrow or
+    fastparquet). A path is checkpointed only once its row is on disk.
+    """
+
+    def __init__(self, out: str, output_format: str = 'jsonl', flush_every: int = 100, resume: bool = False):
+        self.out = out
+        self.output_format = output_format
+        self.flush_every = flush_every
+        self.checkpoint_path = out.rstrip(os.sep) + '.checkpoint'
+        self._pending = []
+
+        if not resume and (os.path.exists(out) or os.path.exists(self.checkpoint_path)):
+            raise FileExistsError(f"{out} already exists; pass --resume to continue it")
+
+        if output_format == 'parquet':
+            _require_parquet_engine()
+            os.makedirs(out, exist_ok=True)
+            self._parts = len([name for name in os.listdir(out) if name.endswith('.parquet')])
+            self._file = None
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+            self._file = open(out, 'a', encoding='utf-8')
+        self._checkpoint = open(self.checkpoint_path, 'a', encoding='utf-8')
+
+    def completed(self) -> Set[str]:
+        """Paths already checkpointed by earlier runs"""
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+
+    def write(self, row: Dict):
+        if self._file is not None:
+            self._file.write(json.dumps(row, default=str) + '\n')
+            self._file.flush()
+            self._mark_done([row])
+        else:
+            self._pending.append(row)
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        if self._file is not None or not self._pending:
+            return
+        import pandas as pd
+
+        frame = pd.DataFrame([dict(row, diagnosis=json.dumps(row['diagnosis'], default=str))
+                              for row in self._pending])
+        frame.to_parquet(os.path.join(self.out, f'part-{self._parts:05d}.parquet'), index=False)
+        self._parts += 1
+        self._mark_done(self._pending)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+        self._checkpoint.close()
+
+    def _mark_done(self, rows: List[Dict]):
+        finished = [row['path'] for row in rows if row['status'] in FINAL_STATUSES]
+        if finished:
+            self._checkpoint.write(''.join(path + '\n' for path in finished))
+            self._checkpoint.flush()
+
+def _require_parquet_engine():
+    """Fail before any work is done when Parquet cannot be written"""
+    try:
+        import pandas  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Parquet output needs pandas with pyarrow or fastparquet installed") from e
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(engine)
+            return
+        except ImportError:
+            pass
+    raise ImportError("Parquet output needs pyarrow or fastparquet installed")
+
+class Progress:
+    """Files/s and ETA on stderr, at most every interval seconds"""
+
+    def __init__(self, total: int, interval: float = 2.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.counts = {}
+        self.started = time.monotonic()
+        self._last = 0.0
+
+    def update(self, status: str):
+        self.done += 1
+        self.counts[status] = self.counts.get(status, 0) + 1
+        now = time.monotonic()
+        if now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            print(self.line(), file=sys.stderr, flush=True)
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float('nan')
+        statuses = ', '.join(f"{count} {status}" for status, count in sorted(self.counts.items()))
+        return (f"{self.done}/{self.total} files, {rate:.1f} files/s, "
+                f"ETA {_format_seconds(eta)} ({statuses})")
+
+def _format_seconds(seconds: float) -> str:
+    if seconds != seconds:
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+def _row(job: Dict, diagnosis: Optional[Dict], status: str, error: Optional[str] = None) -> Dict:
+    diagnosis = diagnosis or {}
+    quality = diagnosis.get('signal_quality') or {}
+    return {
+        'path': job['path'],
+        'valve_site': job['valve_site'],
+        'patient_id': job.get('patient_id'),
+        'status': status,
+        'primary_diagnosis': diagnosis.get('primary_diagnosis'),
+        'diagnosis_code': diagnosis.get('diagnosis_code'),
+        'confidence_level': diagnosis.get('confidence_level'),
+        'severity': diagnosis.get('severity'),
+        'quality_score': quality.get('score'),
+        'quality_decision': quality.get('decision'),
+        'abnormality_probability': diagnosis.get('abnormality_probability'),
+        'error': error or diagnosis.get('fallback_reason'),
+        'diagnosis': diagnosis
+    }
+
+def _status(diagnosis: Dict) -> str:
+    if diagnosis.get('analysis_mode') == 'quality_gate':
+        return 'rejected'
+    if diagnosis.get('fallback_reason'):
+        return 'fallback'
+    if diagnosis.get('analysis_mode') == 'triage' or diagnosis.get('simulation_mode'):
+        return 'local'
+    return 'ok'
+
+async def run_batch(jobs: Sequence[Dict],
+                    analyzer,
+                    writer: ResultWriter,
+                    workers: int,
+                    concurrency: int,
+                    spectrogram_profile: str,
+                    analysis_mode: str) -> Dict[str, int]:
+    """Analyze every job; returns the count per status"""
+    progress = Progress(len(jobs))
+    loop = asyncio.get_running_loop()
+    remote_slots = asyncio.Semaphore(concurrency)
+    # Bounds prepared-but-undiagnosed results (spectrograms) held in memory
+    in_flight = asyncio.Semaphore(workers * 2 + concurrency)
+
+    pool = ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_worker,
+                               initargs=(spectrogram_profile, analysis_mode))
+
+    async def analyze(job: Dict):
+        async with in_flight:
+            try:
+                prepared = await loop.run_in_executor(pool, prepare_file, job['path'], job['valve_site'])
+                patient_info = {'name': job.get('patient_id') or os.path.basename(job['path']),
+                                'age': job.get('age', 'Unknown'), 'gender': job.get('gender', 'Unknown')}
+                async with remote_slots:
+                    diagnosis = await analyzer.diagnose_prepared_async(prepared, job['valve_site'], patient_info)
+                row = _row(job, diagnosis, _status(diagnosis))
+            except Exception as e:
+                row = _row(job, None, 'error', f"{type(e).__name__}: {e}")
+        writer.write(row)
+        metrics.increment(f"batch.{row['status']}")
+        progress.update(row['status'])
+
+    try:
+        await asyncio.gather(*[analyze(job) for job in jobs])
+    finally:
+        pool.shutdown(cancel_futures=True)
+        writer.close()
+    return progress.counts
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Analyze a directory or manifest of PCG recordings")
+    parser.add_argument('source', help="directory of WAV files, or a CSV manifest with a 'path' column")
+    parser.add_argument('--out', required=True, help="JSONL file, or directory for --format parquet")
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), default='jsonl')
+    parser.add_argument('--resume', action='store_true', help="skip recordings already in the checkpoint")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processes for CPU stages")
+    parser.add_argument('--concurrency', type=int, default=8, help="Gemini calls in flight")
+    parser.add_argument('--valve-site', default='MV', choices=sorted(VALVE_SITES),
+                        help="valve site when neither the manifest nor the filename gives one")
+    parser.add_argument('--profile', default=SPECTROGRAM_PROFILE, help="spectrogram payload profile")
+    parser.add_argument('--mode', default=ANALYSIS_MODE, choices=('gemini', 'triage'))
+    parser.add_argument('--limit', type=int, help="analyze at most this many recordings")
+    parser.add_argument('--flush-every', type=int, default=100, help="rows per Parquet part file")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="use the local fake Gemini model instead of the API")
+    args = parser.parse_args(argv)
+
+    from ai_analyzer import GeminiPCGAnalyzer
+    from gemini_client import FakeGenerativeModel
+
+    try:
+        writer = ResultWriter(args.out, args.format, args.flush_every, resume=args.resume)
+    except (FileExistsError, ImportError) as e:
+        parser.error(str(e))
+
+    jobs = discover_recordings(args.source, args.valve_site)
+    done = writer.completed()
+    jobs = [job for job in jobs if job['path'] not in done]
+    if args.limit is not None:
+        jobs = jobs[:args.limit]
+    print(f"{len(jobs)} recordings to analyze ({len(done)} already done)", file=sys.stderr)
+    if not jobs:
+        writer.close()
+        return
+
+    analyzer = GeminiPCGAnalyzer(model=FakeGenerativeModel() if args.dry_run else None,
+                                 spectrogram_profile=args.profile, analysis_mode=args.mode)
+    counts = asyncio.run(run_batch(jobs, analyzer, writer, max(1, args.workers), max(1, args.concurrency),
+                                   args.profile, args.mode))
+    print(f"Finished: {', '.join(f'{count} {status}' for status, count in sorted(counts.items()))}; "
+          f"results in {args.out}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
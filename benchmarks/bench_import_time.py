@@ -0,0 +1,67 @@
+"""Cold import time of the app modules, measured with python -X importtime.
+
+Usage: python benchmarks/bench_import_time.py [module ...] [--top N]
+
+Each module is imported in a fresh interpreter so nothing is shared
+between measurements. Reports the cumulative import time of the module
+itself and its slowest transitive imports; modules whose dependencies are
+not installed are reported instead of failing the run.
+"""
+import os
+import sys
+import subprocess
+from typing import List, Optional, Set, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['config', 'metrics', 'database', 'animations', 'pdf_generator', 'ai_analyzer', 'streamlit_app']
+
+def run_importtime(code: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='1')
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+
+def parse_importtime(stderr: str) -> List[Tuple[float, str]]:
+    """[(cumulative seconds, package)] from -X importtime output"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1e6, name.strip()))
+    return imports
+
+def import_time(module: str, startup: Set[str]) -> Tuple[Optional[float], List[Tuple[float, str]], str]:
+    """(total seconds, [(cumulative seconds, package)], error) for one fresh import"""
+    proc = run_importtime(f'import {module}')
+    if proc.returncode != 0:
+        return None, [], proc.stderr.strip().splitlines()[-1]
+
+    # Interpreter startup (site, .pth hooks) is logged too but is not part of the import
+    imports = [entry for entry in parse_importtime(proc.stderr) if entry[1] not in startup]
+    total = next((seconds for seconds, name in imports if name == module), None)
+    return total, imports, ''
+
+def main():
+    args = sys.argv[1:]
+    top = 5
+    if '--top' in args:
+        index = args.index('--top')
+        top = int(args[index + 1])
+        del args[index:index + 2]
+    modules = args or MODULES
+    startup = {name for _, name in parse_importtime(run_importtime('pass').stderr)}
+
+    for module in modules:
+        total, imports, error = import_time(module, startup)
+        if total is None:
+            print(f"{module}: not importable here ({error})")
+            continue
+        print(f"{module}: {total * 1000:.1f} ms")
+        # Direct and transitive imports other than the module itself, slowest first
+        heaviest = sorted((entry for entry in imports if entry[1] != module), reverse=True)[:top]
+        for seconds, name in heaviest:
+            print(f"    {seconds * 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Insert and query latency of the local stores as the case archive grows.
+
+Usage: python benchmarks/bench_local_store.py [max_cases] [json_max_cases]
+
+The SQLite store is bulk-loaded to each size with save_cases and then
+timed on single save_case calls, a per-patient lookup, a filtered case
+history (joined with patients), a case count and the first and last
+keyset pages of the full history; the legacy JSON store is
+timed the same way up to json_max_cases (default 5000).
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_store import JsonStore, SQLiteStore, page_cursor
+
+# Every patient has this many cases, so lookups return the same amount at any size
+CASES_PER_PATIENT = 20
+
+def make_case(i: int) -> dict:
+    return {
+        'patient_id': f"patient-{i // CASES_PER_PATIENT}",
+        'valve_site': ('AV', 'PV', 'TV', 'MV')[i % 4],
+        'audio_filename': f"recording_{i}.wav",
+        'diagnosis': {'primary_diagnosis': 'Normal', 'confidence_level': 90, 'findings': ['Normal S1 and S2']},
+        'confidence_level': 90,
+        'severity': 'None',
+        'recommendations': ['Continue routine monitoring']
+    }
+
+def make_patient(i: int) -> dict:
+    return {'id': f"patient-{i}", 'name': f"Patient {i}", 'age': 50, 'gender': 'Female'}
+
+def median_ms(func, repeats: int = 50) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+def grow(store, saved: int, target: int) -> int:
+    """Fill the store up to target cases"""
+    if isinstance(store, SQLiteStore):
+        for start in range(saved, target, 10000):
+            store.save_cases([make_case(i) for i in range(start, min(start + 10000, target))])
+        store.save_patients([make_patient(i) for i in range(saved // CASES_PER_PATIENT, target // CASES_PER_PATIENT)])
+    else:
+        cases = [make_case(i) for i in range(target)]
+        with open(store.cases_file, 'w') as f:
+            json.dump(cases, f, indent=2)
+        with open(store.patients_file, 'w') as f:
+            json.dump([make_patient(i) for i in range(target // CASES_PER_PATIENT)], f, indent=2)
+    return target
+
+def run(name: str, store, sizes):
+    saved = 0
+    for size in sizes:
+        saved = grow(store, saved, size)
+        insert = median_ms(lambda: store.save_case(make_case(saved)), repeats=20)
+        saved += 20
+        lookup = median_ms(lambda: store.get_patient_cases('patient-7'), repeats=20)
+        history = median_ms(lambda: store.get_case_history(patient_id='patient-7', valve_site='AV'), repeats=20)
+        count = median_ms(store.count_cases, repeats=20)
+        # Newest-first pages of 25: the first one, and the one before the 30 oldest cases
+        deep_cursor = page_cursor(store.get_case_history(newest_first=False, limit=30))
+        first_page = median_ms(lambda: store.get_case_history(limit=25), repeats=20)
+        deep_page = median_ms(lambda: store.get_case_history(limit=25, cursor=deep_cursor), repeats=20)
+        print(f"{name:>6} {size:>8} cases: insert {insert:8.3f} ms, patient lookup {lookup:8.3f} ms, "
+              f"filtered history {history:8.3f} ms, count {count:8.3f} ms, "
+              f"first page {first_page:8.3f} ms, last page {deep_page:8.3f} ms")
+
+def main():
+    max_cases = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    json_max_cases = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    sizes = [size for size in (1000, 5000, 20000, 50000, 100000, 200000, 500000) if size <= max_cases]
+
+    with tempfile.TemporaryDirectory() as directory:
+        run('sqlite', SQLiteStore(os.path.join(directory, 'store.db')), sizes)
+        run('json', JsonStore(os.path.join(directory, 'patients.json'), os.path.join(directory, 'cases.json')),
+            [size for size in sizes if size <= json_max_cases])
+
+if __name__ == "__main__":
+    main()
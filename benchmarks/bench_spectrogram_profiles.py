@@ -0,0 +1,46 @@
+"""Payload size and render time of each spectrogram profile.
+
+Usage: python benchmarks/bench_spectrogram_profiles.py [seconds] [repeats]
+
+Pair with the per-profile 'analysis.latency_s.<profile>' metrics from real
+Gemini runs (SPECTROGRAM_PROFILE=<profile>) to pick the smallest image that
+keeps diagnostic agreement.
+"""
+import os
+import sys
+import time
+import base64
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ANALYSIS_SAMPLE_RATE, SPECTROGRAM_PROFILES
+from signal_processing import SpectralContext
+from spectrogram_renderer import SpectrogramRenderer
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sample_rate = ANALYSIS_SAMPLE_RATE or 4000
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    audio = np.exp(-((t % 0.8) / 0.04)) * np.sin(2 * np.pi * 60 * t) + 0.02 * rng.standard_normal(t.size)
+    context = SpectralContext(audio, sample_rate)
+    db = context.spectrogram_db()
+
+    print(f"signal: {seconds:g}s @ {sample_rate} Hz, spectrogram {db.shape}")
+    print(f"{'profile':<10} {'format':<12} {'pixels':>10} {'bytes':>9} {'base64':>9} {'render ms':>10}")
+    for name, settings in SPECTROGRAM_PROFILES.items():
+        renderer = SpectrogramRenderer(**settings)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            image = renderer.render(db, sample_rate, context.hop_length)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:<10} {renderer.mime_type:<12} {renderer.width}x{renderer.height:<5} "
+              f"{len(image):>9} {len(base64.b64encode(image)):>9} {min(timings) * 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Latency of the Pillow spectrogram renderer against the former pyplot path.
+
+Usage: python benchmarks/bench_spectrogram_render.py [seconds] [repeats]
+"""
+import os
+import sys
+import time
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ANALYSIS_SAMPLE_RATE, SPECTROGRAM_PROFILE, SPECTROGRAM_PROFILES
+from signal_processing import SpectralContext
+from spectrogram_renderer import SpectrogramRenderer
+
+def render_pyplot(context: SpectralContext) -> bytes:
+    """The original 12x8 inch, 150 dpi matplotlib figure"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import librosa.display
+    
+    plt.figure(figsize=(12, 8))
+    librosa.display.specshow(context.spectrogram_db(), sr=context.sample_rate,
+                             hop_length=context.hop_length, x_axis='time', y_axis='hz')
+    plt.colorbar(format='%+2.0f dB')
+    plt.title('PCG Spectrogram')
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
+    plt.close()
+    return buf.getvalue()
+
+def best_of(repeats: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sample_rate = ANALYSIS_SAMPLE_RATE or 4000
+    
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    audio = np.exp(-((t % 0.8) / 0.04)) * np.sin(2 * np.pi * 60 * t) + 0.02 * rng.standard_normal(t.size)
+    context = SpectralContext(audio, sample_rate)
+    db = context.spectrogram_db()
+    renderer = SpectrogramRenderer(**SPECTROGRAM_PROFILES[SPECTROGRAM_PROFILE])
+    
+    pyplot_time = best_of(repeats, render_pyplot, context)
+    pillow_time = best_of(repeats, renderer.render, db, sample_rate, context.hop_length)
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        start = time.perf_counter()
+        images = list(pool.map(lambda _: renderer.render(db, sample_rate, context.hop_length), range(32)))
+        threaded_time = time.perf_counter() - start
+    
+    print(f"signal: {seconds:g}s @ {sample_rate} Hz, spectrogram {db.shape}")
+    print(f"pyplot: {pyplot_time * 1000:.1f} ms")
+    print(f"pillow: {pillow_time * 1000:.1f} ms ({pyplot_time / pillow_time:.1f}x faster, {len(images[0])} bytes)")
+    print(f"32 renders on 8 threads: {threaded_time * 1000:.1f} ms, identical output: {len(set(images)) == 1}")
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,63 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# Local storage used when Supabase is not configured (local_store.py):
+# "sqlite" is a WAL-mode database at LOCAL_DB_PATH; "json" is the legacy
+# whole-file JSON storage. Existing JSON files are migrated into SQLite once.
+LOCAL_STORAGE_BACKEND = os.getenv("LOCAL_STORAGE_BACKEND", "sqlite")
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "local_store.db")
+LOCAL_PATIENTS_FILE = "local_patients.json"
+LOCAL_CASES_FILE = "local_cases.json"
+
+# Gemini model used for analysis
+GEMINI_MODEL_NAME = "gemini-2.0-flash-exp"
+
+# Gemini client limits (see gemini_client.AsyncGeminiClient). Requests per
+# minute should match the project's quota; None disables rate limiting.
+GEMINI_MAX_CONCURRENCY = 4
+GEMINI_TIMEOUT_SECONDS = 45
+GEMINI_DEADLINE_SECONDS = 120
+GEMINI_MAX_RETRIES = 3
+GEMINI_BACKOFF_BASE_SECONDS = 1.0
+GEMINI_BACKOFF_MAX_SECONDS = 20.0
+GEMINI_REQUESTS_PER_MINUTE = 60
+
+# Structured output: ask Gemini for a schema-constrained JSON diagnosis
+# (see structured_output.py) instead of a free-text report. The prose
+# report becomes an optional "report" field; output tokens are capped.
+GEMINI_STRUCTURED_OUTPUT = True
+GEMINI_INCLUDE_REPORT = False
+GEMINI_MAX_OUTPUT_TOKENS = 1024
+GEMINI_TEMPERATURE = 0.2
+
+# Stream the Gemini reply into the diagnosis page as it is generated
+GEMINI_STREAMING = True
+
+# Analysis mode: "gemini" sends every recording to Gemini; "triage" first
+# scores it with the local classifier (triage_classifier.py) and answers
+# confidently normal recordings locally, escalating the rest to Gemini.
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "gemini")
+TRIAGE_MODEL_PATH = os.getenv("TRIAGE_MODEL_PATH", "models/triage_classifier.npz")
+TRIAGE_NORMAL_THRESHOLD = 0.2  # abnormality probability below which no Gemini call is made
+
+# Circuit breaker: open when, over the last WINDOW calls (at least
+# MIN_CALLS), the error rate or the share of calls slower than
+# SLOW_CALL_SECONDS reaches its threshold; probe again after OPEN_SECONDS.
+GEMINI_BREAKER_WINDOW = 20
+GEMINI_BREAKER_MIN_CALLS = 5
+GEMINI_BREAKER_ERROR_RATE = 0.5
+GEMINI_BREAKER_SLOW_CALL_SECONDS = 30
+GEMINI_BREAKER_SLOW_CALL_RATE = 0.8
+GEMINI_BREAKER_OPEN_SECONDS = 30
+GEMINI_BREAKER_HALF_OPEN_CALLS = 1
+
+# Hedged requests: send a duplicate when a call outlives the recent latency
+# percentile (or the default budget until MIN_SAMPLES calls were seen)
+GEMINI_HEDGE_ENABLED = False
+GEMINI_HEDGE_PERCENTILE = 95
+GEMINI_HEDGE_MIN_SAMPLES = 20
+GEMINI_HEDGE_DEFAULT_SECONDS = 20
+
 # Medical Configuration
 VALVE_SITES = {
     "AV": "Aortic Valve",
@@ -39,10 +96,113 @@ AUDIO_FORMAT = "wav"
 MAX_DURATION = 30  # seconds
 MIN_DURATION = 2   # seconds
 
+# Pre-flight signal-quality gate (see quality_gate.assess_quality), run
+# before features, spectrogram and Gemini. Recordings scoring below
+# min_score or outside the duration limits are rejected.
+QUALITY_GATE = {
+    "enabled": True,
+    "min_duration": MIN_DURATION,
+    "max_duration": MAX_DURATION,
+    "max_clipping_ratio": 0.01,
+    "min_snr_db": 6.0,
+    "flat_level": 1 / 32768,  # peak-to-peak within a 20 ms frame; one 16-bit step
+    "max_flat_fraction": 0.1,
+    "max_flat_seconds": 1.0,
+    "min_score": 0.4
+}
+
+# Recordings are decimated to this rate on load (heart sounds and murmurs
+# sit well below 1 kHz). Set to None to analyze at the recorded rate.
+ANALYSIS_SAMPLE_RATE = 4000
+
+# STFT frame length in seconds, rounded to a power-of-two n_fft at the
+# analysis rate, with a quarter-frame hop: 256/64 samples at 4 kHz (64/16 ms)
+# and 2048/512 at 44.1 kHz, short enough to keep S1 and S2 apart
+STFT_WINDOW_SECONDS = 0.064
+
+# Worker processes for the CPU-bound analysis stages (worker_pool.py), shared
+# by all Streamlit sessions; 0 runs them in the session's own thread.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+
+# Background warmup once per server process (warmup.py): a synthetic
+# recording of WARMUP_SECONDS goes through analyze_pcg_signal with a stubbed
+# Gemini model, and the Gemini connection is opened, before the first request
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") != "0"
+WARMUP_SECONDS = 4
+
+# Spectral bands (Hz) reported as <name>_freq_energy features
+FREQUENCY_BANDS = {
+    "low": (20, 100),
+    "mid": (100, 300),
+    "high": (300, 1000)
+}
+
+# Preprocessing applied after decimation and before feature extraction
+# (signal_processing.preprocess_pcg): DC removal, zero-phase Butterworth
+# band-pass over the heart-sound band, spike suppression, peak normalization
+PREPROCESSING = {
+    "enabled": True,
+    "band": (25, 400),  # Hz
+    "filter_order": 4,
+    "suppress_spikes": True,
+    "normalize": True
+}
+
+# Spectrogram payload profiles for the image sent to Gemini (keyword
+# arguments of spectrogram_renderer.SpectrogramRenderer). "full" is the
+# original 0-Nyquist colour PNG; the others crop to the diagnostic band and
+# shrink the upload. Payload bytes and end-to-end latency are recorded per
+# profile in metrics so they can be compared against diagnostic agreement.
+SPECTROGRAM_PROFILES = {
+    "full": {
+        "width": 1200,
+        "height": 800,
+        "max_frequency": None,  # Hz, None = Nyquist
+        "image_format": "PNG",
+        "show_axes": True,
+        "show_colorbar": True
+    },
+    "compact": {
+        "width": 768,
+        "height": 512,
+        "max_frequency": 1000,
+        "image_format": "WEBP",
+        "quality": 85,
+        "show_axes": True,
+        "show_colorbar": True
+    },
+    "minimal": {
+        "width": 512,
+        "height": 384,
+        "max_frequency": 1000,
+        "image_format": "JPEG",
+        "quality": 75,
+        "grayscale": True,
+        "show_axes": True,
+        "show_colorbar": False
+    }
+}
+SPECTROGRAM_PROFILE = os.getenv("SPECTROGRAM_PROFILE", "full")
+if SPECTROGRAM_PROFILE not in SPECTROGRAM_PROFILES:
+    raise ValueError(f"Unknown SPECTROGRAM_PROFILE '{SPECTROGRAM_PROFILE}', "
+                     f"expected one of {sorted(SPECTROGRAM_PROFILES)}")
+
+# Analysis result cache (see analysis_cache.AnalysisCache). Bump
+# ANALYSIS_CACHE_VERSION whenever the signal pipeline changes results.
+ANALYSIS_CACHE_ENABLED = True
+ANALYSIS_CACHE_DIR = "analysis_cache"
+ANALYSIS_CACHE_MEMORY_ENTRIES = 128
+ANALYSIS_CACHE_MAX_DISK_MB = 256
+ANALYSIS_CACHE_TTL_HOURS = 24 * 7
+ANALYSIS_CACHE_VERSION = "7"
+
 # File Storage
 UPLOAD_FOLDER = "uploaded_audios"
 REPORTS_FOLDER = "reports"
 TEMP_FOLDER = "temp"
+AUDIO_PREVIEW_SECONDS = 10  # case-history players load only this much of each recording
+HISTORY_PAGE_SIZES = (10, 25, 50)  # cases per Case History page; the first is the default
+HISTORY_PATIENT_CHOICES = 200  # newest patients matching the Case History search offered in its filter
 
 # Gemini AI Prompts
 GEMINI_PCG_ANALYSIS_PROMPT = """
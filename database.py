@@ -1,14 +1,19 @@
-import os
-from supabase import create_client, Client
 from datetime import datetime
+from functools import lru_cache
 import json
-from typing import Dict, List, Optional
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
 from config import SUPABASE_URL, SUPABASE_KEY
+from local_store import Cursor, DateBound, create_local_store, date_bound, page_cursor
 
 class SupabaseManager:
-    def __init__(self):
+    def __init__(self, local_store: Optional[Any] = None):
+        # Fallback storage (local_store.SQLiteStore or JsonStore), also used when a Supabase call fails
+        self.local = local_store or create_local_store()
+        
         if SUPABASE_URL and SUPABASE_KEY:
-            self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+            from supabase import create_client  # heavy; only needed when Supabase is configured
+            self.supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         else:
             self.supabase = None
             print("Warning: Supabase credentials not found. Using local storage.")
@@ -36,7 +41,7 @@ class SupabaseManager:
     def save_patient(self, patient_data: Dict) -> Optional[str]:
         """Save patient information and return patient ID"""
         if not self.supabase:
-            return self._save_patient_local(patient_data)
+            return self.local.save_patient(patient_data)
             
         try:
             patient_record = {
@@ -56,12 +61,12 @@ class SupabaseManager:
             
         except Exception as e:
             print(f"Error saving patient: {e}")
-            return self._save_patient_local(patient_data)
+            return self.local.save_patient(patient_data)
     
     def save_case(self, case_data: Dict) -> bool:
         """Save diagnosis case"""
         if not self.supabase:
-            return self._save_case_local(case_data)
+            return self.local.save_case(case_data)
             
         try:
             case_record = {
@@ -80,12 +85,12 @@ class SupabaseManager:
             
         except Exception as e:
             print(f"Error saving case: {e}")
-            return self._save_case_local(case_data)
+            return self.local.save_case(case_data)
     
     def get_patient_cases(self, patient_id: str) -> List[Dict]:
         """Get all cases for a patient"""
         if not self.supabase:
-            return self._get_patient_cases_local(patient_id)
+            return self.local.get_patient_cases(patient_id)
             
         try:
             response = self.supabase.table('cases').select('*').eq('patient_id', patient_id).execute()
@@ -94,25 +99,43 @@ class SupabaseManager:
             print(f"Error fetching patient cases: {e}")
             return []
     
-    def get_all_patients(self) -> List[Dict]:
-        """Get all patients"""
+    def get_all_patients(self,
+                         limit: Optional[int] = None,
+                         cursor: Optional[Cursor] = None,
+                         search: Optional[str] = None) -> List[Dict]:
+        """Get patients, newest first; with limit, one keyset page starting after cursor.
+        With search, only patients whose name contains it (case-insensitive) or whose id
+        starts with it (in Supabase, whose UUID equals it)."""
         if not self.supabase:
-            return self._get_all_patients_local()
+            return self.local.get_all_patients(limit, cursor, search)
             
         try:
-            response = self.supabase.table('patients').select('*').order('created_at', desc=True).execute()
+            query = self.supabase.table('patients').select('*')
+            if search:
+                query = self._search_patients(query, search)
+            query = self._keyset_page(query, limit, cursor, newest_first=True)
+            response = query.execute()
             return response.data
         except Exception as e:
             print(f"Error fetching patients: {e}")
             return []
     
-    def get_case_history(self) -> List[Dict]:
-        """Get complete case history with patient details"""
+    def get_case_history(self,
+                         patient_id: Optional[str] = None,
+                         valve_site: Optional[str] = None,
+                         since: Optional[DateBound] = None,
+                         until: Optional[DateBound] = None,
+                         newest_first: bool = True,
+                         limit: Optional[int] = None,
+                         cursor: Optional[Cursor] = None) -> List[Dict]:
+        """Get case history with patient details under 'patient', optionally filtered by
+        patient, valve site and a [since, until) date range. With limit, returns one
+        keyset page of cases after cursor (see page_cursor)."""
         if not self.supabase:
-            return self._get_case_history_local()
+            return self.local.get_case_history(patient_id, valve_site, since, until, newest_first, limit, cursor)
             
         try:
-            response = self.supabase.table('cases').select('''
+            query = self.supabase.table('cases').select('''
                 *,
                 patients (
                     name,
@@ -121,85 +144,94 @@ class SupabaseManager:
                     bmi,
                     clinical_notes
                 )
-            ''').order('created_at', desc=True).execute()
+            ''')
+            query = self._filter_cases(query, patient_id, valve_site, since, until)
+            response = self._keyset_page(query, limit, cursor, newest_first).execute()
+            # The embedded row comes back under the table name; pages read case['patient']
+            for case in response.data:
+                case['patient'] = case.pop('patients', None) or {}
             return response.data
         except Exception as e:
             print(f"Error fetching case history: {e}")
             return []
     
-    # Local storage fallback methods
-    def _save_patient_local(self, patient_data: Dict) -> str:
-        """Fallback local storage for patient data"""
-        import uuid
-        patient_id = str(uuid.uuid4())
-        
-        patients_file = "local_patients.json"
-        patients = []
-        
-        if os.path.exists(patients_file):
-            with open(patients_file, 'r') as f:
-                patients = json.load(f)
-        
-        patient_data['id'] = patient_id
-        patient_data['created_at'] = datetime.now().isoformat()
-        patients.append(patient_data)
-        
-        with open(patients_file, 'w') as f:
-            json.dump(patients, f, indent=2)
+    def get_case_page(self,
+                      page_size: int,
+                      cursor: Optional[Cursor] = None,
+                      **filters) -> Tuple[List[Dict], Optional[Cursor]]:
+        """One page of get_case_history and the cursor of the next page (None on the last page)"""
+        cases = self.get_case_history(**filters, limit=page_size + 1, cursor=cursor)
+        page = cases[:page_size]
+        return page, page_cursor(page) if len(cases) > page_size else None
+    
+    def count_patients(self) -> int:
+        """Number of patients; Supabase estimates it from table statistics for large tables"""
+        if not self.supabase:
+            return self.local.count_patients()
             
-        return patient_id
+        try:
+            return self.supabase.table('patients').select('id', count='estimated', head=True).execute().count or 0
+        except Exception as e:
+            print(f"Error counting patients: {e}")
+            return 0
     
-    def _save_case_local(self, case_data: Dict) -> bool:
-        """Fallback local storage for case data"""
-        cases_file = "local_cases.json"
-        cases = []
-        
-        if os.path.exists(cases_file):
-            with open(cases_file, 'r') as f:
-                cases = json.load(f)
-        
-        case_data['created_at'] = datetime.now().isoformat()
-        cases.append(case_data)
-        
-        with open(cases_file, 'w') as f:
-            json.dump(cases, f, indent=2)
+    def count_cases(self,
+                    patient_id: Optional[str] = None,
+                    valve_site: Optional[str] = None,
+                    since: Optional[DateBound] = None,
+                    until: Optional[DateBound] = None) -> int:
+        """Number of cases matching the get_case_history filters (estimated by Supabase for large tables)"""
+        if not self.supabase:
+            return self.local.count_cases(patient_id, valve_site, since, until)
             
-        return True
+        try:
+            query = self.supabase.table('cases').select('id', count='estimated', head=True)
+            return self._filter_cases(query, patient_id, valve_site, since, until).execute().count or 0
+        except Exception as e:
+            print(f"Error counting cases: {e}")
+            return 0
     
-    def _get_all_patients_local(self) -> List[Dict]:
-        """Get all patients from local storage"""
-        patients_file = "local_patients.json"
-        if os.path.exists(patients_file):
-            with open(patients_file, 'r') as f:
-                return json.load(f)
-        return []
+    @staticmethod
+    def _search_patients(query, search: str):
+        """Exact id match when search is a complete UUID, otherwise a server-side name ILIKE"""
+        try:
+            return query.eq('id', str(uuid.UUID(search)))
+        except ValueError:
+            pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            return query.ilike('name', f'%{pattern}%')
     
-    def _get_patient_cases_local(self, patient_id: str) -> List[Dict]:
-        """Get patient cases from local storage"""
-        cases_file = "local_cases.json"
-        if os.path.exists(cases_file):
-            with open(cases_file, 'r') as f:
-                cases = json.load(f)
-                return [case for case in cases if case.get('patient_id') == patient_id]
-        return []
+    @staticmethod
+    def _keyset_page(query, limit: Optional[int], cursor: Optional[Cursor], newest_first: bool):
+        """Order by (created_at, id) and keep the rows after cursor; the page is always range(0, limit - 1)"""
+        if cursor is not None:
+            created_at, row_id = cursor
+            op = 'lt' if newest_first else 'gt'
+            query = query.or_(f'created_at.{op}."{created_at}",'
+                              f'and(created_at.eq."{created_at}",id.{op}."{row_id}")')
+        query = query.order('created_at', desc=newest_first).order('id', desc=newest_first)
+        if limit is not None:
+            query = query.range(0, limit - 1)
+        return query
     
-    def _get_case_history_local(self) -> List[Dict]:
-        """Get case history from local storage"""
-        patients = self._get_all_patients_local()
-        cases_file = "local_cases.json"
-        
-        if os.path.exists(cases_file):
-            with open(cases_file, 'r') as f:
-                cases = json.load(f)
-                
-            # Join with patient data
-            for case in cases:
-                patient = next((p for p in patients if p['id'] == case['patient_id']), None)
-                if patient:
-                    case['patient'] = patient
-                    
-            return cases
-        return []
+    @staticmethod
+    def _filter_cases(query, patient_id, valve_site, since, until):
+        if patient_id is not None:
+            query = query.eq('patient_id', patient_id)
+        if valve_site is not None:
+            query = query.eq('valve_site', valve_site)
+        if since is not None:
+            query = query.gte('created_at', date_bound(since))
+        if until is not None:
+            query = query.lt('created_at', date_bound(until))
+        return query
+
+@lru_cache(maxsize=None)
+def get_db() -> SupabaseManager:
+    """Global database instance, created on first use"""
+    return SupabaseManager()
 
-# Global database instance
-db = SupabaseManager()
\ No newline at end of file
+def __getattr__(name: str):
+    # `from database import db` keeps working but builds the client only when first imported
+    if name == 'db':
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
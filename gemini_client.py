@@ -0,0 +1,596 @@
+import json
+import time
+import random
+import queue
+import asyncio
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Sequence
+
+from config import (GEMINI_MAX_CONCURRENCY, GEMINI_TIMEOUT_SECONDS, GEMINI_DEADLINE_SECONDS, GEMINI_MAX_RETRIES,
+                    GEMINI_BACKOFF_BASE_SECONDS, GEMINI_BACKOFF_MAX_SECONDS, GEMINI_REQUESTS_PER_MINUTE,
+                    GEMINI_BREAKER_WINDOW, GEMINI_BREAKER_MIN_CALLS, GEMINI_BREAKER_ERROR_RATE,
+                    GEMINI_BREAKER_SLOW_CALL_SECONDS, GEMINI_BREAKER_SLOW_CALL_RATE, GEMINI_BREAKER_OPEN_SECONDS,
+                    GEMINI_BREAKER_HALF_OPEN_CALLS, GEMINI_HEDGE_ENABLED, GEMINI_HEDGE_PERCENTILE,
+                    GEMINI_HEDGE_MIN_SAMPLES, GEMINI_HEDGE_DEFAULT_SECONDS)
+from metrics import metrics
+
+# HTTP / gRPC status codes worth retrying: rate limited or transient server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'Aborted'
+}
+
+def is_retryable(error: BaseException) -> bool:
+    """True for timeouts, connection problems, rate limiting and 5xx errors"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    code = getattr(error, 'code', None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            code = None
+    code = getattr(code, 'value', code)
+    if isinstance(code, tuple):
+        code = code[0]
+    return code in RETRYABLE_STATUS_CODES or getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+class CircuitOpenError(Exception):
+    """Raised without contacting the backend while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a sliding window of call outcomes.
+
+    The breaker opens when, over the last `window` calls (and at least
+    `min_calls`), the error rate or the rate of calls slower than
+    `slow_call_seconds` reaches its threshold. While open every request is
+    rejected immediately; after `open_seconds` up to `half_open_calls` trial
+    requests are let through and the first outcome decides whether to close
+    again or re-open. State and transitions are published to metrics.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self,
+                 name: str = 'gemini',
+                 window: int = GEMINI_BREAKER_WINDOW,
+                 min_calls: int = GEMINI_BREAKER_MIN_CALLS,
+                 error_rate_threshold: float = GEMINI_BREAKER_ERROR_RATE,
+                 slow_call_seconds: float = GEMINI_BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate_threshold: float = GEMINI_BREAKER_SLOW_CALL_RATE,
+                 open_seconds: float = GEMINI_BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = GEMINI_BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # (failed, slow)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trials_in_flight = 0
+        metrics.set_gauge(f'{self.name}.circuit_state', self._state)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a request may go to the backend now"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    metrics.increment(f'{self.name}.circuit_rejections')
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._trials_in_flight >= self.half_open_calls:
+                    metrics.increment(f'{self.name}.circuit_rejections')
+                    return False
+                self._trials_in_flight += 1
+            return True
+
+    def record_success(self, latency: float):
+        """Report a completed call"""
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trials_in_flight = max(0, self._trials_in_flight - 1)
+                if slow:
+                    self._open()
+                else:
+                    self._outcomes.clear()
+                    self._transition(self.CLOSED)
+                return
+            self._outcomes.append((False, slow))
+            self._evaluate()
+
+    def record_failure(self):
+        """Report a failed call"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trials_in_flight = max(0, self._trials_in_flight - 1)
+                self._open()
+                return
+            self._outcomes.append((True, False))
+            self._evaluate()
+
+    def release_trial(self):
+        """Give back a half-open trial slot without an outcome (the call was cancelled)"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trials_in_flight = max(0, self._trials_in_flight - 1)
+
+    def _evaluate(self):
+        if self._state != self.CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        calls = len(self._outcomes)
+        error_rate = sum(failed for failed, _ in self._outcomes) / calls
+        slow_rate = sum(slow for _, slow in self._outcomes) / calls
+        if error_rate >= self.error_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._trials_in_flight = 0
+        self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        if state == self._state:
+            return
+        print(f"Circuit breaker '{self.name}': {self._state} -> {state}")
+        metrics.increment(f'{self.name}.circuit_transitions.{self._state}_to_{state}')
+        metrics.set_gauge(f'{self.name}.circuit_state', state)
+        self._state = state
+
+class TokenBucket:
+    """Asyncio token bucket: at most `rate` requests per `period` seconds, bursting to `capacity`"""
+
+    def __init__(self, rate: float, period: float = 60.0, capacity: Optional[float] = None):
+        self.fill_rate = rate / period
+        self.capacity = capacity if capacity is not None else max(1.0, rate / 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.fill_rate)
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available right now"""
+        if self._lock.locked():
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+class AsyncGeminiClient:
+    """Bounded, rate-limited and retrying front end for a Gemini model.
+
+    All requests run on one private event loop thread, so the concurrency
+    cap and the token bucket are global to the process no matter how many
+    Streamlit sessions or event loops call in. Each attempt has its own
+    timeout, the whole call has a deadline, and retryable failures back off
+    exponentially with full jitter.
+
+    A CircuitBreaker short-circuits attempts while the backend is failing
+    (CircuitOpenError), and with hedging enabled an attempt still running
+    after the recent p95 latency gets a second, identical request; the first
+    answer wins. Hedges only use spare concurrency and rate-limit budget.
+
+    stream() yields reply text chunk by chunk under the same limits; a
+    stream is retried only if it failed before its first chunk arrived.
+    """
+
+    def __init__(self,
+                 model: Any,
+                 max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 timeout: float = GEMINI_TIMEOUT_SECONDS,
+                 deadline: float = GEMINI_DEADLINE_SECONDS,
+                 max_retries: int = GEMINI_MAX_RETRIES,
+                 backoff_base: float = GEMINI_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = GEMINI_BACKOFF_MAX_SECONDS,
+                 requests_per_minute: Optional[float] = GEMINI_REQUESTS_PER_MINUTE,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedge: bool = GEMINI_HEDGE_ENABLED,
+                 hedge_percentile: float = GEMINI_HEDGE_PERCENTILE,
+                 hedge_min_samples: int = GEMINI_HEDGE_MIN_SAMPLES,
+                 hedge_default_delay: float = GEMINI_HEDGE_DEFAULT_SECONDS):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests_per_minute = requests_per_minute
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._semaphore = None
+        self._bucket = None
+
+    def generate(self, contents: Sequence, **kwargs) -> Any:
+        """Blocking call from any thread; returns the model response"""
+        return asyncio.run_coroutine_threadsafe(self._generate(contents, **kwargs), self._ensure_loop()).result()
+
+    async def generate_async(self, contents: Sequence, **kwargs) -> Any:
+        """Awaitable call from any event loop; returns the model response"""
+        future = asyncio.run_coroutine_threadsafe(self._generate(contents, **kwargs), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    def count_tokens(self, contents: Sequence) -> Any:
+        """Blocking count_tokens_async on the private loop, under the per-attempt timeout.
+
+        No generation and no rate-limit token; used to open the loop's
+        connection before the first real request.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(self.model.count_tokens_async(contents), self.timeout), self._ensure_loop()
+        ).result()
+
+    def stream(self, contents: Sequence, **kwargs) -> Iterator[str]:
+        """Blocking iterator over the reply text chunks (generate_content(stream=True))"""
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._stream(contents, chunks.put, **kwargs), self._ensure_loop())
+        future.add_done_callback(lambda _: chunks.put(_STREAM_END))
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is _STREAM_END:
+                    break
+                yield chunk
+            future.result()
+        finally:
+            future.cancel()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the private event loop thread on first use"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    if self.requests_per_minute:
+                        self._bucket = TokenBucket(self.requests_per_minute)
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="gemini-client", daemon=True).start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    async def _generate(self, contents: Sequence, **kwargs) -> Any:
+        """Rate limit, cap concurrency, time out and retry one request"""
+        started = time.monotonic()
+        attempt = 0
+        metrics.increment('gemini.requests')
+
+        while True:
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                metrics.increment('gemini.deadline_exceeded')
+                raise asyncio.TimeoutError(f"Gemini call exceeded its {self.deadline:.0f}s deadline")
+
+            try:
+                if self._bucket:
+                    await asyncio.wait_for(self._bucket.acquire(), remaining)
+                async with self._semaphore:
+                    if not self.breaker.allow_request():
+                        raise CircuitOpenError(f"Circuit breaker '{self.breaker.name}' is open")
+                    attempt_started = time.monotonic()
+                    timeout = min(self.timeout, self.deadline - (attempt_started - started))
+                    try:
+                        response = await self._attempt(contents, timeout, **kwargs)
+                    except Exception:
+                        self.breaker.record_failure()
+                        raise
+                    except BaseException:
+                        self.breaker.release_trial()  # cancelled: neither a success nor a failure
+                        raise
+                latency = time.monotonic() - attempt_started
+                self.breaker.record_success(latency)
+                metrics.observe('gemini.latency_s', latency)
+                return response
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    metrics.increment('gemini.timeouts')
+                if isinstance(e, CircuitOpenError) or attempt >= self.max_retries or not is_retryable(e):
+                    metrics.increment('gemini.errors')
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                metrics.increment('gemini.retries')
+                print(f"Gemini request failed ({type(e).__name__}: {e}); retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _stream(self, contents: Sequence, sink: Callable[[str], None], **kwargs):
+        """Like _generate, but hands each chunk to sink as it arrives.
+
+        The attempt timeout applies to the gap between chunks rather than to
+        the whole reply, and the deadline still bounds the entire call.
+        """
+        started = time.monotonic()
+        attempt = 0
+        metrics.increment('gemini.requests')
+        metrics.increment('gemini.streams')
+
+        while True:
+            delivered = False
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                metrics.increment('gemini.deadline_exceeded')
+                raise asyncio.TimeoutError(f"Gemini call exceeded its {self.deadline:.0f}s deadline")
+
+            try:
+                if self._bucket:
+                    await asyncio.wait_for(self._bucket.acquire(), remaining)
+                async with self._semaphore:
+                    if not self.breaker.allow_request():
+                        raise CircuitOpenError(f"Circuit breaker '{self.breaker.name}' is open")
+                    attempt_started = time.monotonic()
+                    try:
+                        chunks = self._call_stream(contents, **kwargs).__aiter__()
+                        while True:
+                            timeout = min(self.timeout, self.deadline - (time.monotonic() - started))
+                            try:
+                                text = await asyncio.wait_for(chunks.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                break
+                            if not delivered:
+                                metrics.observe('gemini.time_to_first_chunk_s', time.monotonic() - attempt_started)
+                            delivered = True
+                            sink(text)
+                    except Exception:
+                        self.breaker.record_failure()
+                        raise
+                    except BaseException:
+                        self.breaker.release_trial()  # cancelled, e.g. the reader closed stream()
+                        raise
+                latency = time.monotonic() - attempt_started
+                self.breaker.record_success(latency)
+                metrics.observe('gemini.latency_s', latency)
+                return
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    metrics.increment('gemini.timeouts')
+                if (delivered or isinstance(e, CircuitOpenError) or attempt >= self.max_retries
+                        or not is_retryable(e)):
+                    metrics.increment('gemini.errors')
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                metrics.increment('gemini.retries')
+                print(f"Gemini stream failed ({type(e).__name__}: {e}); retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _call_stream(self, contents: Sequence, **kwargs) -> AsyncIterator[str]:
+        """Text of each streamed chunk, natively async when the model supports it"""
+        if hasattr(self.model, 'generate_content_async'):
+            response = await self.model.generate_content_async(contents, stream=True, **kwargs)
+            async for chunk in response:
+                text = _chunk_text(chunk)
+                if text:
+                    yield text
+            return
+
+        response = await asyncio.to_thread(self.model.generate_content, contents, stream=True, **kwargs)
+        iterator = iter(response)
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, _STREAM_END)
+            if chunk is _STREAM_END:
+                return
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+
+    async def _attempt(self, contents: Sequence, timeout: float, **kwargs) -> Any:
+        """One logical attempt: a single request, or a primary plus a hedge"""
+        if not self.hedge:
+            return await asyncio.wait_for(self._call(contents, **kwargs), timeout)
+
+        started = time.monotonic()
+        tasks = {asyncio.ensure_future(self._call(contents, **kwargs))}
+        hedge_task = None
+        last_error = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=min(self._hedge_delay(), timeout))
+            if not done and self._reserve_hedge():
+                metrics.increment('gemini.hedged_requests')
+                hedge_task = asyncio.ensure_future(self._hedge_call(contents, **kwargs))
+                tasks.add(hedge_task)
+
+            while tasks:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                done, tasks = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            metrics.increment('gemini.hedge_wins')
+                        return task.result()
+                    last_error = task.exception()
+            if last_error is not None and not tasks:
+                raise last_error
+            raise asyncio.TimeoutError(f"Gemini attempt exceeded {timeout:.0f}s")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _hedge_delay(self) -> float:
+        """Recent p95 latency once enough samples exist, else the configured budget"""
+        latencies = metrics.snapshot()['samples'].get('gemini.latency_s')
+        if latencies and latencies['count'] >= self.hedge_min_samples:
+            return metrics.percentile('gemini.latency_s', self.hedge_percentile)
+        return self.hedge_default_delay
+
+    def _reserve_hedge(self) -> bool:
+        """A hedge needs a free concurrency slot and a rate-limit token right now"""
+        if self._semaphore.locked():
+            return False
+        if self._bucket and not self._bucket.try_acquire():
+            return False
+        return True
+
+    async def _hedge_call(self, contents: Sequence, **kwargs) -> Any:
+        async with self._semaphore:
+            return await self._call(contents, **kwargs)
+
+    async def _call(self, contents: Sequence, **kwargs) -> Any:
+        """One attempt, natively async when the model supports it"""
+        if hasattr(self.model, 'generate_content_async'):
+            return await self.model.generate_content_async(contents, **kwargs)
+        return await asyncio.to_thread(self.model.generate_content, contents, **kwargs)
+
+_STREAM_END = object()
+
+def _chunk_text(chunk: Any) -> str:
+    """Chunk text; chunks without text parts (e.g. a final finish_reason) raise ValueError"""
+    try:
+        return chunk.text
+    except ValueError:
+        return ''
+
+class FakeServiceUnavailable(Exception):
+    """Retryable fault raised by FakeGenerativeModel"""
+    code = 503
+
+class FakeResponse:
+    """Minimal stand-in for a generate_content response"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeStreamResponse:
+    """Stand-in for a stream=True response: the reply split into chunks with a delay before each"""
+
+    def __init__(self, text: str, chunks: int, delay: float):
+        size = max(1, -(-len(text) // max(1, chunks)))
+        self.chunks = [FakeResponse(text[i:i + size]) for i in range(0, len(text), size)]
+        self.delay = delay
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            time.sleep(self.delay)
+            yield chunk
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield chunk
+
+class FakeGenerativeModel:
+    """Local stand-in for genai.GenerativeModel that injects latency and faults.
+
+    `faults` is a list of exceptions raised by successive calls before the
+    model starts answering; `failure_rate` adds random FakeServiceUnavailable
+    errors. Calls are counted in `calls`. Without an explicit response_text
+    the reply is prose, or a schema-valid JSON diagnosis when the call asks
+    for response_mime_type application/json. With stream=True the reply
+    arrives in `stream_chunks` pieces spread over the latency.
+    """
+
+    TEXT_RESPONSE = "Normal heart sounds. Confidence: 90%"
+    JSON_RESPONSE = json.dumps({
+        'diagnosis_code': 'Normal',
+        'confidence_level': 90,
+        'severity': 'None',
+        'findings': ['Normal S1 and S2', 'No murmurs detected'],
+        'recommendations': ['Continue routine monitoring'],
+        'follow_up': 'Routine follow-up in 1 year'
+    })
+
+    def __init__(self,
+                 response_text: Optional[str] = None,
+                 latency: float = 0.0,
+                 latency_jitter: float = 0.0,
+                 faults: Optional[List[BaseException]] = None,
+                 failure_rate: float = 0.0,
+                 seed: Optional[int] = None,
+                 stream_chunks: int = 8):
+        self.response_text = response_text
+        self.stream_chunks = stream_chunks
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.faults = list(faults or [])
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _next_outcome(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            if self.faults:
+                return delay, self.faults.pop(0)
+            if self._random.random() < self.failure_rate:
+                return delay, FakeServiceUnavailable("Injected fault")
+            return delay, None
+
+    def _response_text(self, generation_config: Optional[dict]) -> str:
+        if self.response_text is not None:
+            return self.response_text
+        if (generation_config or {}).get('response_mime_type') == 'application/json':
+            return self.JSON_RESPONSE
+        return self.TEXT_RESPONSE
+
+    def generate_content(self, contents: Sequence, generation_config: Optional[dict] = None,
+                         stream: bool = False, **kwargs) -> Any:
+        delay, fault = self._next_outcome()
+        if stream:
+            delay /= self.stream_chunks + 1
+        time.sleep(delay)
+        if fault:
+            raise fault
+        if stream:
+            return FakeStreamResponse(self._response_text(generation_config), self.stream_chunks, delay)
+        return FakeResponse(self._response_text(generation_config))
+
+    async def generate_content_async(self, contents: Sequence, generation_config: Optional[dict] = None,
+                                     stream: bool = False, **kwargs) -> Any:
+        delay, fault = self._next_outcome()
+        if stream:
+            delay /= self.stream_chunks + 1
+        await asyncio.sleep(delay)
+        if fault:
+            raise fault
+        if stream:
+            return FakeStreamResponse(self._response_text(generation_config), self.stream_chunks, delay)
+        return FakeResponse(self._response_text(generation_config))
@@ -0,0 +1,178 @@
+import numpy as np
+from scipy.signal import find_peaks
+from typing import Dict, Tuple
+
+# Envelope resolution and physiological limits
+ENVELOPE_WINDOW_S = 0.02
+ENVELOPE_HOP_S = 0.01
+MIN_HEART_RATE = 30
+MAX_HEART_RATE = 200
+MIN_SOUND_GAP_S = 0.12  # closest plausible S1-S2 spacing
+SOUND_HALF_WIDTH_S = 0.05  # excluded around each sound when measuring murmur energy
+
+BEAT_FEATURE_NAMES = (
+    'rr_interval_s',
+    'systole_s',
+    'diastole_s',
+    'systolic_energy',
+    'diastolic_energy',
+    's1_amplitude',
+    's2_amplitude'
+)
+
+def shannon_envelope(audio_data: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, float]:
+    """Z-scored average Shannon energy over sliding windows, and its sample rate.
+
+    Shannon energy (-x^2 log x^2 of the peak-normalized signal) emphasizes
+    medium-intensity heart sounds over low noise and isolated spikes. Window
+    means come from one cumulative sum, so the cost is linear in length.
+    """
+    audio_data = np.asarray(audio_data, dtype=np.float64)
+    peak = np.max(np.abs(audio_data)) if audio_data.size else 0.0
+    if peak == 0:
+        return np.zeros(0), 1 / ENVELOPE_HOP_S
+
+    squared = (audio_data / peak) ** 2
+    energy = -squared * np.log(squared + 1e-12)
+
+    window = max(1, int(round(ENVELOPE_WINDOW_S * sample_rate)))
+    hop = max(1, int(round(ENVELOPE_HOP_S * sample_rate)))
+    if energy.size < window:
+        return np.zeros(0), sample_rate / hop
+
+    cumulative = np.concatenate([[0.0], np.cumsum(energy)])
+    starts = np.arange(0, energy.size - window + 1, hop)
+    envelope = (cumulative[starts + window] - cumulative[starts]) / window
+
+    std = np.std(envelope)
+    envelope = (envelope - np.mean(envelope)) / std if std > 0 else np.zeros_like(envelope)
+    return envelope, sample_rate / hop
+
+def estimate_cycle_period(envelope: np.ndarray, envelope_rate: float) -> float:
+    """Cardiac cycle length (s) from the strongest envelope autocorrelation peak, or NaN"""
+    min_lag = int(envelope_rate * 60 / MAX_HEART_RATE)
+    max_lag = int(envelope_rate * 60 / MIN_HEART_RATE)
+    if envelope.size <= min_lag + 1:
+        return float('nan')
+
+    size = 1 << int(2 * envelope.size - 1).bit_length()
+    spectrum = np.fft.rfft(envelope, size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:envelope.size]
+    if autocorrelation[0] <= 0:
+        return float('nan')
+
+    lags = autocorrelation[min_lag:min(max_lag, envelope.size - 1) + 1]
+    return float((min_lag + np.argmax(lags)) / envelope_rate)
+
+def segment_heart_sounds(audio_data: np.ndarray, sample_rate: int) -> Dict:
+    """Locate S1/S2 sounds and derive heart rate, HRV and per-beat features.
+
+    Peaks of the Shannon envelope are labelled S1 when the gap to the next
+    sound is shorter than half the autocorrelation cycle (systole is the
+    shorter interval), S2 otherwise. Returns onset times in seconds, heart
+    rate (BPM, NaN if no rhythm was found), SDNN/RMSSD in ms and a
+    (beats, len(BEAT_FEATURE_NAMES)) matrix with one row per complete cycle.
+    """
+    audio_data = np.asarray(audio_data, dtype=np.float64)
+    envelope, envelope_rate = shannon_envelope(audio_data, sample_rate)
+    period = estimate_cycle_period(envelope, envelope_rate)
+
+    result = {
+        's1_onsets': np.zeros(0),
+        's2_onsets': np.zeros(0),
+        'cycle_period_s': period,
+        'heart_rate': 60 / period if period > 0 else float('nan'),
+        'sdnn_ms': float('nan'),
+        'rmssd_ms': float('nan'),
+        'beat_features': np.zeros((0, len(BEAT_FEATURE_NAMES))),
+        'beat_feature_names': BEAT_FEATURE_NAMES
+    }
+    if not period > 0:
+        return result
+
+    peaks, properties = find_peaks(envelope, height=0.5, prominence=0.5,
+                                   distance=max(1, int(MIN_SOUND_GAP_S * envelope_rate)))
+    if peaks.size < 2:
+        return result
+
+    # S1 starts the short (systolic) interval, S2 the long (diastolic) one
+    gaps = np.diff(peaks) / envelope_rate
+    is_s1 = np.empty(peaks.size, dtype=bool)
+    is_s1[:-1] = gaps < period / 2
+    is_s1[-1] = not is_s1[-2]
+
+    # Beats: an S1 immediately followed by an S2
+    first = np.flatnonzero(is_s1[:-1] & ~is_s1[1:])
+    s1_peaks, s2_peaks = peaks[first], peaks[first + 1]
+    s1_heights = properties['peak_heights'][first]
+    s2_heights = properties['peak_heights'][first + 1]
+
+    # Onset: start of the above-mean run that contains the peak
+    above = envelope > 0
+    run_starts = np.flatnonzero(np.diff(above.astype(np.int8), prepend=0) == 1)
+    def onsets(peak_indices: np.ndarray) -> np.ndarray:
+        index = np.searchsorted(run_starts, peak_indices, side='right') - 1
+        return np.where(index >= 0, run_starts[np.maximum(index, 0)], peak_indices) / envelope_rate
+
+    hop = sample_rate / envelope_rate
+    s1_times, s2_times = onsets(s1_peaks), onsets(s2_peaks)
+    result['s1_onsets'], result['s2_onsets'] = s1_times, s2_times
+
+    # Consecutive beats with a plausible RR interval (a missed sound would double it)
+    rr = np.diff(s1_times)
+    valid = (rr > 0.5 * period) & (rr < 1.5 * period)
+    if np.count_nonzero(valid) >= 2:
+        intervals = rr[valid]
+        result['heart_rate'] = float(60 / np.median(intervals))
+        result['sdnn_ms'] = float(np.std(intervals) * 1000)
+        successive = np.diff(rr)[valid[:-1] & valid[1:]]
+        if successive.size:
+            result['rmssd_ms'] = float(np.sqrt(np.mean(successive ** 2)) * 1000)
+
+    beats = np.flatnonzero(valid)
+    if beats.size:
+        # Mean power between the sounds, from one cumulative sum of x^2
+        cumulative = np.concatenate([[0.0], np.cumsum(audio_data ** 2)])
+        margin = int(SOUND_HALF_WIDTH_S * sample_rate)
+        s1_center = (s1_peaks[beats] * hop + ENVELOPE_WINDOW_S * sample_rate / 2).astype(np.int64)
+        s2_center = (s2_peaks[beats] * hop + ENVELOPE_WINDOW_S * sample_rate / 2).astype(np.int64)
+        next_s1 = (s1_peaks[beats + 1] * hop + ENVELOPE_WINDOW_S * sample_rate / 2).astype(np.int64)
+
+        def mean_power(start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+            start = np.clip(start + margin, 0, audio_data.size)
+            stop = np.clip(stop - margin, 0, audio_data.size)
+            length = stop - start
+            return np.where(length > 0, (cumulative[stop] - cumulative[start]) / np.maximum(length, 1), 0.0)
+
+        result['beat_features'] = np.column_stack([
+            rr[beats],
+            s2_times[beats] - s1_times[beats],
+            s1_times[beats + 1] - s2_times[beats],
+            mean_power(s1_center, s2_center),
+            mean_power(s2_center, next_s1),
+            s1_heights[beats],
+            s2_heights[beats]
+        ])
+
+    return result
+
+def beat_summary(segmentation: Dict) -> Dict[str, float]:
+    """Scalar rhythm features from a segment_heart_sounds result (NaN when unavailable)"""
+    beats = segmentation['beat_features']
+    columns = {name: beats[:, i] for i, name in enumerate(BEAT_FEATURE_NAMES)}
+    summary = {
+        'heart_rate': segmentation['heart_rate'],
+        'hrv_sdnn_ms': segmentation['sdnn_ms'],
+        'hrv_rmssd_ms': segmentation['rmssd_ms'],
+        'beat_count': float(len(beats))
+    }
+    if len(beats):
+        summary['systole_diastole_ratio'] = float(np.median(columns['systole_s'] / columns['diastole_s']))
+        systolic, diastolic = np.mean(columns['systolic_energy']), np.mean(columns['diastolic_energy'])
+        summary['systolic_diastolic_energy_ratio'] = float(systolic / diastolic) if diastolic > 0 else float('nan')
+        summary['s1_s2_amplitude_ratio'] = float(np.median(columns['s1_amplitude'] / columns['s2_amplitude']))
+    else:
+        summary['systole_diastole_ratio'] = float('nan')
+        summary['systolic_diastolic_energy_ratio'] = float('nan')
+        summary['s1_s2_amplitude_ratio'] = float('nan')
+    return summary
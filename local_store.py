@@ -0,0 +1,442 @@
+"""Local patient and case storage used when Supabase is not configured.
+
+SQLiteStore keeps both tables in one SQLite database in WAL mode, so a
+save is a single indexed insert and concurrent Streamlit sessions do not
+overwrite each other. JsonStore is the original whole-file JSON storage.
+
+Usage (one-shot import of the legacy JSON files; also done automatically
+the first time the SQLite store is opened):
+    python local_store.py migrate [--db local_store.db] [--patients local_patients.json] [--cases local_cases.json]
+"""
+import os
+import json
+import uuid
+import sqlite3
+import argparse
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from config import LOCAL_STORAGE_BACKEND, LOCAL_DB_PATH, LOCAL_PATIENTS_FILE, LOCAL_CASES_FILE
+
+PATIENT_COLUMNS = ('id', 'name', 'age', 'gender', 'height', 'weight', 'bmi', 'phone', 'clinical_notes', 'created_at')
+CASE_COLUMNS = ('patient_id', 'valve_site', 'audio_filename', 'diagnosis', 'confidence_level', 'severity',
+                'recommendations', 'created_at')
+
+# Date range bounds: ISO text, or a date/datetime. since is inclusive, until exclusive
+DateBound = Union[str, date, datetime]
+
+# Keyset pagination cursor: (created_at, id) of the last row of the previous page
+Cursor = Tuple[str, Union[int, str]]
+
+# Case fields stored as JSON text
+CASE_JSON_COLUMNS = ('diagnosis', 'recommendations')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    age INTEGER,
+    gender TEXT,
+    height REAL,
+    weight REAL,
+    bmi REAL,
+    phone TEXT,
+    clinical_notes TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT,
+    valve_site TEXT,
+    audio_filename TEXT,
+    diagnosis TEXT,
+    confidence_level REAL,
+    severity TEXT,
+    recommendations TEXT,
+    created_at TEXT NOT NULL
+);
+DROP INDEX IF EXISTS idx_patients_created_at;
+CREATE INDEX IF NOT EXISTS idx_patients_created_id ON patients (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_cases_patient_id ON cases (patient_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_cases_created_at ON cases (created_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+INSERT_PATIENT = f"INSERT OR IGNORE INTO patients ({', '.join(PATIENT_COLUMNS)}) VALUES ({', '.join('?' * len(PATIENT_COLUMNS))})"
+INSERT_CASE = f"INSERT INTO cases ({', '.join(CASE_COLUMNS)}) VALUES ({', '.join('?' * len(CASE_COLUMNS))})"
+
+class SQLiteStore:
+    """Patients and cases in a WAL-mode SQLite database.
+
+    Each thread gets its own connection; WAL lets readers run alongside the
+    single writer, and the connection timeout makes concurrent writers wait
+    instead of failing. Statements are constant SQL with bound parameters, so sqlite3
+    compiles each once per connection and reuses it. Batch saves insert all
+    rows in one transaction. Lookups by patient and the newest-first history
+    are served by the (patient_id, created_at) and created_at indexes, so
+    their cost does not grow with the size of the archive.
+    """
+
+    def __init__(self, path: str = LOCAL_DB_PATH, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, cached_statements=256)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+            self._local.connection = connection
+        return connection
+
+    def save_patient(self, patient_data: Dict) -> str:
+        """Insert a patient; sets and returns patient_data['id']"""
+        return self.save_patients([patient_data])[0]
+
+    def save_patients(self, patients: Sequence[Dict]) -> List[str]:
+        """Insert many patients in one transaction; returns their ids"""
+        rows = [_patient_row(patient) for patient in patients]
+        with self._connection() as connection:
+            connection.executemany(INSERT_PATIENT, rows)
+        return [patient['id'] for patient in patients]
+
+    def save_case(self, case_data: Dict) -> bool:
+        """Insert a diagnosis case"""
+        return self.save_cases([case_data]) == 1
+
+    def save_cases(self, cases: Sequence[Dict]) -> int:
+        """Insert many cases in one transaction; returns the number inserted"""
+        rows = [_case_row(case) for case in cases]
+        with self._connection() as connection:
+            connection.executemany(INSERT_CASE, rows)
+        return len(rows)
+
+    def get_all_patients(self,
+                         limit: Optional[int] = None,
+                         cursor: Optional[Cursor] = None,
+                         search: Optional[str] = None) -> List[Dict]:
+        """Patients newest first; with limit, one keyset page starting after cursor.
+
+        With search, only patients whose name contains it (case-insensitive)
+        or whose id starts with it.
+        """
+        where, params = _keyset(cursor, newest_first=True)
+        if search:
+            pattern = _like_escape(search)
+            where.append("(name LIKE ? ESCAPE '\\' OR id LIKE ? ESCAPE '\\')")
+            params += [f"%{pattern}%", f"{pattern}%"]
+        rows = self._connection().execute(
+            f"SELECT * FROM patients{_where(where)} ORDER BY created_at DESC, id DESC LIMIT ?",
+            params + _limit(limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_patient_cases(self, patient_id: str) -> List[Dict]:
+        """Cases of one patient, newest first"""
+        rows = self._connection().execute(
+            "SELECT * FROM cases WHERE patient_id = ? ORDER BY created_at DESC", (patient_id,)).fetchall()
+        return [_case_dict(row) for row in rows]
+
+    def get_case_history(self,
+                         patient_id: Optional[str] = None,
+                         valve_site: Optional[str] = None,
+                         since: Optional[DateBound] = None,
+                         until: Optional[DateBound] = None,
+                         newest_first: bool = True,
+                         limit: Optional[int] = None,
+                         cursor: Optional[Cursor] = None) -> List[Dict]:
+        """Cases matching the filters, each with its patient under 'patient'.
+
+        Filtering and ordering run in SQL on the created_at and (patient_id,
+        created_at) indexes. Patients are then fetched once per distinct id
+        by primary key and joined through a dict, so the join is linear in
+        the number of cases returned. With limit, only the page after cursor
+        is read: the keyset condition seeks into the index, so every page
+        costs the same however deep it is.
+        """
+        clauses, params = _case_filters(patient_id, valve_site, since, until)
+        keyset, keyset_params = _keyset(cursor, newest_first)
+        direction = 'DESC' if newest_first else 'ASC'
+        rows = self._connection().execute(
+            f"SELECT * FROM cases{_where(clauses + keyset)} ORDER BY created_at {direction}, id {direction} LIMIT ?",
+            params + keyset_params + _limit(limit)).fetchall()
+        cases = [_case_dict(row) for row in rows]
+        patients = self._patients_by_id({case['patient_id'] for case in cases})
+        for case in cases:
+            if case['patient_id'] in patients:
+                case['patient'] = patients[case['patient_id']]
+        return cases
+
+    def count_patients(self) -> int:
+        """Number of patients, without loading them"""
+        return self._connection().execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+
+    def count_cases(self,
+                    patient_id: Optional[str] = None,
+                    valve_site: Optional[str] = None,
+                    since: Optional[DateBound] = None,
+                    until: Optional[DateBound] = None) -> int:
+        """Number of cases matching the get_case_history filters"""
+        clauses, params = _case_filters(patient_id, valve_site, since, until)
+        return self._connection().execute(f"SELECT COUNT(*) FROM cases{_where(clauses)}", params).fetchone()[0]
+
+    def _patients_by_id(self, patient_ids: Iterable[str]) -> Dict[str, Dict]:
+        patient_ids = [patient_id for patient_id in patient_ids if patient_id is not None]
+        patients = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(patient_ids), 500):
+            chunk = patient_ids[start:start + 500]
+            rows = self._connection().execute(
+                f"SELECT * FROM patients WHERE id IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+            patients.update((row['id'], dict(row)) for row in rows)
+        return patients
+
+    def migrate_json(self,
+                     patients_file: str = LOCAL_PATIENTS_FILE,
+                     cases_file: str = LOCAL_CASES_FILE) -> Optional[Dict[str, int]]:
+        """Import the legacy JSON files in one transaction.
+
+        Runs once per database: later calls return None. The JSON files are
+        left in place.
+        """
+        patients = _load_json(patients_file)
+        cases = _load_json(cases_file)
+        with self._connection() as connection:
+            # Claiming the marker first takes the write lock, so concurrent migrators cannot both import
+            claimed = connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                                         (datetime.now().isoformat(),)).rowcount
+            if not claimed:
+                return None
+            connection.executemany(INSERT_PATIENT, [_patient_row(patient) for patient in patients if patient.get('id')])
+            connection.executemany(INSERT_CASE, [_case_row(case) for case in cases])
+        return {'patients': len(patients), 'cases': len(cases)}
+
+    def close(self):
+        """Close this thread's connection"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+class JsonStore:
+    """Legacy storage: each table is one JSON file, rewritten on every save"""
+
+    def __init__(self, patients_file: str = LOCAL_PATIENTS_FILE, cases_file: str = LOCAL_CASES_FILE):
+        self.patients_file = patients_file
+        self.cases_file = cases_file
+        # (file stamp, {id: patient}); rebuilt when another session rewrites the file
+        self._patient_index = (None, {})
+
+    def save_patient(self, patient_data: Dict) -> str:
+        patients = _load_json(self.patients_file)
+        patient_data['id'] = str(uuid.uuid4())
+        patient_data['created_at'] = datetime.now().isoformat()
+        patients.append(patient_data)
+
+        with open(self.patients_file, 'w') as f:
+            json.dump(patients, f, indent=2)
+
+        return patient_data['id']
+
+    def save_case(self, case_data: Dict) -> bool:
+        cases = _load_json(self.cases_file)
+        case_data['created_at'] = datetime.now().isoformat()
+        cases.append(case_data)
+
+        with open(self.cases_file, 'w') as f:
+            json.dump(cases, f, indent=2)
+
+        return True
+
+    def get_all_patients(self,
+                         limit: Optional[int] = None,
+                         cursor: Optional[Cursor] = None,
+                         search: Optional[str] = None) -> List[Dict]:
+        patients = _load_json(self.patients_file)
+        if search:
+            patients = [patient for patient in patients if _patient_matches(patient, search)]
+        patients.sort(key=_row_key, reverse=True)
+        return _page(patients, limit, cursor, newest_first=True)
+
+    def get_patient_cases(self, patient_id: str) -> List[Dict]:
+        return [case for case in _load_json(self.cases_file) if case.get('patient_id') == patient_id]
+
+    def get_case_history(self,
+                         patient_id: Optional[str] = None,
+                         valve_site: Optional[str] = None,
+                         since: Optional[DateBound] = None,
+                         until: Optional[DateBound] = None,
+                         newest_first: bool = True,
+                         limit: Optional[int] = None,
+                         cursor: Optional[Cursor] = None) -> List[Dict]:
+        """Matching cases with their patient joined through the id index; only the matches are sorted.
+
+        Cases have no stored id, so their position in the file serves as one.
+        """
+        patients = self._patients_by_id()
+        since, until = date_bound(since), date_bound(until)
+        cases = [dict(case, id=case.get('id', position)) for position, case in enumerate(_load_json(self.cases_file))
+                 if _case_matches(case, patient_id, valve_site, since, until)]
+        cases.sort(key=_row_key, reverse=newest_first)
+        cases = _page(cases, limit, cursor, newest_first)
+
+        for case in cases:
+            patient = patients.get(case.get('patient_id'))
+            if patient:
+                case['patient'] = patient
+
+        return cases
+
+    def count_patients(self) -> int:
+        return len(self._patients_by_id())
+
+    def count_cases(self,
+                    patient_id: Optional[str] = None,
+                    valve_site: Optional[str] = None,
+                    since: Optional[DateBound] = None,
+                    until: Optional[DateBound] = None) -> int:
+        since, until = date_bound(since), date_bound(until)
+        return sum(1 for case in _load_json(self.cases_file)
+                   if _case_matches(case, patient_id, valve_site, since, until))
+
+    def _patients_by_id(self) -> Dict[str, Dict]:
+        """Patients keyed by id, re-read only when the patients file changes"""
+        stamp = _file_stamp(self.patients_file)
+        if self._patient_index[0] != stamp:
+            self._patient_index = (stamp, {patient['id']: patient for patient in _load_json(self.patients_file)})
+        return self._patient_index[1]
+
+def create_local_store(backend: str = LOCAL_STORAGE_BACKEND):
+    """Local store for the configured backend; the SQLite store imports the JSON files on first use"""
+    if backend == 'json':
+        return JsonStore()
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown local storage backend '{backend}', expected 'sqlite' or 'json'")
+
+    store = SQLiteStore()
+    if os.path.exists(LOCAL_PATIENTS_FILE) or os.path.exists(LOCAL_CASES_FILE):
+        migrated = store.migrate_json()
+        if migrated:
+            print(f"Migrated {migrated['patients']} patients and {migrated['cases']} cases "
+                  f"from JSON into {store.path}")
+    return store
+
+def _patient_row(patient: Dict) -> tuple:
+    patient.setdefault('id', str(uuid.uuid4()))
+    patient.setdefault('created_at', datetime.now().isoformat())
+    return tuple(patient.get(column) for column in PATIENT_COLUMNS)
+
+def _case_row(case: Dict) -> tuple:
+    case.setdefault('created_at', datetime.now().isoformat())
+    return tuple(json.dumps(case.get(column), default=str) if column in CASE_JSON_COLUMNS else case.get(column)
+                 for column in CASE_COLUMNS)
+
+def _case_dict(row: sqlite3.Row) -> Dict:
+    case = dict(row)
+    for column in CASE_JSON_COLUMNS:
+        if case[column] is not None:
+            case[column] = json.loads(case[column])
+    return case
+
+def page_cursor(rows: Sequence[Dict]) -> Optional[Cursor]:
+    """Cursor that continues after the last row of a page"""
+    return _row_key(rows[-1]) if rows else None
+
+def _case_filters(patient_id: Optional[str],
+                  valve_site: Optional[str],
+                  since: Optional[DateBound],
+                  until: Optional[DateBound]) -> Tuple[List[str], list]:
+    """WHERE conditions and parameters for the case filters; the SQL text only depends on which are set"""
+    clauses, params = [], []
+    for clause, value in (("patient_id = ?", patient_id), ("valve_site = ?", valve_site),
+                          ("created_at >= ?", date_bound(since)), ("created_at < ?", date_bound(until))):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    return clauses, params
+
+def _keyset(cursor: Optional[Cursor], newest_first: bool) -> Tuple[List[str], list]:
+    """Row-value condition selecting the rows after cursor in (created_at, id) order"""
+    if cursor is None:
+        return [], []
+    return [f"(created_at, id) {'<' if newest_first else '>'} (?, ?)"], list(cursor)
+
+def _where(clauses: List[str]) -> str:
+    return " WHERE " + " AND ".join(clauses) if clauses else ""
+
+def _limit(limit: Optional[int]) -> list:
+    return [-1 if limit is None else limit]  # a negative LIMIT means no limit
+
+def _row_key(row: Dict) -> tuple:
+    return row.get('created_at') or '', row.get('id')
+
+def _page(rows: List[Dict], limit: Optional[int], cursor: Optional[Cursor], newest_first: bool) -> List[Dict]:
+    """Keyset page of rows already sorted by _row_key"""
+    if cursor is not None:
+        cursor = tuple(cursor)
+        rows = [row for row in rows if (_row_key(row) < cursor if newest_first else _row_key(row) > cursor)]
+    return rows if limit is None else rows[:limit]
+
+def _case_matches(case: Dict,
+                  patient_id: Optional[str],
+                  valve_site: Optional[str],
+                  since: Optional[str],
+                  until: Optional[str]) -> bool:
+    created_at = case.get('created_at') or ''
+    return ((patient_id is None or case.get('patient_id') == patient_id)
+            and (valve_site is None or case.get('valve_site') == valve_site)
+            and (since is None or created_at >= since)
+            and (until is None or created_at < until))
+
+def _patient_matches(patient: Dict, search: str) -> bool:
+    """Same rule as the SQLite LIKE search: name contains search, or id starts with it"""
+    return (search.lower() in str(patient.get('name', '')).lower()
+            or str(patient.get('id', '')).lower().startswith(search.lower()))
+
+def _like_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def date_bound(value: Optional[DateBound]) -> Optional[str]:
+    """ISO text comparable with created_at; a date means the start of that day"""
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _load_json(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Import the legacy JSON storage into the SQLite store")
+    parser.add_argument('command', choices=('migrate',))
+    parser.add_argument('--db', default=LOCAL_DB_PATH)
+    parser.add_argument('--patients', default=LOCAL_PATIENTS_FILE)
+    parser.add_argument('--cases', default=LOCAL_CASES_FILE)
+    args = parser.parse_args(argv)
+
+    store = SQLiteStore(args.db)
+    migrated = store.migrate_json(args.patients, args.cases)
+    if migrated is None:
+        print(f"{args.db} already contains the JSON data; nothing to do")
+    else:
+        print(f"Migrated {migrated['patients']} patients and {migrated['cases']} cases into {args.db}")
+
+if __name__ == "__main__":
+    main()
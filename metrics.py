@@ -0,0 +1,92 @@
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import numpy as np
+
+# True while recording is suppressed; asyncio tasks, run_coroutine_threadsafe
+# callbacks and asyncio.to_thread calls inherit it from the caller
+_suppressed = ContextVar('metrics_suppressed', default=False)
+
+class MetricsRegistry:
+    """Thread-safe in-process counters, gauges and recent-value samples"""
+
+    def __init__(self, max_samples: int = 1024):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+
+    def increment(self, name: str, value: int = 1):
+        """Add to a counter"""
+        if _suppressed.get():
+            return
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value):
+        """Record the current value of a gauge"""
+        if _suppressed.get():
+            return
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """Append a sample (latency, size, ...) to a bounded window"""
+        if _suppressed.get():
+            return
+        with self._lock:
+            self._samples[name].append(float(value))
+
+    @contextmanager
+    def suppressed(self):
+        """Drop everything recorded from this context (synthetic work such as warmup)"""
+        token = _suppressed.set(True)
+        try:
+            yield
+        finally:
+            _suppressed.reset(token)
+
+    def counter(self, name: str) -> int:
+        """Current counter value (0 if never incremented)"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def gauge(self, name: str, default=None):
+        """Current gauge value"""
+        with self._lock:
+            return self._gauges.get(name, default)
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        """q-th percentile (0-100) of the recent samples, or None without samples"""
+        with self._lock:
+            values = list(self._samples.get(name, ()))
+        if not values:
+            return None
+        return float(np.percentile(values, q))
+
+    def snapshot(self) -> Dict:
+        """Copy of all counters, gauges and sample summaries"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            samples = {name: list(values) for name, values in self._samples.items()}
+
+        summaries = {}
+        for name, values in samples.items():
+            if values:
+                summaries[name] = {
+                    'count': len(values),
+                    'mean': float(np.mean(values)),
+                    'p50': float(np.percentile(values, 50)),
+                    'p95': float(np.percentile(values, 95)),
+                    'max': float(np.max(values))
+                }
+
+        return {'counters': counters, 'gauges': gauges, 'samples': summaries}
+
+# Global metrics registry
+metrics = MetricsRegistry()
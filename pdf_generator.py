@@ -8,9 +8,8 @@ from datetime import datetime
 import os
 import io
 import base64
+from functools import lru_cache
 from typing import Dict, List
-import matplotlib.pyplot as plt
-import numpy as np
 
 class MedicalReportGenerator:
     def __init__(self):
@@ -213,11 +212,14 @@ class MedicalReportGenerator:
         
         elements.append(Spacer(1, 15))
         
-        # Raw AI response (if available)
-        if diagnosis_data.get('raw_response') and not diagnosis_data.get('simulation_mode'):
+        # Prose AI report (structured replies carry it in 'report', if requested)
+        report_text = diagnosis_data.get('report')
+        if not report_text and not diagnosis_data.get('structured_output'):
+            report_text = diagnosis_data.get('raw_response')
+        if report_text and not diagnosis_data.get('simulation_mode'):
             elements.append(Paragraph("AI Analysis Report:", self.subheader_style))
             # Truncate if too long
-            response = diagnosis_data['raw_response']
+            response = report_text
             if len(response) > 1000:
                 response = response[:1000] + "..."
             elements.append(Paragraph(response, self.body_style))
@@ -327,5 +329,13 @@ class MedicalReportGenerator:
         doc.build(story)
         return output_path
 
-# Global PDF generator instance
-pdf_generator = MedicalReportGenerator()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_pdf_generator() -> MedicalReportGenerator:
+    """Global PDF generator instance, created on first use"""
+    return MedicalReportGenerator()
+
+def __getattr__(name: str):
+    # Module attribute resolved on access (PEP 562), so reportlab styles are set up only when a report is made
+    if name == 'pdf_generator':
+        return get_pdf_generator()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,114 @@
+import time
+import numpy as np
+from typing import Dict
+
+from config import QUALITY_GATE
+from metrics import metrics
+
+FRAME_SECONDS = 0.02
+
+# Issues that make a recording unusable regardless of the score
+BLOCKING_ISSUES = ('too_short', 'too_long', 'silent')
+
+def assess_quality(audio_data: np.ndarray, sample_rate: int, settings: Dict = QUALITY_GATE) -> Dict:
+    """Fast pre-flight signal-quality check of a float32 recording.
+
+    Works on 20 ms frames from one reshape of the signal: duration limits,
+    clipping ratio (plateaus at the recording's peak level), SNR from the
+    frame RMS envelope (loud frames vs the quiet floor between sounds) and
+    flat frames, which mark dropouts or a disconnected sensor. Returns
+    the measurements, a score in [0, 1], issue codes with readable reasons
+    and the decision: 'pass', 'flag' (usable, re-recording suggested) or
+    'reject'. Decisions are counted in metrics under quality.*.
+    """
+    started = time.perf_counter()
+    audio_data = np.asarray(audio_data)
+    duration = audio_data.shape[-1] / sample_rate
+    issues = {}
+
+    if duration < settings['min_duration']:
+        issues['too_short'] = f"Recording is {duration:.1f} s; at least {settings['min_duration']} s is needed"
+    if duration > settings['max_duration']:
+        issues['too_long'] = f"Recording is {duration:.0f} s; at most {settings['max_duration']} s is accepted"
+
+    frame = max(1, int(FRAME_SECONDS * sample_rate))
+    n_frames = audio_data.shape[-1] // frame
+    report = {
+        'duration_s': round(duration, 3),
+        'clipping_ratio': 0.0,
+        'snr_db': 0.0,
+        'flat_fraction': 1.0,
+        'longest_flat_s': 0.0
+    }
+
+    if n_frames:
+        frames = audio_data[:n_frames * frame].reshape(n_frames, frame)
+        magnitude = np.abs(audio_data[:n_frames * frame])
+        peak = float(np.max(magnitude))
+
+        # Flat frames: no variation beyond one 16-bit step (zeros or a stuck value)
+        flat = (np.max(frames, axis=1) - np.min(frames, axis=1)) <= settings['flat_level']
+        report['flat_fraction'] = float(np.mean(flat))
+        report['longest_flat_s'] = _longest_run(flat) * frame / sample_rate
+
+        if peak > 0 and not flat.all():
+            # Clipping shows as plateaus at the recording's peak level; clean peaks touch it briefly
+            at_peak = magnitude >= 0.999 * peak
+            clipped = np.count_nonzero(at_peak[1:-1] & at_peak[:-2] & at_peak[2:])
+            report['clipping_ratio'] = clipped / (n_frames * frame)
+
+            rms = np.sqrt(np.mean(np.square(frames[~flat], dtype=np.float32), axis=1))
+            signal, noise = np.percentile(rms, [95, 10])
+            report['snr_db'] = float(20 * np.log10(signal / max(noise, 1e-9)))
+
+    if report['flat_fraction'] >= 1.0:
+        issues['silent'] = "Recording contains no signal"
+    else:
+        if report['clipping_ratio'] > settings['max_clipping_ratio']:
+            issues['clipping'] = (f"{report['clipping_ratio']:.1%} of samples are clipped; "
+                                  f"lower the recording gain")
+        if report['snr_db'] < settings['min_snr_db']:
+            issues['low_snr'] = (f"Heart sounds are only {report['snr_db']:.1f} dB above the noise floor; "
+                                 f"check stethoscope contact and ambient noise")
+        if (report['flat_fraction'] > settings['max_flat_fraction']
+                or report['longest_flat_s'] > settings['max_flat_seconds']):
+            issues['dropouts'] = (f"Signal drops out for {report['flat_fraction']:.0%} of the recording "
+                                  f"(longest gap {report['longest_flat_s']:.1f} s)")
+
+    # Product of per-measurement scores: clipping and dropouts fall from 1 (clean)
+    # to 0 at four times their limit, SNR rises from 0 to 1 at twice its minimum
+    scores = [
+        _limit_score(report['clipping_ratio'], settings['max_clipping_ratio']),
+        float(np.clip(report['snr_db'] / (2 * settings['min_snr_db']), 0, 1)),
+        _limit_score(report['flat_fraction'], settings['max_flat_fraction'])
+    ]
+    report['score'] = round(float(np.prod(scores)), 3)
+
+    if any(issue in BLOCKING_ISSUES for issue in issues) or report['score'] < settings['min_score']:
+        decision = 'reject'
+    elif issues:
+        decision = 'flag'
+    else:
+        decision = 'pass'
+
+    report['decision'] = decision
+    report['issues'] = list(issues)
+    report['reasons'] = list(issues.values())
+    report['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    metrics.increment(f'quality.{decision}')
+    for issue in issues:
+        metrics.increment(f'quality.issue.{issue}')
+    metrics.observe('quality.score', report['score'])
+    metrics.observe('quality.latency_s', report['latency_ms'] / 1000)
+    return report
+
+def _longest_run(mask: np.ndarray) -> int:
+    """Length of the longest run of True values"""
+    if not mask.any():
+        return 0
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return int(np.max(edges[1::2] - edges[::2]))
+
+def _limit_score(value: float, limit: float) -> float:
+    return float(np.clip(1 - value / (4 * limit), 0, 1))
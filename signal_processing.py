@@ -0,0 +1,311 @@
+import numpy as np
+import librosa
+import scipy.fft
+from math import gcd
+from functools import cached_property, lru_cache
+from scipy.signal import butter, resample_poly, sosfiltfilt
+from typing import Dict, Optional, Tuple
+
+from config import FREQUENCY_BANDS, ANALYSIS_SAMPLE_RATE, PREPROCESSING, STFT_WINDOW_SECONDS
+from heart_sound_segmentation import segment_heart_sounds
+
+# Fraction of the Nyquist frequency that the polyphase anti-aliasing filter
+# passes essentially flat; band edges above it would be distorted.
+DECIMATION_PASSBAND = 0.9
+
+def check_band_coverage(sample_rate: int, bands: Dict[str, Tuple[float, float]] = FREQUENCY_BANDS):
+    """Raise ValueError if any analysis band is not fully representable at sample_rate"""
+    usable = DECIMATION_PASSBAND * sample_rate / 2
+    for name, (low, high) in bands.items():
+        if high > usable:
+            raise ValueError(
+                f"Band '{name}' ({low}-{high} Hz) exceeds the usable bandwidth "
+                f"({usable:.0f} Hz) at {sample_rate} Hz"
+            )
+
+def decimate_to_analysis_rate(audio_data: np.ndarray,
+                              sample_rate: int,
+                              target_rate: Optional[int] = ANALYSIS_SAMPLE_RATE) -> Tuple[np.ndarray, int]:
+    """Anti-aliased polyphase resampling of a PCG signal down to the analysis rate.
+
+    Signals already at or below the target rate are returned unchanged.
+    """
+    if not target_rate or sample_rate <= target_rate:
+        return audio_data, sample_rate
+    
+    check_band_coverage(target_rate)
+    
+    divisor = gcd(int(sample_rate), int(target_rate))
+    up, down = int(target_rate) // divisor, int(sample_rate) // divisor
+    resampled = resample_poly(audio_data, up, down)
+    
+    return resampled, int(target_rate)
+
+@lru_cache(maxsize=32)
+def stft_size(sample_rate: int, window_seconds: float = STFT_WINDOW_SECONDS) -> Tuple[int, int]:
+    """(n_fft, hop_length) for a window_seconds frame at sample_rate: power-of-two n_fft, quarter-frame hop"""
+    n_fft = 2 ** int(round(np.log2(window_seconds * sample_rate)))
+    return n_fft, n_fft // 4
+
+def bandpass_sos(sample_rate: int, low: float, high: float, order: int = 4) -> np.ndarray:
+    """Butterworth band-pass in second-order sections, designed once per (rate, band, order).
+
+    The array is shared between callers and must not be modified (scipy's
+    sosfilt needs a writable buffer, so it is not flagged read-only).
+    """
+    high = min(high, DECIMATION_PASSBAND * sample_rate / 2)
+    return butter(order, [low, high], btype='bandpass', fs=sample_rate, output='sos').astype(np.float32)
+
+def suppress_spikes(audio_data: np.ndarray,
+                    sample_rate: int,
+                    window_seconds: float = 0.5,
+                    threshold: float = 3.0) -> np.ndarray:
+    """Zero friction/handling spikes in place (Schmidt et al. 2010).
+
+    The signal is split into windows; while the largest window peak
+    exceeds threshold x the median window peak, the spike around that peak
+    is zeroed between the surrounding zero crossings.
+    """
+    window = int(window_seconds * sample_rate)
+    n_windows = audio_data.shape[-1] // window
+    if n_windows < 3:
+        return audio_data
+
+    frames = audio_data[:n_windows * window].reshape(n_windows, window)  # view: edits land in audio_data
+    peaks = np.max(np.abs(frames), axis=1)
+    limit = threshold * np.median(peaks)
+
+    for _ in range(4 * n_windows):
+        worst = int(np.argmax(peaks))
+        if peaks[worst] <= limit:
+            break
+        frame = frames[worst]
+        peak = int(np.argmax(np.abs(frame)))
+        crossings = np.flatnonzero(np.diff(np.signbit(frame)))
+        start = crossings[np.searchsorted(crossings, peak) - 1] + 1 if crossings.size and crossings[0] < peak else 0
+        after = crossings[crossings >= peak]
+        stop = after[0] + 1 if after.size else window
+        frame[start:stop] = 0
+        peaks[worst] = np.max(np.abs(frame))
+
+    return audio_data
+
+def preprocess_pcg(audio_data: np.ndarray,
+                   sample_rate: int,
+                   band: Tuple[float, float] = PREPROCESSING['band'],
+                   filter_order: int = PREPROCESSING['filter_order'],
+                   remove_spikes: bool = PREPROCESSING['suppress_spikes'],
+                   normalize: bool = PREPROCESSING['normalize'],
+                   inplace: bool = False) -> np.ndarray:
+    """DC removal, zero-phase band-pass, optional spike suppression and peak normalization.
+
+    Works along the last axis in float32. With inplace=True a float32 input
+    is modified where possible; the band-pass itself always returns a new
+    array, which the later steps then reuse.
+    """
+    audio_data = np.asarray(audio_data)
+    if not inplace or audio_data.dtype != np.float32:
+        audio_data = audio_data.astype(np.float32)
+    
+    audio_data -= np.mean(audio_data, axis=-1, keepdims=True, dtype=np.float64).astype(np.float32)
+    
+    sos = bandpass_sos(int(sample_rate), float(band[0]), float(band[1]), int(filter_order))
+    padlen = 3 * (2 * len(sos) + 1)
+    if audio_data.shape[-1] > padlen:
+        audio_data = np.ascontiguousarray(sosfiltfilt(sos, audio_data, axis=-1), dtype=np.float32)
+    
+    if remove_spikes:
+        for row in audio_data.reshape(-1, audio_data.shape[-1]):
+            suppress_spikes(row, sample_rate)
+    
+    if normalize:
+        peak = np.max(np.abs(audio_data), axis=-1, keepdims=True)
+        np.divide(audio_data, peak, out=audio_data, where=peak > 0)
+    
+    return audio_data
+
+class SpectralContext:
+    """Spectral representations of a PCG recording.
+
+    Built once per recording and shared by feature extraction and the
+    spectrogram renderer, so the STFT and the full-length FFT are each
+    computed at most once per analysis. audio_data may also be a 2-D stack
+    of equal-length recordings; every representation is then computed
+    along the last axis for all rows at once. n_fft and hop_length default
+    to stft_size(sample_rate).
+    """
+
+    def __init__(self,
+                 audio_data: np.ndarray,
+                 sample_rate: int,
+                 n_fft: Optional[int] = None,
+                 hop_length: Optional[int] = None,
+                 bands: Dict[str, Tuple[float, float]] = FREQUENCY_BANDS):
+        default_n_fft, default_hop = stft_size(sample_rate)
+        self.audio_data = audio_data
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft or default_n_fft
+        self.hop_length = hop_length or default_hop
+        self.bands = bands
+
+    @cached_property
+    def stft_magnitude(self) -> np.ndarray:
+        """Magnitude STFT, shape (..., 1 + n_fft // 2, frames)"""
+        return np.abs(librosa.stft(self.audio_data, n_fft=self.n_fft, hop_length=self.hop_length))
+
+    @cached_property
+    def fft_magnitude(self) -> np.ndarray:
+        """Magnitude of the one-sided full-length FFT (float32 for float32 audio)"""
+        return np.abs(scipy.fft.rfft(self.audio_data))
+
+    @cached_property
+    def fft_freqs(self) -> np.ndarray:
+        """Bin frequencies (Hz) matching fft_magnitude"""
+        return np.fft.rfftfreq(self.audio_data.shape[-1], 1 / self.sample_rate)
+
+    @cached_property
+    def band_slices(self) -> Dict[str, slice]:
+        """FFT bin slices for each configured frequency band"""
+        return {name: self.frequency_slice(low, high) for name, (low, high) in self.bands.items()}
+
+    def frequency_slice(self, low: float, high: float) -> slice:
+        """Return the FFT bin slice covering low <= f <= high (both edges inclusive)"""
+        start = int(np.searchsorted(self.fft_freqs, low, side='left'))
+        stop = int(np.searchsorted(self.fft_freqs, high, side='right'))
+        return slice(start, stop)
+
+    def band_energy(self, band: str) -> np.ndarray:
+        """Mean power (mean square per sample) inside a named band.
+
+        Parseval-scaled one-sided power spectrum, 2 |X|^2 / N^2 summed over
+        the band, so it does not grow with the recording length and a
+        Welch estimate (StreamingPCGFeatureExtractor) measures the same
+        quantity for line and noise spectra alike.
+        """
+        n = self.audio_data.shape[-1]
+        return 2 * np.sum(np.square(self.fft_magnitude[..., self.band_slices[band]], dtype=np.float64), axis=-1) / n ** 2
+
+    def dominant_frequency(self, low: float, high: float) -> np.ndarray:
+        """Frequency of the strongest FFT bin in [low, high], or 0.0 if the range is empty"""
+        band = self.frequency_slice(low, high)
+        if band.stop <= band.start:
+            return np.zeros(self.audio_data.shape[:-1])
+        return self.fft_freqs[band][np.argmax(self.fft_magnitude[..., band], axis=-1)]
+
+    def spectrogram_db(self) -> np.ndarray:
+        """STFT magnitude in dB relative to the loudest bin"""
+        return librosa.amplitude_to_db(self.stft_magnitude, ref=np.max)
+
+def compute_pcg_features(context: SpectralContext) -> Dict[str, np.ndarray]:
+    """Signal and spectral features along the last axis of context.audio_data.
+
+    Returns 0-d arrays for a single recording and one value per row for a
+    2-D stack of equal-length recordings.
+    """
+    audio_data = context.audio_data
+    sample_rate = context.sample_rate
+    
+    # Basic signal statistics
+    rms_energy = np.sqrt(np.mean(audio_data**2, axis=-1))
+    zero_crossing_rate = np.mean(librosa.feature.zero_crossing_rate(
+        audio_data, frame_length=context.n_fft, hop_length=context.hop_length), axis=(-2, -1))
+    
+    # Spectral features (shared STFT)
+    spectral_centroids = librosa.feature.spectral_centroid(S=context.stft_magnitude, sr=sample_rate)
+    spectral_rolloff = librosa.feature.spectral_rolloff(S=context.stft_magnitude, sr=sample_rate)
+    
+    # Heart rate and variability from S1/S2 segmentation (per recording, linear time)
+    rhythm = _rhythm(audio_data.reshape(-1, audio_data.shape[-1]), sample_rate)
+    rhythm = rhythm.reshape(audio_data.shape[:-1] + (3,))
+    heart_rate, sdnn, rmssd = rhythm[..., 0], rhythm[..., 1], rhythm[..., 2]
+    estimated_heart_rate = np.where(np.isfinite(heart_rate), heart_rate, 70)  # BPM, 70 by default
+    
+    features = {
+        'rms_energy': rms_energy,
+        'zero_crossing_rate': zero_crossing_rate,
+        'spectral_centroid_mean': np.mean(spectral_centroids, axis=(-2, -1)),
+        'spectral_rolloff_mean': np.mean(spectral_rolloff, axis=(-2, -1)),
+        'estimated_heart_rate': estimated_heart_rate,
+        'hrv_sdnn_ms': sdnn,  # NaN when too few beats were found
+        'hrv_rmssd_ms': rmssd
+    }
+    
+    # Frequency domain analysis (precomputed band slices of the one-sided FFT)
+    for band in context.bands:
+        features[f'{band}_freq_energy'] = context.band_energy(band)
+    
+    return features
+
+def compute_pcg_features_padded(audio_data: np.ndarray,
+                                lengths: np.ndarray,
+                                sample_rate: int,
+                                n_fft: Optional[int] = None,
+                                hop_length: Optional[int] = None,
+                                bands: Dict[str, Tuple[float, float]] = FREQUENCY_BANDS) -> Dict[str, np.ndarray]:
+    """compute_pcg_features for a zero-padded 2-D stack of recordings of any length.
+
+    Row i holds a recording of lengths[i] samples followed by zeros. RMS,
+    zero-crossing rate and the STFT features are computed for all rows in one
+    pass, averaging only the frames each row really has, so they match
+    compute_pcg_features per recording. Band energies need each recording's
+    own full-length FFT and S1/S2 segmentation runs per row, so both are
+    computed per distinct length.
+    """
+    if n_fft is None or hop_length is None:
+        n_fft, hop_length = stft_size(sample_rate)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n_rows, width = audio_data.shape
+    frame_counts = 1 + lengths // hop_length
+    
+    def masked_mean(frames: np.ndarray) -> np.ndarray:
+        valid = np.arange(frames.shape[-1]) < frame_counts[:, None]
+        return np.sum(frames * valid, axis=-1) / frame_counts
+    
+    rms_energy = np.sqrt(np.sum(np.square(audio_data, dtype=np.float64), axis=-1) / lengths)
+    
+    # librosa's ZCR frames are centered with edge padding, which adds no crossings, so a
+    # frame's count is a difference of the running crossing count over the samples it covers
+    signs = np.signbit(np.where(np.abs(audio_data) <= 1e-10, 0, audio_data))
+    crossings = np.zeros((n_rows, width), dtype=np.int32)
+    np.cumsum(signs[:, 1:] != signs[:, :-1], axis=-1, out=crossings[:, 1:])
+    starts = np.arange(frame_counts.max()) * hop_length - n_fft // 2
+    last = np.minimum(starts + n_fft - 1, lengths[:, None] - 1)
+    first = np.clip(starts, 0, lengths[:, None] - 1)
+    zero_crossing_rate = masked_mean((np.take_along_axis(crossings, last, axis=-1)
+                                      - np.take_along_axis(crossings, first, axis=-1)) / n_fft)
+    
+    # Centered STFT frames up to a row's own last frame only ever see that row's samples and zeros
+    magnitude = np.abs(librosa.stft(audio_data, n_fft=n_fft, hop_length=hop_length))
+    spectral_centroid = masked_mean(librosa.feature.spectral_centroid(S=magnitude, sr=sample_rate)[:, 0])
+    spectral_rolloff = masked_mean(librosa.feature.spectral_rolloff(S=magnitude, sr=sample_rate)[:, 0])
+    
+    rhythm = _rhythm([row[:length] for row, length in zip(audio_data, lengths)], sample_rate)
+    heart_rate = rhythm[:, 0]
+    
+    features = {
+        'rms_energy': rms_energy,
+        'zero_crossing_rate': zero_crossing_rate,
+        'spectral_centroid_mean': spectral_centroid,
+        'spectral_rolloff_mean': spectral_rolloff,
+        'estimated_heart_rate': np.where(np.isfinite(heart_rate), heart_rate, 70),
+        'hrv_sdnn_ms': rhythm[:, 1],
+        'hrv_rmssd_ms': rhythm[:, 2]
+    }
+    
+    for band in bands:
+        features[f'{band}_freq_energy'] = np.empty(n_rows)
+    for length in np.unique(lengths):
+        indices = np.flatnonzero(lengths == length)
+        context = SpectralContext(audio_data[indices, :length], sample_rate, n_fft, hop_length, bands)
+        for band in bands:
+            features[f'{band}_freq_energy'][indices] = context.band_energy(band)
+    
+    return features
+
+def _rhythm(rows, sample_rate: int) -> np.ndarray:
+    """(heart rate, SDNN, RMSSD) per recording from S1/S2 segmentation, NaN where unknown"""
+    rhythm = np.empty((len(rows), 3))
+    for i, row in enumerate(rows):
+        segmentation = segment_heart_sounds(row, sample_rate)
+        rhythm[i] = segmentation['heart_rate'], segmentation['sdnn_ms'], segmentation['rmssd_ms']
+    return rhythm
@@ -0,0 +1,193 @@
+import io
+import base64
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from typing import Optional, Tuple
+
+# Matplotlib's "magma" sampled at 17 evenly spaced points; interpolated into
+# a lookup table once at import so rendering never touches pyplot.
+_MAGMA_ANCHORS = np.array([
+    (0, 0, 4),
+    (10, 8, 34),
+    (29, 17, 71),
+    (54, 16, 107),
+    (81, 18, 124),
+    (106, 28, 129),
+    (131, 38, 129),
+    (156, 46, 127),
+    (183, 55, 121),
+    (208, 65, 111),
+    (231, 82, 99),
+    (245, 107, 92),
+    (252, 137, 97),
+    (254, 167, 114),
+    (254, 196, 136),
+    (253, 226, 163),
+    (252, 253, 191)
+], dtype=np.float64)
+
+def _build_lut(anchors: np.ndarray, size: int) -> np.ndarray:
+    """Linearly interpolate anchor colours into a (size, 3) uint8 table"""
+    positions = np.linspace(0, 1, len(anchors))
+    levels = np.linspace(0, 1, size)
+    return np.stack(
+        [np.interp(levels, positions, anchors[:, channel]) for channel in range(3)], axis=1
+    ).round().astype(np.uint8)
+
+# The whole image is drawn as one 8-bit palette image: the colormap takes the
+# first 254 entries and the last two are reserved for the background and
+# annotations. Palette PNGs encode ~3x faster than RGB and are smaller.
+COLOR_LEVELS = 254
+BACKGROUND = 254
+INK = 255
+
+MAGMA_LUT = _build_lut(_MAGMA_ANCHORS, COLOR_LEVELS)
+MAGMA_LUT.setflags(write=False)
+_MAGMA_PALETTE = MAGMA_LUT.flatten().tolist() + [255, 255, 255, 0, 0, 0]
+
+# Grayscale ramp from black (quiet) to white (loud)
+GRAY_LUT = _build_lut(np.array([(0, 0, 0), (255, 255, 255)], dtype=np.float64), COLOR_LEVELS)
+GRAY_LUT.setflags(write=False)
+_GRAY_PALETTE = GRAY_LUT.flatten().tolist() + [255, 255, 255, 0, 0, 0]
+
+# Margins (pixels) reserved for the title, axes labels and colorbar
+_TITLE_HEIGHT = 28
+_LEFT_MARGIN = 64
+_BOTTOM_MARGIN = 44
+_COLORBAR_MARGIN = 72
+
+_FONT = ImageFont.load_default()
+
+class SpectrogramRenderer:
+    """Render dB spectrograms straight to PNG/WebP/JPEG bytes with NumPy and Pillow.
+
+    The dB matrix is quantized to 8 bits and mapped through a precomputed
+    colormap lookup table (magma, or a gray ramp with grayscale=True); axes
+    and a colorbar are drawn with ImageDraw. Grayscale JPEG/WebP output is
+    encoded as a single channel.
+    Instances hold only immutable settings, so one renderer can be shared
+    by concurrent Streamlit sessions.
+    """
+
+    def __init__(self,
+                 width: int = 1200,
+                 height: int = 800,
+                 max_frequency: Optional[float] = None,
+                 min_db: float = -80.0,
+                 image_format: str = "PNG",
+                 quality: int = 85,
+                 grayscale: bool = False,
+                 show_axes: bool = True,
+                 show_colorbar: bool = True,
+                 title: str = "PCG Spectrogram"):
+        self.width = width
+        self.height = height
+        self.max_frequency = max_frequency
+        self.min_db = min_db
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.grayscale = grayscale
+        self.show_axes = show_axes
+        self.show_colorbar = show_colorbar
+        self.title = title
+
+    @property
+    def mime_type(self) -> str:
+        """MIME type of the encoded image"""
+        return "image/jpeg" if self.image_format in ("JPEG", "JPG") else f"image/{self.image_format.lower()}"
+
+    def render(self, spectrogram_db: np.ndarray, sample_rate: int, hop_length: int) -> bytes:
+        """Encode a (frequency bins, frames) dB matrix referenced to 0 dB as image bytes"""
+        n_bins, n_frames = spectrogram_db.shape
+        nyquist = sample_rate / 2
+        max_frequency = min(self.max_frequency or nyquist, nyquist)
+
+        # Frequency crop: keep bins up to max_frequency, lowest frequency at the bottom
+        top_bin = min(n_bins, int(np.floor(max_frequency / nyquist * (n_bins - 1))) + 1)
+        levels = np.clip((spectrogram_db[:top_bin] - self.min_db) * ((COLOR_LEVELS - 1) / -self.min_db), 0, COLOR_LEVELS - 1)
+        indices = np.ascontiguousarray(levels[::-1].astype(np.uint8))
+
+        plot_box = self._plot_box()
+        plot_size = (plot_box[2] - plot_box[0], plot_box[3] - plot_box[1])
+        plot = Image.fromarray(indices).resize(plot_size, Image.BILINEAR)
+
+        if self.show_axes or self.show_colorbar:
+            canvas = Image.new("L", (self.width, self.height), BACKGROUND)
+            canvas.paste(plot, plot_box[:2])
+        else:
+            canvas = plot
+        canvas.putpalette(_GRAY_PALETTE if self.grayscale else _MAGMA_PALETTE)
+        draw = ImageDraw.Draw(canvas)
+
+        if self.show_axes:
+            duration = (n_frames - 1) * hop_length / sample_rate if n_frames > 1 else 0.0
+            self._draw_axes(draw, plot_box, duration, max_frequency)
+        if self.show_colorbar:
+            self._draw_colorbar(canvas, draw, plot_box)
+
+        return self._encode(canvas)
+
+    def render_base64(self, spectrogram_db: np.ndarray, sample_rate: int, hop_length: int) -> str:
+        """Render and base64-encode, ready for an inline image payload"""
+        return base64.b64encode(self.render(spectrogram_db, sample_rate, hop_length)).decode()
+
+    def _plot_box(self) -> Tuple[int, int, int, int]:
+        """(left, top, right, bottom) of the spectrogram area on the canvas"""
+        left = _LEFT_MARGIN if self.show_axes else 0
+        top = _TITLE_HEIGHT if self.show_axes else 0
+        right = self.width - (_COLORBAR_MARGIN if self.show_colorbar else 0)
+        bottom = self.height - (_BOTTOM_MARGIN if self.show_axes else 0)
+        return left, top, max(right, left + 1), max(bottom, top + 1)
+
+    def _draw_axes(self, draw: ImageDraw.ImageDraw, box: Tuple[int, int, int, int], duration: float, max_frequency: float):
+        """Title, frame, time and frequency ticks"""
+        left, top, right, bottom = box
+        draw.rectangle(box, outline=INK)
+        draw.text(((left + right) // 2, top // 2), self.title, fill=INK, font=_FONT, anchor="mm")
+
+        for value in _nice_ticks(duration):
+            x = left + (right - left) * (value / duration if duration else 0)
+            draw.line([(x, bottom), (x, bottom + 5)], fill=INK)
+            draw.text((x, bottom + 8), f"{value:g}", fill=INK, font=_FONT, anchor="mt")
+        draw.text(((left + right) // 2, self.height - 6), "Time (s)", fill=INK, font=_FONT, anchor="mb")
+
+        for value in _nice_ticks(max_frequency):
+            y = bottom - (bottom - top) * (value / max_frequency)
+            draw.line([(left - 5, y), (left, y)], fill=INK)
+            draw.text((left - 8, y), f"{value:g}", fill=INK, font=_FONT, anchor="rm")
+        draw.text((4, top - 4), "Hz", fill=INK, font=_FONT, anchor="lb")
+
+    def _draw_colorbar(self, canvas: Image.Image, draw: ImageDraw.ImageDraw, box: Tuple[int, int, int, int]):
+        """Vertical colour scale from min_db to 0 dB with labels"""
+        _, top, right, bottom = box
+        bar_left = right + 12
+        bar_width = 16
+        ramp = np.linspace(COLOR_LEVELS - 1, 0, bottom - top).round().astype(np.uint8)
+        canvas.paste(Image.fromarray(np.repeat(ramp[:, None], bar_width, axis=1)), (bar_left, top))
+        draw.rectangle((bar_left, top, bar_left + bar_width, bottom), outline=INK)
+
+        for value in _nice_ticks(-self.min_db):
+            y = top + (bottom - top) * (value / -self.min_db)
+            draw.text((bar_left + bar_width + 4, y), f"{0.0 - value:+.0f} dB", fill=INK, font=_FONT, anchor="lm")
+
+    def _encode(self, image: Image.Image) -> bytes:
+        """Encode with the configured format"""
+        buf = io.BytesIO()
+        mode = "L" if self.grayscale else "RGB"
+        if self.image_format in ("JPEG", "JPG"):
+            image.convert(mode).save(buf, format="JPEG", quality=self.quality)
+        elif self.image_format == "WEBP":
+            # method=2: ~2x faster than the default effort for ~3% more bytes
+            image.convert(mode).save(buf, format="WEBP", quality=self.quality, method=2)
+        else:
+            image.save(buf, format=self.image_format, compress_level=1)
+        return buf.getvalue()
+
+def _nice_ticks(span: float, target: int = 6) -> np.ndarray:
+    """Round tick positions covering [0, span]"""
+    if span <= 0:
+        return np.array([0.0])
+    raw_step = span / target
+    magnitude = 10 ** np.floor(np.log10(raw_step))
+    step = magnitude * min((1, 2, 2.5, 5, 10), key=lambda m: abs(m * magnitude - raw_step))
+    return np.arange(0, span + step * 1e-9, step)
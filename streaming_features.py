@@ -0,0 +1,274 @@
+import numpy as np
+import librosa
+import soundfile as sf
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from audio_io import to_float32
+from config import FREQUENCY_BANDS
+from heart_sound_segmentation import segment_heart_sounds
+from signal_processing import stft_size
+
+# RR intervals are binned at 1 ms over 0.2-3 s (300-20 BPM) for the running median
+RR_HISTOGRAM_EDGES = np.arange(200, 3001) / 1000
+
+class StreamingPCGFeatureExtractor:
+    """Bounded-memory PCG feature extraction over audio delivered in blocks.
+
+    Produces the same feature dict as GeminiPCGAnalyzer.extract_pcg_features
+    while holding only about one block plus one analysis window of samples,
+    so recordings far longer than MAX_DURATION (Holter-style captures) can be
+    processed. RMS, zero-crossing rate and spectral centroid/rolloff use the
+    same centered frames as librosa and match the in-memory values. Band
+    energies are band powers (see SpectralContext.band_energy) estimated
+    with Welch's method over Hann-windowed segments of about one second,
+    and heart rate/HRV come from S1/S2 segmentation of consecutive
+    segment_window-second windows, so both are estimates rather than exact
+    matches. Blocks are normalized like the ingest boundary (to_float32),
+    so integer PCM blocks are scaled to [-1, 1]. RR statistics are kept as running
+    sums and a fixed 1 ms histogram (for the median), so memory does not
+    grow with the number of beats.
+    """
+
+    def __init__(self,
+                 sample_rate: int,
+                 n_fft: Optional[int] = None,
+                 hop_length: Optional[int] = None,
+                 welch_segment: Optional[int] = None,
+                 segment_window: float = 30.0,
+                 bands: Dict[str, Tuple[float, float]] = FREQUENCY_BANDS):
+        self.sample_rate = sample_rate
+        default_n_fft, default_hop = stft_size(sample_rate)
+        self.n_fft = n_fft or default_n_fft
+        self.hop_length = hop_length or default_hop
+        self.welch_segment = welch_segment or stft_size(sample_rate, window_seconds=1.0)[0]
+        self.bands = bands
+
+        self._pad = self.n_fft // 2
+        self._welch_window = np.hanning(self.welch_segment + 1)[:-1]
+        self._welch_freqs = np.fft.rfftfreq(self.welch_segment, 1 / sample_rate)
+
+        # Raw samples not yet consumed, starting at absolute index _buffer_start
+        self._buffer = np.zeros(0, dtype=np.float64)
+        self._buffer_start = 0
+        self._first_sample = None
+
+        # Running sums
+        self._samples = 0
+        self._sum_squares = 0.0
+        self._next_frame = 0
+        self._frames = 0
+        self._zcr_sum = 0.0
+        self._centroid_sum = 0.0
+        self._rolloff_sum = 0.0
+        self._next_segment = 0
+        self._segments = 0
+        self._power_sum = np.zeros(len(self._welch_freqs))
+
+        # Heart-sound segmentation windows and running RR statistics
+        self._segment_samples = int(segment_window * sample_rate)
+        self._rhythm_blocks = []
+        self._rhythm_buffered = 0
+        self._rr_count = 0
+        self._rr_mean = 0.0
+        self._rr_m2 = 0.0
+        self._rr_histogram = np.zeros(len(RR_HISTOGRAM_EDGES) - 1, dtype=np.int64)
+        self._successive_count = 0
+        self._successive_sum_squares = 0.0
+
+    def update(self, block: np.ndarray):
+        """Feed the next block of mono samples"""
+        block = to_float32(np.asarray(block).ravel()).astype(np.float64)
+        if block.size == 0:
+            return
+        if self._first_sample is None:
+            self._first_sample = block[0]
+
+        self._samples += block.size
+        self._sum_squares += float(np.dot(block, block))
+        self._buffer = np.concatenate([self._buffer, block])
+
+        self._consume(final=False)
+        self._consume_rhythm(block, final=False)
+
+    def finalize(self) -> Dict:
+        """Flush the trailing frames and return the feature dict"""
+        if self._samples == 0:
+            raise ValueError("No audio samples were provided")
+
+        self._consume(final=True)
+        self._consume_rhythm(np.zeros(0), final=True)
+
+        features = {
+            'duration': self._samples / self.sample_rate,
+            'rms_energy': float(np.sqrt(self._sum_squares / self._samples)),
+            'zero_crossing_rate': float(self._zcr_sum / self._frames),
+            'spectral_centroid_mean': float(self._centroid_sum / self._frames),
+            'spectral_rolloff_mean': float(self._rolloff_sum / self._frames)
+        }
+        features['raw_rms'] = features['rms_energy']
+
+        if self._segments:
+            # Welch band power: a Hann-windowed segment of M samples has
+            # E|Y_k|^2 = PSD_k * sum(w^2), so 2 / (M * sum(w^2)) * sum_band |Y_k|^2
+            # estimates the same 2 |X|^2 / N^2 band sum as the full-length FFT
+            freqs = self._welch_freqs
+            power = self._power_sum / self._segments * (2 / (self.welch_segment * np.sum(self._welch_window ** 2)))
+        else:
+            # Shorter than one Welch segment: the whole signal is still buffered
+            freqs = np.fft.rfftfreq(self._samples, 1 / self.sample_rate)
+            power = 2 * np.abs(np.fft.rfft(self._buffer)) ** 2 / self._samples ** 2
+
+        # Heart rate and variability over the RR intervals of every window
+        if self._rr_count >= 2:
+            features['estimated_heart_rate'] = float(60 / self._rr_median())
+            features['hrv_sdnn_ms'] = float(np.sqrt(self._rr_m2 / self._rr_count) * 1000)
+        else:
+            features['estimated_heart_rate'] = 70.0  # same default as compute_pcg_features
+            features['hrv_sdnn_ms'] = float('nan')
+        if self._successive_count:
+            features['hrv_rmssd_ms'] = float(np.sqrt(self._successive_sum_squares / self._successive_count) * 1000)
+        else:
+            features['hrv_rmssd_ms'] = float('nan')
+
+        for band, (low, high) in self.bands.items():
+            in_band = (freqs >= low) & (freqs <= high)
+            features[f'{band}_freq_energy'] = float(np.sum(power[in_band]))
+
+        features['sample_rate'] = self.sample_rate
+        features['signal_length'] = self._samples
+
+        return features
+
+    def _consume(self, final: bool):
+        """Process every complete STFT frame and Welch segment in the buffer"""
+        buffer_end = self._buffer_start + self._buffer.size
+
+        # Centered frames: frame k spans raw samples [k*hop - pad, k*hop - pad + n_fft)
+        if final:
+            last_frame = self._samples // self.hop_length
+        else:
+            last_frame = (buffer_end + self._pad - self.n_fft) // self.hop_length
+        if last_frame >= self._next_frame:
+            start = self._next_frame * self.hop_length - self._pad
+            stop = last_frame * self.hop_length - self._pad + self.n_fft
+            self._accumulate_frames(
+                self._segment(start, stop, edge=True, final=final),
+                self._segment(start, stop, edge=False, final=final)
+            )
+            self._next_frame = last_frame + 1
+
+        # Welch segments with 75% overlap (Hann squared sums to a constant), fully inside the signal
+        step = self.welch_segment // 4
+        last_segment = (buffer_end - self.welch_segment) // step
+        if last_segment >= self._next_segment:
+            start = self._next_segment * step - self._buffer_start
+            segments = librosa.util.frame(
+                self._buffer[start:start + (last_segment - self._next_segment) * step + self.welch_segment],
+                frame_length=self.welch_segment,
+                hop_length=step,
+                axis=0
+            )
+            spectra = np.fft.rfft(segments * self._welch_window, axis=-1)
+            self._power_sum += np.sum(spectra.real ** 2 + spectra.imag ** 2, axis=0)
+            self._segments += segments.shape[0]
+            self._next_segment = last_segment + 1
+
+        # Drop samples no pending frame or segment still needs
+        keep_from = min(self._next_frame * self.hop_length - self._pad, self._next_segment * step)
+        drop = max(0, keep_from - self._buffer_start)
+        if drop:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start += drop
+
+    def _consume_rhythm(self, block: np.ndarray, final: bool):
+        """Segment every complete window (and the remainder at the end) for RR intervals"""
+        if block.size:
+            self._rhythm_blocks.append(block)
+            self._rhythm_buffered += block.size
+        if self._rhythm_buffered < self._segment_samples and not (final and self._rhythm_buffered):
+            return
+
+        pending = np.concatenate(self._rhythm_blocks)
+        stop = pending.size if final else pending.size - pending.size % self._segment_samples
+        for start in range(0, stop, self._segment_samples):
+            window = pending[start:start + self._segment_samples]
+            rr = segment_heart_sounds(window, self.sample_rate)['beat_features'][:, 0]
+            self._add_rr_intervals(rr)
+
+        self._rhythm_blocks = [pending[stop:]] if stop < pending.size else []
+        self._rhythm_buffered = pending.size - stop
+
+    def _add_rr_intervals(self, rr: np.ndarray):
+        """Merge one window's RR intervals (s) into the running statistics"""
+        if rr.size == 0:
+            return
+        # Combine mean and sum of squared deviations (Chan et al.) for SDNN
+        count = self._rr_count + rr.size
+        delta = float(np.mean(rr)) - self._rr_mean
+        self._rr_m2 += float(np.sum((rr - np.mean(rr)) ** 2)) + delta ** 2 * self._rr_count * rr.size / count
+        self._rr_mean += delta * rr.size / count
+        self._rr_count = count
+
+        bins = np.searchsorted(RR_HISTOGRAM_EDGES, rr, side='right') - 1
+        np.add.at(self._rr_histogram, np.clip(bins, 0, len(self._rr_histogram) - 1), 1)
+
+        successive = np.diff(rr)
+        self._successive_count += successive.size
+        self._successive_sum_squares += float(np.dot(successive, successive))
+
+    def _rr_median(self) -> float:
+        """Median RR interval (s) to the histogram resolution"""
+        index = int(np.searchsorted(np.cumsum(self._rr_histogram), self._rr_count / 2))
+        return float(RR_HISTOGRAM_EDGES[index] + RR_HISTOGRAM_EDGES[index + 1]) / 2
+
+    def _segment(self, start: int, stop: int, edge: bool, final: bool) -> np.ndarray:
+        """Raw samples [start, stop) with centered-frame padding outside the signal.
+
+        edge=True repeats the first/last sample (librosa zero_crossing_rate),
+        edge=False pads with zeros (librosa stft).
+        """
+        left = max(0, -start)
+        right = max(0, stop - self._samples) if final else 0
+        body = self._buffer[max(start, 0) - self._buffer_start:min(stop, self._samples) - self._buffer_start]
+        if not left and not right:
+            return body
+        head = self._first_sample if edge else 0.0
+        tail = self._buffer[-1] if edge else 0.0
+        return np.concatenate([np.full(left, head), body, np.full(right, tail)])
+
+    def _accumulate_frames(self, edge_padded: np.ndarray, zero_padded: np.ndarray):
+        """Add per-frame ZCR, spectral centroid and rolloff to the running sums"""
+        zcr = librosa.feature.zero_crossing_rate(
+            edge_padded, frame_length=self.n_fft, hop_length=self.hop_length, center=False
+        )
+        magnitude = np.abs(librosa.stft(
+            zero_padded, n_fft=self.n_fft, hop_length=self.hop_length, center=False
+        ))
+        centroids = librosa.feature.spectral_centroid(S=magnitude, sr=self.sample_rate)
+        rolloff = librosa.feature.spectral_rolloff(S=magnitude, sr=self.sample_rate)
+
+        self._frames += zcr.shape[-1]
+        self._zcr_sum += float(np.sum(zcr))
+        self._centroid_sum += float(np.sum(centroids))
+        self._rolloff_sum += float(np.sum(rolloff))
+
+def iter_audio_file_blocks(path: str, block_size: int = 65536, channel: int = 0) -> Iterable[np.ndarray]:
+    """Yield float32 blocks of one channel of an audio file without loading it whole"""
+    for block in sf.blocks(path, blocksize=block_size, dtype='float32', always_2d=True):
+        yield block[:, channel]
+
+def extract_features_streaming(source: Union[str, Iterable[np.ndarray]],
+                               sample_rate: Optional[int] = None,
+                               block_size: int = 65536) -> Dict:
+    """Extract PCG features from a file path or an iterable of sample blocks"""
+    if isinstance(source, str):
+        if sample_rate is None:
+            sample_rate = sf.info(source).samplerate
+        source = iter_audio_file_blocks(source, block_size)
+    elif sample_rate is None:
+        raise ValueError("sample_rate is required when streaming from a generator")
+
+    extractor = StreamingPCGFeatureExtractor(sample_rate)
+    for block in source:
+        extractor.update(block)
+    return extractor.finalize()
@@ -1,27 +1,16 @@
 import streamlit as st
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-import scipy.io.wavfile as wav
-import soundfile as sf
-from scipy.signal import butter, lfilter
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-from streamlit_webrtc import webrtc_streamer, AudioProcessorBase, WebRtcMode
 from streamlit_option_menu import option_menu
-import av
-import io
-import uuid
-import plotly.graph_objects as go
-import plotly.express as px
 
-# Import our custom modules
+# Import our custom modules; heavy dependencies (plotly, webrtc, Gemini,
+# Supabase, reportlab, lottie) are imported by the pages that use them
 from config import *
-from database import db
-from ai_analyzer import ai_analyzer
-from pdf_generator import pdf_generator
+from database import get_db
+from metrics import metrics
 from whatsapp_integration import whatsapp
-from animations import animations
 
 # Page configuration
 st.set_page_config(
@@ -44,8 +33,36 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(REPORTS_FOLDER, exist_ok=True)
 os.makedirs(TEMP_FOLDER, exist_ok=True)
 
+@st.cache_resource
+def get_worker_pool():
+    """Worker processes for the CPU-bound analysis stages, created once per server and warmed up in the background"""
+    from worker_pool import AnalysisWorkerPool
+
+    pool = AnalysisWorkerPool(ANALYSIS_WORKERS, SPECTROGRAM_PROFILE, ANALYSIS_MODE)
+    pool.warmup()
+    return pool
+
+def get_analyzer():
+    """The shared AI analyzer, built on first use and attached to the worker pool"""
+    from ai_analyzer import get_ai_analyzer
+
+    analyzer = get_ai_analyzer()
+    if ANALYSIS_WORKERS > 0 and analyzer.worker_pool is None:
+        analyzer.worker_pool = get_worker_pool()
+    return analyzer
+
+if ANALYSIS_WORKERS > 0:
+    get_worker_pool()  # spawn workers now; warmup runs in the background
+
+if WARMUP_ENABLED:
+    from warmup import start_warmup
+    start_warmup(pipeline=ANALYSIS_WORKERS == 0)  # once per server process; the pool warms its own workers
+
 def main():
     """Main application function"""
+    from animations import get_animations
+    
+    animations = get_animations()
     
     # Apply gradient background and animations
     animations.create_gradient_background()
@@ -184,7 +201,9 @@ def show_home_page():
 
 def show_patient_info_page():
     """Display patient information form"""
+    from animations import get_animations
     
+    animations = get_animations()
     animations.create_patient_form_animation()
     
     st.markdown("""
@@ -246,7 +265,7 @@ def show_patient_info_page():
                     }
                     
                     # Save to database
-                    patient_id = db.save_patient(patient_data)
+                    patient_id = get_db().save_patient(patient_data)
                     if patient_id:
                         st.session_state['current_patient'] = patient_data
                         st.session_state['current_patient']['id'] = patient_id
@@ -274,6 +293,16 @@ def show_patient_info_page():
 
 def show_diagnosis_page():
     """Display diagnosis page with PCG analysis"""
+    import scipy.io.wavfile as wav
+    import plotly.graph_objects as go
+    import av
+    from streamlit_webrtc import webrtc_streamer, AudioProcessorBase, WebRtcMode
+    from pdf_generator import get_pdf_generator
+    from animations import get_animations
+    
+    ai_analyzer = get_analyzer()
+    pdf_generator = get_pdf_generator()
+    animations = get_animations()
     
     st.markdown("### 🔍 PCG Analysis & Diagnosis")
     
@@ -294,6 +323,17 @@ def show_diagnosis_page():
     </div>
     """, unsafe_allow_html=True)
     
+    analysis_mode = st.radio(
+        "Analysis mode",
+        ["Single valve", "All four sites"],
+        horizontal=True,
+        key="analysis_mode"
+    )
+    
+    if analysis_mode == "All four sites":
+        show_all_sites_analysis(patient)
+        return
+    
     # Valve site selection with animation
     selected_valve = animations.create_valve_selector_animation(VALVE_SITES)
     
@@ -308,7 +348,8 @@ def show_diagnosis_page():
         # Audio upload/recording section
         tab1, tab2 = st.tabs(["📁 Upload Audio", "🎙️ Record Audio"])
         
-        audio_file = None
+        audio_file = None  # stored copy, referenced by the saved case
+        audio_source = None  # what is played and analyzed: the in-memory upload or the stored path
         
         with tab1:
             uploaded_file = st.file_uploader(
@@ -318,11 +359,12 @@ def show_diagnosis_page():
             )
             
             if uploaded_file:
-                # Save uploaded file
+                # Save uploaded file for case history; analysis decodes the upload from memory
                 file_path = os.path.join(UPLOAD_FOLDER, f"{patient['name']}_{selected_valve}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav")
                 with open(file_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
                 audio_file = file_path
+                audio_source = uploaded_file
                 st.success("✅ Audio file uploaded successfully!")
         
         with tab2:
@@ -354,6 +396,7 @@ def show_diagnosis_page():
                         file_path = os.path.join(UPLOAD_FOLDER, f"{patient['name']}_{selected_valve}_recorded_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav")
                         wav.write(file_path, rate=48000, data=raw_audio)
                         audio_file = file_path
+                        audio_source = file_path
                         st.success("✅ Recording saved successfully!")
                     else:
                         st.warning("No audio captured. Please try recording again.")
@@ -363,16 +406,14 @@ def show_diagnosis_page():
             st.markdown("### 🎵 Audio Analysis")
             
             # Display audio player
-            st.audio(audio_file, format="audio/wav")
+            st.audio(audio_source, format="audio/wav")
             
             # Show audio visualizer animation
             animations.create_audio_visualizer_animation()
             
             # Load and process audio
             try:
-                sample_rate, audio_data = wav.read(audio_file)
-                if audio_data.ndim > 1:
-                    audio_data = audio_data[:, 0]  # Take first channel
+                audio_data, sample_rate, quality = load_pcg_audio(audio_source)
                 
                 # Display waveform
                 fig = go.Figure()
@@ -393,23 +434,43 @@ def show_diagnosis_page():
                 )
                 st.plotly_chart(fig, use_container_width=True)
                 
+                # Pre-flight quality check (on the raw samples); rejected recordings never reach feature extraction or Gemini
+                if quality:
+                    show_quality_report(quality)
+                
                 # AI Analysis button
-                if st.button(f"🤖 Analyze with Gemini AI", type="primary", key=f"analyze_{selected_valve}"):
+                if quality and quality['decision'] == 'reject':
+                    st.info("🎙️ Please upload or record this site again.")
+                elif st.button(f"🤖 Analyze with Gemini AI", type="primary", key=f"analyze_{selected_valve}"):
                     
                     # Show loading animation
                     with st.container():
-                        animations.show_loading_analysis("Gemini AI is analyzing PCG signal...")
-                        
-                        # Perform AI analysis
-                        diagnosis = ai_analyzer.analyze_pcg_signal(
-                            audio_data=audio_data,
-                            sample_rate=sample_rate,
-                            valve_site=selected_valve,
-                            patient_info=patient
-                        )
-                        
-                        # Clear loading animation
-                        st.empty()
+                        if GEMINI_STREAMING:
+                            # Fields appear as soon as they can be parsed from the partial reply
+                            live_result = st.empty()
+                            diagnosis = ai_analyzer.analyze_pcg_signal_streaming(
+                                audio_data=audio_data,
+                                sample_rate=sample_rate,
+                                valve_site=selected_valve,
+                                patient_info=patient,
+                                on_update=lambda partial: show_partial_diagnosis(live_result, partial),
+                                quality=quality
+                            )
+                            live_result.empty()
+                        else:
+                            animations.show_loading_analysis("Gemini AI is analyzing PCG signal...")
+                            
+                            # Perform AI analysis
+                            diagnosis = ai_analyzer.analyze_pcg_signal(
+                                audio_data=audio_data,
+                                sample_rate=sample_rate,
+                                valve_site=selected_valve,
+                                patient_info=patient,
+                                quality=quality
+                            )
+                            
+                            # Clear loading animation
+                            st.empty()
                         
                         # Show success animation
                         animations.show_success_message("AI Analysis Complete!")
@@ -431,7 +492,7 @@ def show_diagnosis_page():
                             'recommendations': diagnosis.get('recommendations', [])
                         }
                         
-                        db.save_case(case_data)
+                        get_db().save_case(case_data)
                         
                         # Additional findings
                         if diagnosis.get('findings'):
@@ -481,21 +542,223 @@ def show_diagnosis_page():
             except Exception as e:
                 st.error(f"Error processing audio: {str(e)}")
 
+def load_pcg_audio(audio_source):
+    """Read a WAV upload or stored file as float32 (first channel) and decimate to the diagnostic rate.
+    
+    Returns (signal, sample rate, quality report or None). The quality gate
+    runs on the raw samples: resampling smooths away clipped plateaus. The
+    report is kept in session state per recording, so reruns reuse it and
+    the quality.* metrics count each recording once.
+    """
+    from audio_io import read_wav
+    from quality_gate import assess_quality
+    from signal_processing import decimate_to_analysis_rate
+    
+    audio_data, sample_rate = read_wav(audio_source)
+    quality = None
+    if QUALITY_GATE['enabled']:
+        reports = st.session_state.setdefault('quality_reports', {})
+        key = recording_key(audio_source)
+        if key not in reports:
+            reports[key] = assess_quality(audio_data, sample_rate)
+        quality = reports[key]
+    
+    # Decimate once to the diagnostic rate; plots and analysis use the reduced signal
+    audio_data, sample_rate = decimate_to_analysis_rate(audio_data, sample_rate)
+    return audio_data, sample_rate, quality
+
+def recording_key(audio_source):
+    """Identity of an upload (Streamlit file id) or stored recording (path)"""
+    if isinstance(audio_source, str):
+        return audio_source
+    return getattr(audio_source, 'file_id', None) or (audio_source.name, audio_source.size)
+
+def show_quality_report(quality):
+    """Signal-quality score and the reasons behind a flag or rejection"""
+    score = f"Signal quality {quality['score']:.0%} · SNR {quality['snr_db']:.1f} dB · {quality['duration_s']:.1f} s"
+    if quality['decision'] == 'pass':
+        st.success(f"✅ {score}")
+        return
+    reasons = "\n".join(f"- {reason}" for reason in quality['reasons'])
+    if quality['decision'] == 'reject':
+        st.error(f"❌ Recording rejected ({score})\n{reasons}")
+    else:
+        st.warning(f"⚠️ Re-recording recommended ({score})\n{reasons}")
+
+def show_audio_preview(audio_path, key):
+    """Player for the first AUDIO_PREVIEW_SECONDS of a stored recording, full length on request"""
+    from audio_io import wav_duration, wav_preview
+    
+    duration = wav_duration(audio_path)
+    if duration <= AUDIO_PREVIEW_SECONDS or st.checkbox(f"Play full recording ({duration:.0f} s)", key=key):
+        st.audio(audio_path, format="audio/wav")
+    else:
+        st.audio(wav_preview(audio_path), format="audio/wav")
+        st.caption(f"Preview: first {AUDIO_PREVIEW_SECONDS} s of {duration:.0f} s")
+
+def show_partial_diagnosis(placeholder, partial):
+    """Render the diagnosis fields received so far while the reply streams in"""
+    with placeholder.container():
+        st.markdown("#### 🤖 Gemini AI is analyzing PCG signal...")
+        
+        if 'primary_diagnosis' in partial:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Diagnosis", partial['primary_diagnosis'])
+            col2.metric("Severity", partial.get('severity', '…'))
+            col3.metric("Confidence", f"{partial['confidence_level']}%" if 'confidence_level' in partial else '…')
+        
+        for finding in partial.get('findings', []):
+            st.markdown(f"• {finding}")
+        
+        if 'primary_diagnosis' not in partial and partial.get('partial_text'):
+            st.caption(partial['partial_text'][-500:])
+
+def show_all_sites_analysis(patient):
+    """Upload all four valve recordings and analyze them in one concurrent job"""
+    from pdf_generator import get_pdf_generator
+    from animations import get_animations
+    
+    ai_analyzer = get_analyzer()
+    pdf_generator = get_pdf_generator()
+    animations = get_animations()
+    
+    st.markdown("""
+    <div class="diagnosis-result">
+        <h4>🫀 Full Auscultation Exam</h4>
+        <p>Upload a PCG recording for each valve site; all sites are analyzed together</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    audio_files = {}
+    audio_sources = {}
+    upload_cols = st.columns(2)
+    for i, (valve_code, valve_name) in enumerate(VALVE_SITES.items()):
+        with upload_cols[i % 2]:
+            uploaded_file = st.file_uploader(
+                f"{valve_name}",
+                type=['wav'],
+                key=f"exam_upload_{valve_code}"
+            )
+            if uploaded_file:
+                file_path = os.path.join(UPLOAD_FOLDER, f"{patient['name']}_{valve_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav")
+                with open(file_path, "wb") as f:
+                    f.write(uploaded_file.getbuffer())
+                audio_files[valve_code] = file_path
+                audio_sources[valve_code] = uploaded_file
+    
+    missing = [valve_code for valve_code in VALVE_SITES if valve_code not in audio_files]
+    if missing:
+        st.info(f"Waiting for recordings: {', '.join(missing)}")
+    
+    if st.button("🤖 Analyze All Sites", type="primary", disabled=bool(missing), key="analyze_all_sites"):
+        try:
+            loaded = {valve_code: load_pcg_audio(source) for valve_code, source in audio_sources.items()}
+            recordings = {valve_code: (audio_data, sample_rate) for valve_code, (audio_data, sample_rate, _) in loaded.items()}
+            qualities = {valve_code: quality for valve_code, (_, _, quality) in loaded.items()}
+            
+            with st.container():
+                animations.show_loading_analysis("Gemini AI is analyzing all valve sites...")
+                diagnoses = ai_analyzer.analyze_all_sites(recordings, patient, qualities)
+                st.empty()
+            
+            for valve_code, diagnosis in diagnoses.items():
+                st.session_state['current_diagnosis'][valve_code] = diagnosis
+                get_db().save_case({
+                    'patient_id': patient['id'],
+                    'valve_site': valve_code,
+                    'audio_filename': os.path.basename(audio_files[valve_code]),
+                    'diagnosis': diagnosis,
+                    'confidence_level': diagnosis.get('confidence_level'),
+                    'severity': diagnosis.get('severity'),
+                    'recommendations': diagnosis.get('recommendations', [])
+                })
+            
+            st.session_state['exam_diagnoses'] = {'patient_id': patient['id'], 'diagnoses': diagnoses}
+            animations.show_success_message("All Valve Sites Analyzed!")
+        
+        except Exception as e:
+            st.error(f"Error processing audio: {str(e)}")
+    
+    exam = st.session_state.get('exam_diagnoses')
+    if not exam or exam['patient_id'] != patient['id']:
+        return
+    diagnoses = exam['diagnoses']
+    
+    for valve_code, diagnosis in diagnoses.items():
+        with st.expander(f"{VALVE_SITES.get(valve_code, valve_code)}: {diagnosis.get('primary_diagnosis', 'N/A')}", expanded=False):
+            animations.create_diagnosis_animation(diagnosis)
+    
+    if st.button("📄 Generate Multi-Valve Report", key="pdf_all_sites"):
+        report_path = os.path.join(REPORTS_FOLDER, f"{patient['name']}_all_sites_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+        pdf_generator.create_multi_valve_report(patient, list(diagnoses.values()), report_path)
+        
+        with open(report_path, "rb") as pdf_file:
+            st.download_button(
+                label="⬇️ Download PDF",
+                data=pdf_file,
+                file_name=os.path.basename(report_path),
+                mime="application/pdf"
+            )
+
 def show_case_history_page():
     """Display case history with saved diagnoses"""
+    from pdf_generator import get_pdf_generator
+    
+    pdf_generator = get_pdf_generator()
     
     st.markdown("### 📚 Case History")
     
-    # Get case history
-    cases = db.get_case_history()
+    # Filters are applied by the database; only one page of matching cases is loaded
+    filter_col1, filter_col2, filter_col3, filter_col4, filter_col5 = st.columns(5)
+    with filter_col1:
+        # The search runs in the database, so any patient can be found however large the registry is
+        patient_search = st.text_input("Find Patient", placeholder="Name or ID", key="history_patient_search")
+        matches = get_db().get_all_patients(limit=HISTORY_PATIENT_CHOICES, search=patient_search.strip() or None)
+        patients = {f"{p.get('name', 'Unknown')} ({str(p['id'])[:8]})": p['id'] for p in matches}
+        patient_label = st.selectbox("Patient", ["All"] + list(patients), key="history_patient")
+        if len(matches) == HISTORY_PATIENT_CHOICES:
+            st.caption(f"Showing the {HISTORY_PATIENT_CHOICES} newest matches; refine the search to narrow them")
+    with filter_col2:
+        valve_site = st.selectbox("Valve Site", ["All"] + list(VALVE_SITES), key="history_valve")
+    with filter_col3:
+        date_range = st.date_input("Date Range", value=(), key="history_dates")
+    with filter_col4:
+        order = st.radio("Sort", ["Newest first", "Oldest first"], key="history_order")
+    with filter_col5:
+        page_size = st.selectbox("Per Page", HISTORY_PAGE_SIZES, key="history_page_size")
+    
+    since = date_range[0] if len(date_range) > 0 else None
+    until = date_range[1] + timedelta(days=1) if len(date_range) > 1 else None  # include the end day
+    filters = {
+        'patient_id': patients.get(patient_label),
+        'valve_site': None if valve_site == "All" else valve_site,
+        'since': since,
+        'until': until,
+        'newest_first': order == "Newest first"
+    }
+    
+    # Cursors of the pages visited so far (keyset pagination); reset when the query changes
+    query = repr((filters, page_size))
+    if st.session_state.get('history_query') != query:
+        st.session_state['history_query'] = query
+        st.session_state['history_cursors'] = [None]
+    cursors = st.session_state['history_cursors']
+    
+    # Get one page of case history
+    cases, next_cursor = get_db().get_case_page(page_size, cursors[-1], **filters)
     
     if not cases:
         st.info("📭 No case history found. Start by diagnosing some patients!")
         return
     
+    # No total: counting every match on each rerun is linear in the archive size
+    offset = (len(cursors) - 1) * page_size
+    st.caption(f"Showing cases {offset + 1}–{offset + len(cases)}")
+    
     # Display cases
-    for i, case in enumerate(cases):
+    for i, case in enumerate(cases, start=offset):
         patient_info = case.get('patient', {})
+        case_key = case.get('id', i)  # stable widget keys across pages
         
         with st.expander(f"📋 Case #{i+1}: {patient_info.get('name', 'Unknown')} - {case.get('valve_site', 'Unknown')} ({case.get('created_at', 'Unknown date')})"):
             
@@ -523,17 +786,17 @@ def show_case_history_page():
                 st.write(f"Confidence: {diagnosis.get('confidence_level', 'N/A')}%")
                 st.write(f"Severity: {diagnosis.get('severity', 'N/A')}")
             
-            # Show audio if available
+            # Show a short preview if the recording is available (read from disk only on request)
             audio_path = os.path.join(UPLOAD_FOLDER, case.get('audio_filename', ''))
-            if os.path.exists(audio_path):
-                st.audio(audio_path, format="audio/wav")
+            if os.path.isfile(audio_path):
+                show_audio_preview(audio_path, key=f"preview_case_{case_key}")
             
             # Action buttons for each case
             case_col1, case_col2, case_col3 = st.columns(3)
             
             with case_col1:
-                if st.button(f"📄 Generate Report", key=f"pdf_case_{i}"):
-                    report_path = os.path.join(REPORTS_FOLDER, f"case_{i}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+                if st.button(f"📄 Generate Report", key=f"pdf_case_{case_key}"):
+                    report_path = os.path.join(REPORTS_FOLDER, f"case_{case_key}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
                     pdf_generator.generate_report(patient_info, diagnosis, report_path)
                     
                     with open(report_path, "rb") as pdf_file:
@@ -542,12 +805,12 @@ def show_case_history_page():
                             data=pdf_file,
                             file_name=os.path.basename(report_path),
                             mime="application/pdf",
-                            key=f"download_case_{i}"
+                            key=f"download_case_{case_key}"
                         )
             
             with case_col2:
-                if patient_info.get('phone') and st.button(f"📱 Share WhatsApp", key=f"wa_case_{i}"):
-                    report_path = os.path.join(REPORTS_FOLDER, f"case_{i}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+                if patient_info.get('phone') and st.button(f"📱 Share WhatsApp", key=f"wa_case_{case_key}"):
+                    report_path = os.path.join(REPORTS_FOLDER, f"case_{case_key}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
                     pdf_generator.generate_report(patient_info, diagnosis, report_path)
                     
                     whatsapp_result = whatsapp.share_report_via_whatsapp(
@@ -559,11 +822,25 @@ def show_case_history_page():
                     st.success(f"📱 {whatsapp_result}")
             
             with case_col3:
-                if st.button(f"🔄 Re-analyze", key=f"reanalyze_case_{i}"):
+                if st.button(f"🔄 Re-analyze", key=f"reanalyze_case_{case_key}"):
                     st.info("Feature coming soon!")
+    
+    # Page navigation: next continues after the last case shown, previous returns to the saved cursor
+    nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+    with nav_col1:
+        if st.button("⬅️ Previous", key="history_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with nav_col2:
+        st.markdown(f"<div style='text-align: center;'>Page {len(cursors)}</div>", unsafe_allow_html=True)
+    with nav_col3:
+        if st.button("Next ➡️", key="history_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
 
 def show_settings_page():
     """Display settings and configuration"""
+    ai_analyzer = get_analyzer()
     
     st.markdown("### ⚙️ Settings & Configuration")
     
@@ -588,8 +865,8 @@ def show_settings_page():
         col1, col2 = st.columns(2)
         
         with col1:
-            st.metric("Total Patients", len(db.get_all_patients()))
-            st.metric("Total Cases", len(db.get_case_history()))
+            st.metric("Total Patients", get_db().count_patients())
+            st.metric("Total Cases", get_db().count_cases())
         
         with col2:
             st.metric("AI Model", "Gemini 2.5 Pro" if GOOGLE_API_KEY else "Simulation Mode")
@@ -607,6 +884,49 @@ def show_settings_page():
         
         for service, status in status_checks:
             st.write(f"**{service}:** {status}")
+        
+        if ai_analyzer.cache:
+            st.markdown("#### ⚡ Analysis Cache")
+            cache_stats = ai_analyzer.cache.stats()
+            cache_col1, cache_col2, cache_col3 = st.columns(3)
+            cache_col1.metric("Cache Hits", cache_stats['memory_hits'] + cache_stats['disk_hits'])
+            cache_col2.metric("Cache Misses", cache_stats['misses'])
+            cache_col3.metric("Cached Results", cache_stats['memory_entries'])
+        
+        if ai_analyzer.client:
+            st.markdown("#### 🔌 Gemini Backend")
+            backend_col1, backend_col2, backend_col3 = st.columns(3)
+            backend_col1.metric("Circuit", ai_analyzer.client.breaker.state.replace('_', ' ').title())
+            backend_col2.metric("Fallbacks", metrics.counter('analysis.fallbacks'))
+            backend_col3.metric("Hedged Requests", metrics.counter('gemini.hedged_requests'))
+        
+        if ai_analyzer.triage_classifier:
+            st.markdown("#### 🩺 Local Triage")
+            triage_col1, triage_col2 = st.columns(2)
+            triage_col1.metric("Answered Locally", metrics.counter('triage.local'))
+            triage_col2.metric("Sent to Gemini", metrics.counter('triage.escalated'))
+        
+        if QUALITY_GATE['enabled']:
+            st.markdown("#### 🎚️ Signal Quality Gate")
+            quality_col1, quality_col2, quality_col3 = st.columns(3)
+            quality_col1.metric("Passed", metrics.counter('quality.pass'))
+            quality_col2.metric("Flagged", metrics.counter('quality.flag'))
+            quality_col3.metric("Rejected", metrics.counter('quality.reject'))
+        
+        if WARMUP_ENABLED:
+            from warmup import warmup_report
+            
+            st.markdown("#### 🔥 Startup Warmup")
+            warmup_col1, warmup_col2, warmup_col3 = st.columns(3)
+            if warmup_report:
+                warmup_col1.metric("Warmup", f"{warmup_report['total_s']:.1f} s")
+                if warmup_report.get('connection_s') is not None:
+                    warmup_col2.metric("Gemini Connect", f"{warmup_report['connection_s'] * 1000:.0f} ms")
+            else:
+                warmup_col1.metric("Warmup", "Running")
+            latency = metrics.percentile(f'analysis.latency_s.{ai_analyzer.spectrogram_profile}', 50)
+            if latency is not None:
+                warmup_col3.metric("Median Analysis", f"{latency:.2f} s")
     
     with tab3:
         st.markdown("""
@@ -0,0 +1,172 @@
+import re
+import json
+from typing import Dict, List
+
+from config import VALVE_SITES, VALVE_DISEASES
+
+NORMAL_CODE = 'Normal'
+SEVERITY_LEVELS = ('None', 'Mild', 'Moderate', 'Severe')
+DIAGNOSIS_CODES = (NORMAL_CODE,) + tuple(VALVE_DISEASES)
+
+STRUCTURED_OUTPUT_INSTRUCTIONS = """
+Respond with a single JSON object that follows the response schema and nothing else:
+- diagnosis_code: one of {codes}
+- confidence_level: integer 0-100
+- severity: one of {severities} (None when normal)
+- findings: short strings (heart sounds, murmurs, signal quality)
+- recommendations: short clinical recommendations
+- follow_up: one follow-up suggestion
+"""
+
+REPORT_INSTRUCTIONS = "- report: a concise prose medical report (at most 200 words)\n"
+
+class StructuredResponseError(ValueError):
+    """The reply is not a JSON object matching the diagnosis schema"""
+
+def diagnosis_response_schema(include_report: bool = False) -> Dict:
+    """OpenAPI-style schema passed as generation_config.response_schema"""
+    properties = {
+        'diagnosis_code': {'type': 'string', 'enum': list(DIAGNOSIS_CODES)},
+        'confidence_level': {'type': 'integer'},
+        'severity': {'type': 'string', 'enum': list(SEVERITY_LEVELS)},
+        'findings': {'type': 'array', 'items': {'type': 'string'}},
+        'recommendations': {'type': 'array', 'items': {'type': 'string'}},
+        'follow_up': {'type': 'string'}
+    }
+    required = list(properties)
+    if include_report:
+        properties['report'] = {'type': 'string'}
+    return {'type': 'object', 'properties': properties, 'required': required}
+
+def structured_output_instructions(include_report: bool = False) -> str:
+    """Prompt suffix describing the JSON reply"""
+    instructions = STRUCTURED_OUTPUT_INSTRUCTIONS.format(
+        codes=', '.join(DIAGNOSIS_CODES), severities=', '.join(SEVERITY_LEVELS)
+    )
+    return instructions + (REPORT_INSTRUCTIONS if include_report else '')
+
+def parse_structured_diagnosis(response_text: str, valve_site: str) -> Dict:
+    """Validate a JSON reply against the schema and map it onto the diagnosis dict.
+
+    Raises StructuredResponseError when the text is not JSON or a field is
+    missing or out of range, so the caller can fall back to the prose parser.
+    """
+    try:
+        reply = json.loads(_strip_code_fence(response_text))
+    except ValueError as e:
+        raise StructuredResponseError(f"Reply is not valid JSON: {e}") from e
+    if not isinstance(reply, dict):
+        raise StructuredResponseError("Reply is not a JSON object")
+
+    code = _field(reply, 'diagnosis_code', str)
+    if code not in DIAGNOSIS_CODES:
+        raise StructuredResponseError(f"Unknown diagnosis_code '{code}'")
+
+    confidence = _field(reply, 'confidence_level', (int, float))
+    if isinstance(confidence, bool) or not 0 <= confidence <= 100:
+        raise StructuredResponseError(f"confidence_level out of range: {confidence}")
+
+    severity = _field(reply, 'severity', str).strip().title()
+    if severity not in SEVERITY_LEVELS:
+        raise StructuredResponseError(f"Unknown severity '{severity}'")
+
+    diagnosis = {
+        'valve_site': valve_site,
+        'valve_name': VALVE_SITES.get(valve_site, valve_site),
+        'primary_diagnosis': VALVE_DISEASES.get(code, NORMAL_CODE),
+        'confidence_level': int(round(confidence)),
+        'severity': severity,
+        'findings': _string_list(reply, 'findings'),
+        'recommendations': _string_list(reply, 'recommendations'),
+        'follow_up': _field(reply, 'follow_up', str),
+        'structured_output': True
+    }
+    if code != NORMAL_CODE:
+        diagnosis['diagnosis_code'] = code
+    if isinstance(reply.get('report'), str) and reply['report'].strip():
+        diagnosis['report'] = reply['report'].strip()
+
+    return diagnosis
+
+_JSON_STRING = r'"((?:[^"\\]|\\.)*)"'
+_PARTIAL_STRING_FIELD = r'"{name}"\s*:\s*' + _JSON_STRING
+_PARTIAL_NUMBER_FIELD = r'"{name}"\s*:\s*(-?\d+(?:\.\d+)?)\s*[,}}\s]'
+_PARTIAL_ARRAY_FIELD = r'"{name}"\s*:\s*\['
+# One closed string item; matching whole string literals keeps a "]" inside an item from ending the array
+_PARTIAL_ARRAY_ITEM = re.compile(r'\s*,?\s*' + _JSON_STRING)
+
+def parse_partial_diagnosis(partial_text: str) -> Dict:
+    """Fields already complete in a streamed, possibly truncated JSON reply.
+
+    Scans for finished string/number values and closed array items only, so
+    each returned field is final and can be shown immediately; fields that
+    fail validation are left out until the full reply is parsed.
+    """
+    partial = {}
+
+    match = re.search(_PARTIAL_STRING_FIELD.format(name='diagnosis_code'), partial_text)
+    if match and match.group(1) in DIAGNOSIS_CODES:
+        code = match.group(1)
+        partial['primary_diagnosis'] = VALVE_DISEASES.get(code, NORMAL_CODE)
+        if code != NORMAL_CODE:
+            partial['diagnosis_code'] = code
+
+    match = re.search(_PARTIAL_NUMBER_FIELD.format(name='confidence_level'), partial_text)
+    if match and 0 <= float(match.group(1)) <= 100:
+        partial['confidence_level'] = int(round(float(match.group(1))))
+
+    match = re.search(_PARTIAL_STRING_FIELD.format(name='severity'), partial_text)
+    if match and match.group(1).strip().title() in SEVERITY_LEVELS:
+        partial['severity'] = match.group(1).strip().title()
+
+    for name in ('findings', 'recommendations'):
+        match = re.search(_PARTIAL_ARRAY_FIELD.format(name=name), partial_text)
+        if match:
+            items = [_decode_string(item) for item in _partial_string_items(partial_text, match.end())]
+            partial[name] = [item.strip() for item in items if item.strip()]
+
+    match = re.search(_PARTIAL_STRING_FIELD.format(name='follow_up'), partial_text)
+    if match:
+        partial['follow_up'] = _decode_string(match.group(1))
+
+    return partial
+
+def _partial_string_items(text: str, pos: int) -> List[str]:
+    """Raw bodies of the closed string items of an array that starts at pos"""
+    items = []
+    while True:
+        match = _PARTIAL_ARRAY_ITEM.match(text, pos)
+        if not match:
+            return items
+        items.append(match.group(1))
+        pos = match.end()
+
+def _decode_string(raw: str) -> str:
+    """Unescape the body of a JSON string literal"""
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
+
+def _strip_code_fence(text: str) -> str:
+    """Remove a ```json ... ``` wrapper some models add despite the MIME type"""
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        if text.rstrip().endswith('```'):
+            text = text.rstrip()[:-3]
+    return text
+
+def _field(reply: Dict, name: str, expected_type):
+    if name not in reply:
+        raise StructuredResponseError(f"Missing field '{name}'")
+    value = reply[name]
+    if not isinstance(value, expected_type):
+        raise StructuredResponseError(f"Field '{name}' has type {type(value).__name__}")
+    return value
+
+def _string_list(reply: Dict, name: str) -> List[str]:
+    values = _field(reply, name, list)
+    if not all(isinstance(value, str) for value in values):
+        raise StructuredResponseError(f"Field '{name}' must be a list of strings")
+    return [value.strip() for value in values if value.strip()]
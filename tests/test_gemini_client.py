@@ -0,0 +1,33 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_client import AsyncGeminiClient, CircuitBreaker, FakeGenerativeModel, FakeServiceUnavailable
+
+def test_cancelled_half_open_trial_releases_its_slot():
+    breaker = CircuitBreaker(name='test', window=1, min_calls=1, open_seconds=0.1, half_open_calls=1)
+    model = FakeGenerativeModel(response_text="Normal heart sounds.", latency=0.5, faults=[FakeServiceUnavailable()])
+    client = AsyncGeminiClient(model, max_retries=0, requests_per_minute=None, breaker=breaker, hedge=False)
+
+    try:
+        client.generate(["fail"])
+    except FakeServiceUnavailable:
+        pass
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.15)
+    chunks = client.stream(["trial"])
+    next(chunks)  # the half-open trial is now in flight
+    chunks.close()  # what a Streamlit rerun does: the pending call is cancelled
+
+    deadline = time.monotonic() + 2
+    while breaker._trials_in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert breaker._trials_in_flight == 0
+    assert breaker.allow_request()
+    breaker.release_trial()
+
+    assert client.generate(["recover"]).text == "Normal heart sounds."
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_analyzer import GeminiPCGAnalyzer
+from streaming_features import extract_features_streaming
+
+SAMPLE_RATE = 4000
+
+def synthetic_pcg(seconds: float, seed: int = 0) -> np.ndarray:
+    """S1/S2 bursts at ~75 bpm with beat-to-beat jitter over a low noise floor"""
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * SAMPLE_RATE))
+    t = np.arange(int(0.2 * SAMPLE_RATE)) / SAMPLE_RATE
+    beat = 0.3
+    while beat < seconds - 0.5:
+        for delay, freq, amplitude, decay in ((0.0, 60, 1.0, 0.03), (0.3, 90, 0.6, 0.02)):
+            start = int((beat + delay) * SAMPLE_RATE)
+            audio[start:start + t.size] += amplitude * np.exp(-t / decay) * np.sin(2 * np.pi * freq * t)
+        beat += rng.normal(0.8, 0.04)
+    return (0.8 * audio + 0.01 * rng.standard_normal(audio.size)).astype(np.float32)
+
+def blocks(audio: np.ndarray, size: int = 5000):
+    return (audio[i:i + size] for i in range(0, audio.size, size))
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return GeminiPCGAnalyzer(model=None)
+
+def test_streaming_matches_in_memory_features(analyzer):
+    audio = synthetic_pcg(40)
+    expected = analyzer.extract_pcg_features(audio, SAMPLE_RATE)
+    streamed = extract_features_streaming(blocks(audio), SAMPLE_RATE)
+
+    for name in ('rms_energy', 'zero_crossing_rate', 'spectral_centroid_mean', 'spectral_rolloff_mean'):
+        assert streamed[name] == pytest.approx(expected[name], rel=1e-5)
+    for band in ('low', 'mid', 'high'):
+        assert streamed[f'{band}_freq_energy'] == pytest.approx(expected[f'{band}_freq_energy'], rel=0.05)
+    assert streamed['estimated_heart_rate'] == pytest.approx(expected['estimated_heart_rate'], rel=0.02)
+
+def test_integer_blocks_are_scaled_like_the_ingest_boundary(analyzer):
+    audio = synthetic_pcg(10)
+    pcm = np.round(audio * 2 ** 15).astype(np.int16)
+    from_float = extract_features_streaming(blocks(pcm.astype(np.float32) / 2 ** 15), SAMPLE_RATE)
+    from_pcm = extract_features_streaming(blocks(pcm), SAMPLE_RATE)
+
+    for name in ('rms_energy', 'low_freq_energy', 'spectral_centroid_mean'):
+        assert from_pcm[name] == pytest.approx(from_float[name], rel=1e-6)
@@ -0,0 +1,263 @@
+import os
+import sys
+import csv
+import time
+import argparse
+import numpy as np
+import librosa
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import TRIAGE_MODEL_PATH, PREPROCESSING
+from metrics import metrics
+from heart_sound_segmentation import beat_summary, segment_heart_sounds
+from signal_processing import SpectralContext, compute_pcg_features, decimate_to_analysis_rate, preprocess_pcg
+
+N_MFCC = 13
+N_MELS = 40
+
+def triage_features(context: SpectralContext, features: Optional[Dict] = None) -> Dict[str, float]:
+    """Feature vector for the triage classifier, from a recording's spectral context.
+
+    Uses the signal/spectral features of compute_pcg_features (band energies
+    as fractions of the total, so they do not scale with length), MFCC
+    means/standard deviations, onset-envelope statistics and beat-level
+    rhythm statistics from S1/S2 segmentation (unavailable values are 0).
+    """
+    if features is None:
+        features = {name: float(value) for name, value in compute_pcg_features(context).items()}
+
+    vector = {
+        'rms_energy_log': float(np.log10(features['rms_energy'] + 1e-12)),
+        'zero_crossing_rate': features['zero_crossing_rate'],
+        'spectral_centroid_mean': features['spectral_centroid_mean'],
+        'spectral_rolloff_mean': features['spectral_rolloff_mean']
+    }
+
+    band_energies = {band: features[f'{band}_freq_energy'] for band in context.bands}
+    total_energy = sum(band_energies.values()) or 1.0
+    for band, energy in band_energies.items():
+        vector[f'{band}_energy_fraction'] = energy / total_energy
+
+    # MFCCs from the shared STFT (power mel spectrogram)
+    mel = librosa.feature.melspectrogram(S=context.stft_magnitude ** 2, sr=context.sample_rate, n_mels=N_MELS)
+    mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=N_MFCC)
+    for i in range(N_MFCC):
+        vector[f'mfcc_{i}_mean'] = float(np.mean(mfcc[i]))
+        vector[f'mfcc_{i}_std'] = float(np.std(mfcc[i]))
+
+    # Beat statistics from the onset-strength envelope
+    onset_envelope = librosa.onset.onset_strength(S=librosa.amplitude_to_db(context.stft_magnitude),
+                                                  sr=context.sample_rate, hop_length=context.hop_length)
+    frame_rate = context.sample_rate / context.hop_length
+    onset_frames = librosa.util.peak_pick(onset_envelope, pre_max=3, post_max=3, pre_avg=3, post_avg=5,
+                                          delta=float(0.5 * np.std(onset_envelope)), wait=2)
+    intervals = np.diff(onset_frames) / frame_rate
+    vector['onset_strength_mean'] = float(np.mean(onset_envelope))
+    vector['onset_strength_std'] = float(np.std(onset_envelope))
+    vector['onset_rate'] = len(onset_frames) * frame_rate / max(len(onset_envelope), 1)
+    vector['onset_interval_cv'] = float(np.std(intervals) / np.mean(intervals)) if len(intervals) > 1 else 0.0
+
+    # Rhythm and per-beat systolic/diastolic statistics
+    for name, value in beat_summary(segment_heart_sounds(context.audio_data, context.sample_rate)).items():
+        vector[f'beat_{name}'] = float(np.nan_to_num(value))
+
+    return vector
+
+class TriageClassifier:
+    """Calibrated logistic-regression screen for abnormal PCG recordings.
+
+    A standardized linear model over triage_features with Platt scaling on
+    held-out data, stored as a small .npz file (weights, scaling, feature
+    names). predict_proba returns the calibrated probability that the
+    recording is abnormal; inference is a dot product on top of features
+    that the analysis pipeline already computes.
+    """
+
+    def __init__(self,
+                 feature_names: Sequence[str],
+                 weights: np.ndarray,
+                 bias: float,
+                 mean: np.ndarray,
+                 scale: np.ndarray,
+                 platt_a: float = 1.0,
+                 platt_b: float = 0.0):
+        self.feature_names = list(feature_names)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.platt_a = float(platt_a)
+        self.platt_b = float(platt_b)
+
+    @classmethod
+    def load(cls, path: str = TRIAGE_MODEL_PATH) -> 'TriageClassifier':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                feature_names=[str(name) for name in data['feature_names']],
+                weights=data['weights'],
+                bias=float(data['bias']),
+                mean=data['mean'],
+                scale=data['scale'],
+                platt_a=float(data['platt_a']),
+                platt_b=float(data['platt_b'])
+            )
+
+    def save(self, path: str = TRIAGE_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, feature_names=np.array(self.feature_names), weights=self.weights, bias=self.bias,
+                 mean=self.mean, scale=self.scale, platt_a=self.platt_a, platt_b=self.platt_b)
+
+    @classmethod
+    def fit(cls,
+            vectors: List[Dict[str, float]],
+            labels: Sequence[int],
+            l2: float = 1.0,
+            calibration_fraction: float = 0.25,
+            seed: int = 0) -> 'TriageClassifier':
+        """Train on feature dicts with labels 1 = abnormal, 0 = normal"""
+        feature_names = sorted(vectors[0])
+        X = np.array([[vector[name] for name in feature_names] for vector in vectors], dtype=np.float64)
+        y = np.asarray(labels, dtype=np.float64)
+
+        # Stratified split: the linear model on one part, Platt scaling on the rest
+        rng = np.random.default_rng(seed)
+        calibration = np.zeros(len(y), dtype=bool)
+        for label in (0, 1):
+            indices = rng.permutation(np.flatnonzero(y == label))
+            calibration[indices[:int(round(len(indices) * calibration_fraction))]] = True
+        if calibration.all() or not calibration.any():
+            calibration[:] = False
+
+        train = ~calibration
+        mean = X[train].mean(axis=0)
+        scale = X[train].std(axis=0)
+        scale[scale == 0] = 1.0
+        Z = (X - mean) / scale
+
+        weights, bias = _fit_logistic(Z[train], y[train], l2)
+        if calibration.any():
+            logits = Z[calibration] @ weights + bias
+            (platt_a,), platt_b = _fit_logistic(logits[:, None], y[calibration], 1e-3)
+        else:
+            platt_a, platt_b = 1.0, 0.0
+
+        return cls(feature_names, weights, bias, mean, scale, platt_a, platt_b)
+
+    def predict_proba(self, vector: Dict[str, float]) -> float:
+        """Calibrated probability that the recording is abnormal"""
+        try:
+            x = np.array([vector[name] for name in self.feature_names], dtype=np.float64)
+        except KeyError as e:
+            raise ValueError(f"Triage model expects feature {e} that was not computed") from e
+        logit = float(((x - self.mean) / self.scale) @ self.weights + self.bias)
+        return float(_sigmoid(self.platt_a * logit + self.platt_b))
+
+    def predict_context(self, context: SpectralContext, features: Optional[Dict] = None) -> float:
+        """Features plus prediction for one recording, timed in metrics"""
+        started = time.perf_counter()
+        probability = self.predict_proba(triage_features(context, features))
+        metrics.observe('triage.latency_s', time.perf_counter() - started)
+        metrics.observe('triage.probability', probability)
+        return probability
+
+def load_triage_classifier(path: str = TRIAGE_MODEL_PATH) -> Optional[TriageClassifier]:
+    """Load the model file, or None (with a warning) when it is missing or unreadable"""
+    try:
+        return TriageClassifier.load(path)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Warning: triage model not available ({e}). All recordings will be sent to Gemini.")
+        return None
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 0.5 * (1 + np.tanh(0.5 * z))
+
+def _fit_logistic(X: np.ndarray, y: np.ndarray, l2: float, iterations: int = 50) -> Tuple[np.ndarray, float]:
+    """L2-regularized logistic regression by Newton's method (IRLS); bias not penalized"""
+    A = np.hstack([X, np.ones((len(X), 1))])
+    penalty = np.full(A.shape[1], l2)
+    penalty[-1] = 0.0
+    theta = np.zeros(A.shape[1])
+
+    for _ in range(iterations):
+        p = _sigmoid(A @ theta)
+        gradient = A.T @ (p - y) + penalty * theta
+        hessian = (A.T * (p * (1 - p))) @ A + np.diag(penalty) + 1e-9 * np.eye(A.shape[1])
+        step = np.linalg.solve(hessian, gradient)
+        theta -= step
+        if np.max(np.abs(step)) < 1e-8:
+            break
+
+    return theta[:-1], float(theta[-1])
+
+def _read_reference(reference: str) -> List[Tuple[str, int]]:
+    """(wav path, label) rows from a CSV of record name or path and label.
+
+    Labels 1/abnormal mean abnormal; 0, -1 and normal mean normal (the
+    PhysioNet/CinC 2016 REFERENCE.csv convention uses -1/1).
+    """
+    base = os.path.dirname(os.path.abspath(reference))
+    rows = []
+    with open(reference, newline='') as f:
+        for record in csv.reader(f):
+            if len(record) < 2 or record[1].strip().lower() in ('label', ''):
+                continue
+            path = record[0].strip()
+            if not path.lower().endswith('.wav'):
+                path += '.wav'
+            if not os.path.isabs(path):
+                path = os.path.join(base, path)
+            label = record[1].strip().lower()
+            rows.append((path, 1 if label in ('1', 'abnormal') else 0))
+    return rows
+
+def _file_vector(path: str) -> Dict[str, float]:
+    import soundfile as sf
+
+    audio_data, sample_rate = sf.read(path, dtype='float32', always_2d=True)
+    audio_data, sample_rate = decimate_to_analysis_rate(audio_data[:, 0], sample_rate)
+    if PREPROCESSING['enabled']:
+        audio_data = preprocess_pcg(audio_data, sample_rate, inplace=True)
+    return triage_features(SpectralContext(audio_data, sample_rate))
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Train or apply the PCG triage classifier")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help="fit a model from labelled WAV files")
+    train.add_argument('reference', help="CSV of record name or path, label (1 abnormal, 0/-1 normal)")
+    train.add_argument('--out', default=TRIAGE_MODEL_PATH)
+    train.add_argument('--l2', type=float, default=1.0)
+
+    predict = commands.add_parser('predict', help="abnormality probability of WAV files")
+    predict.add_argument('files', nargs='+')
+    predict.add_argument('--model', default=TRIAGE_MODEL_PATH)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        rows = _read_reference(args.reference)
+        vectors, labels = [], []
+        for i, (path, label) in enumerate(rows, 1):
+            try:
+                vectors.append(_file_vector(path))
+                labels.append(label)
+            except Exception as e:
+                print(f"Skipping {path}: {e}", file=sys.stderr)
+            if i % 100 == 0:
+                print(f"{i}/{len(rows)} recordings processed", file=sys.stderr)
+
+        classifier = TriageClassifier.fit(vectors, labels, l2=args.l2)
+        classifier.save(args.out)
+
+        y = np.array(labels)
+        p = np.array([classifier.predict_proba(vector) for vector in vectors])
+        accuracy = np.mean((p >= 0.5) == y)
+        print(f"Trained on {len(y)} recordings ({int(y.sum())} abnormal), "
+              f"training accuracy {accuracy:.3f}; saved to {args.out}")
+    else:
+        classifier = TriageClassifier.load(args.model)
+        for path in args.files:
+            print(f"{path}\t{classifier.predict_proba(_file_vector(path)):.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import time
+import threading
+import numpy as np
+from typing import Dict, Optional
+
+from config import (GOOGLE_API_KEY, SAMPLE_RATE, SPECTROGRAM_PROFILE, ANALYSIS_MODE,
+                    WARMUP_SECONDS)
+from metrics import metrics
+
+# Timings of the last completed warmup in this process (empty until it finishes)
+warmup_report: Dict = {}
+
+_started = False
+_lock = threading.Lock()
+
+def synthetic_pcg(seconds: float = WARMUP_SECONDS, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """float32 recording with S1/S2-like bursts at 75 bpm over a low noise floor"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    beat = t % 0.8
+    sounds = (np.exp(-beat / 0.03) * np.sin(2 * np.pi * 60 * t)
+              + 0.6 * np.exp(-np.abs(beat - 0.3) / 0.02) * np.sin(2 * np.pi * 90 * t))
+    noise = 0.01 * np.random.default_rng(0).standard_normal(t.size)
+    return (0.8 * sounds + noise).astype(np.float32)
+
+def warm_pipeline(spectrogram_profile: str = SPECTROGRAM_PROFILE,
+                  analysis_mode: str = ANALYSIS_MODE,
+                  seconds: float = WARMUP_SECONDS) -> float:
+    """Run the CPU stages of an analysis once on a synthetic recording.
+
+    Decimation, filtering, the quality gate, the librosa/numba feature
+    kernels, triage and the spectrogram renderer all run once, so their
+    compilation and first-call setup are not paid by a real request. The
+    analyzer is CPU-only (no Gemini client thread, no result cache) and its
+    metrics are suppressed, so nothing is stored, no remote call is made and
+    the synthetic run does not show up in the app's analysis statistics.
+    """
+    from ai_analyzer import GeminiPCGAnalyzer
+
+    started = time.perf_counter()
+    with metrics.suppressed():
+        analyzer = GeminiPCGAnalyzer(spectrogram_profile=spectrogram_profile, analysis_mode=analysis_mode,
+                                     cpu_only=True)
+        analyzer.prepare_analysis(synthetic_pcg(seconds), SAMPLE_RATE, 'MV')
+    return time.perf_counter() - started
+
+def warm_connection() -> Optional[float]:
+    """Open the shared analyzer's Gemini connection with a count_tokens call (no generation, not billed).
+
+    The analyzer calls generate_content_async on its AsyncGeminiClient's
+    private event loop, and the async transport is bound to the loop that
+    opens it, so the call is submitted to that same loop; later requests
+    reuse the open channel. Returns None when no API key is configured.
+    """
+    if not GOOGLE_API_KEY:
+        return None
+    from ai_analyzer import get_ai_analyzer
+
+    client = get_ai_analyzer().client
+    if client is None:
+        return None
+    started = time.perf_counter()
+    client.count_tokens("warmup")
+    return time.perf_counter() - started
+
+def run_warmup(spectrogram_profile: str = SPECTROGRAM_PROFILE,
+               analysis_mode: str = ANALYSIS_MODE,
+               seconds: float = WARMUP_SECONDS,
+               pipeline: bool = True) -> Dict:
+    """Warm the analysis pipeline and the Gemini connection; returns and records the timings.
+
+    Pass pipeline=False when a worker pool runs the CPU stages: the pool
+    warms its own processes, so warming them here too would only compete
+    with it for the CPU.
+    """
+    started = time.perf_counter()
+    report = {}
+    stages = [('connection_s', warm_connection)]
+    if pipeline:
+        stages.insert(0, ('pipeline_s', lambda: warm_pipeline(spectrogram_profile, analysis_mode, seconds)))
+    for stage, warm in stages:
+        try:
+            report[stage] = warm()
+        except Exception as e:
+            report[stage] = None
+            print(f"Warning: warmup stage {stage[:-2]} failed: {e}")
+        if report[stage] is not None:
+            metrics.observe(f'warmup.{stage}', report[stage])
+    report['total_s'] = time.perf_counter() - started
+    metrics.observe('warmup.total_s', report['total_s'])
+
+    warmup_report.clear()
+    warmup_report.update(report)
+    return report
+
+def start_warmup(spectrogram_profile: str = SPECTROGRAM_PROFILE,
+                 analysis_mode: str = ANALYSIS_MODE,
+                 seconds: float = WARMUP_SECONDS,
+                 pipeline: bool = True) -> Optional[threading.Thread]:
+    """Run run_warmup on a daemon thread, once per process; later calls return None"""
+    global _started
+    with _lock:
+        if _started:
+            return None
+        _started = True
+
+    thread = threading.Thread(target=run_warmup, args=(spectrogram_profile, analysis_mode, seconds, pipeline),
+                              name="warmup", daemon=True)
+    thread.start()
+    return thread
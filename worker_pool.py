@@ -0,0 +1,115 @@
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+from config import ANALYSIS_WORKERS, ANALYSIS_SAMPLE_RATE, SPECTROGRAM_PROFILE, ANALYSIS_MODE
+from metrics import metrics
+
+# Per-process analyzer, created by init_worker
+_worker_analyzer = None
+
+def init_worker(spectrogram_profile: str = SPECTROGRAM_PROFILE, analysis_mode: str = ANALYSIS_MODE):
+    """Process initializer: one CPU-only analyzer per worker (no Gemini client, no result cache)"""
+    global _worker_analyzer
+    from ai_analyzer import GeminiPCGAnalyzer
+
+    _worker_analyzer = GeminiPCGAnalyzer(spectrogram_profile=spectrogram_profile, analysis_mode=analysis_mode,
+                                         cpu_only=True)
+
+def _prepare_inputs_shared(name: str, length: int, sample_rate: int) -> Tuple[Dict, Optional[str]]:
+    """Worker task: features and spectrogram for float32 audio in shared memory"""
+    # Spawned workers share the parent's resource tracker, which already
+    # tracks this block; the parent unlinks it when the task completes
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        audio_data = np.ndarray((length,), dtype=np.float32, buffer=block.buf)
+        audio_data.flags.writeable = False  # shared with the parent; stages must copy before modifying
+        result = _worker_analyzer._prepare_analysis_inputs(audio_data, sample_rate)
+        del audio_data  # the block cannot close while a view exists
+        return result
+    finally:
+        block.close()
+
+def prepare_file(path: str, valve_site: str) -> Dict:
+    """Worker task: read a stored recording and run GeminiPCGAnalyzer.prepare_analysis on it"""
+    from audio_io import read_wav
+
+    audio_data, sample_rate = read_wav(path)
+    return _worker_analyzer.prepare_analysis(audio_data, sample_rate, valve_site)
+
+def _warmup_task(seconds: float) -> float:
+    """Run the CPU stages once on a synthetic beat so imports and first-call setup are paid up front"""
+    started = time.perf_counter()
+    sample_rate = ANALYSIS_SAMPLE_RATE or 4000
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    audio_data = (np.exp(-(t % 0.8) / 0.04) * np.sin(2 * np.pi * 60 * t)).astype(np.float32)
+    _worker_analyzer._prepare_analysis_inputs(audio_data, sample_rate)
+    return time.perf_counter() - started
+
+class AnalysisWorkerPool:
+    """Long-lived process pool for the CPU-bound analysis stages.
+
+    Decimation, preprocessing, features, triage and the spectrogram run in
+    worker processes, so concurrent sessions do not contend for the
+    Streamlit server's GIL. Audio is handed over through a shared-memory
+    block (one copy, no pickling); only the small feature dict and the
+    encoded image come back. Workers are spawned, not forked, so they do
+    not inherit the server's threads or event loops.
+    """
+
+    def __init__(self,
+                 workers: int = ANALYSIS_WORKERS,
+                 spectrogram_profile: str = SPECTROGRAM_PROFILE,
+                 analysis_mode: str = ANALYSIS_MODE):
+        self.workers = max(1, workers)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=init_worker,
+                                             initargs=(spectrogram_profile, analysis_mode))
+
+    def submit_inputs(self, audio_data: np.ndarray, sample_rate: int) -> Future:
+        """Future for GeminiPCGAnalyzer._prepare_analysis_inputs on a worker.
+
+        audio_data should already be float32 (audio_io.to_float32); the
+        shared block is released when the future completes.
+        """
+        audio_data = np.asarray(audio_data, dtype=np.float32)
+        block = shared_memory.SharedMemory(create=True, size=max(audio_data.nbytes, 1))
+        try:
+            np.ndarray(audio_data.shape, dtype=np.float32, buffer=block.buf)[:] = audio_data
+            future = self._executor.submit(_prepare_inputs_shared, block.name, audio_data.size, sample_rate)
+        except Exception:
+            _release(block)
+            raise
+
+        started = time.perf_counter()
+        def done(_: Future):
+            _release(block)
+            metrics.observe('worker_pool.task_s', time.perf_counter() - started)
+        future.add_done_callback(done)
+        return future
+
+    def prepare_inputs(self, audio_data: np.ndarray, sample_rate: int) -> Tuple[Dict, Optional[str]]:
+        """Blocking variant of submit_inputs"""
+        return self.submit_inputs(audio_data, sample_rate).result()
+
+    def warmup(self, seconds: float = 2.0, wait: bool = False):
+        """Start every worker and run one small analysis on each.
+
+        With wait=False this returns immediately and the workers warm up in
+        the background; later jobs queue behind the warmup tasks.
+        """
+        futures = [self._executor.submit(_warmup_task, seconds) for _ in range(self.workers)]
+        if wait:
+            for future in futures:
+                metrics.observe('worker_pool.warmup_s', future.result())
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def _release(block: shared_memory.SharedMemory):
+    block.close()
+    block.unlink()